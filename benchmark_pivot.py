@@ -0,0 +1,83 @@
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from pullDate_FullPeriod import DATA_INDEX, multi_index_pivot, wide_pivot
+from schema import apply_schema
+
+# ---------- Benchmark of wide_pivot against the reference multi_index_pivot (finish_history's pivot step):
+
+
+def synthetic_history(n_days, n_classes=10, n_periods=14, seed=0):
+    """aggregate_history-like frame of one market: one row per (departure, lfi, period, class), a few rows missing.
+
+    Args:
+        n_days (int): Number of departure dates
+        n_classes (int, optional): Fare classes (forecastClass 1..n). Defaults to 10.
+        n_periods (int, optional): Forecast periods per departure. Defaults to 14.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        pd.DataFrame: rows with DATA_INDEX + forecastClass, fracClosure, trafficActual, trafficActualAadv
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2017-09-01", periods=n_days)
+    keys = pd.MultiIndex.from_product(
+        [dates, ["F", "L"], range(1, n_periods + 1), range(1, n_classes + 1)],
+        names=["flightDepartureDate", "localFlowIndicator", "forecastPeriod", "forecastClass"],
+    ).to_frame(index=False)
+    keys = keys[rng.random(len(keys)) > 0.02].reset_index(drop=True)
+
+    df = keys.assign(
+        snapshotDate=pd.Timestamp("2023-01-01"),
+        origin="ORD",
+        destination="DFW",
+        forecastId=1,
+        forecastDepartureDate=keys["flightDepartureDate"],
+        forecastDayOfWeek=keys["flightDepartureDate"].dt.dayofweek + 1,
+        poolCode=np.where(rng.random(len(keys)) > 0.05, "M", "H1"),
+        cabinCode="Y",
+        fracClosure=rng.random(len(keys)),
+        trafficActual=rng.poisson(3, len(keys)).astype(float),
+        trafficActualAadv=rng.poisson(1, len(keys)).astype(float),
+    )
+    # one pool code per departure, as in fcst_history_v
+    df["poolCode"] = df.groupby("flightDepartureDate")["poolCode"].transform("first")
+    return apply_schema(df)
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="wide_pivot vs multi_index_pivot")
+    parser.add_argument("--days", nargs="+", type=int, default=[100, 1000, 2000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    values = ["fracClosure", "trafficActual", "trafficActualAadv"]
+    for n_days in args.days:
+        df = synthetic_history(n_days).set_index(DATA_INDEX)
+        reference_time, reference = best_of(
+            lambda: multi_index_pivot(df, columns="forecastClass", values=values, flatten=True), args.repeat
+        )
+        vectorized_time, vectorized = best_of(
+            lambda: wide_pivot(df, columns="forecastClass", values=values, flatten=True), args.repeat
+        )
+        pd.testing.assert_frame_equal(vectorized, reference)
+        print(
+            f"{len(df):>9} rows -> {len(reference):>7} wide rows: multi_index_pivot {reference_time:.3f}s, "
+            f"wide_pivot {vectorized_time:.3f}s ({reference_time / vectorized_time:.0f}x), identical output"
+        )
+
+
+if __name__ == "__main__":
+    main()
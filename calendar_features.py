@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+
+# ---------- Calendar features (day-of-week / week-of-year one-hots, cyclic encodings), vectorized:
+
+# Cyclic (x, y) encodings of the day of week (1 = monday .. 7 = sunday) and of the ISO week number
+dow_map_x = {1: 1, 2: 0.809, 3: 0.381, 4: 0.037, 5: 0.037, 6: 0.381, 7: 0.809}
+dow_map_y = {1: 0.494, 2: 0.89, 3: 0.987, 4: 0.713, 5: 0.274, 6: 0, 7: 0.098}
+
+wk_map_x = {
+    1: 0.99889441,
+    2: 0.99118029,
+    3: 0.976378386,
+    4: 0.954703312,
+    5: 0.926466233,
+    6: 0.892075869,
+    7: 0.852027483,
+    8: 0.806898384,
+    9: 0.75734042,
+    10: 0.704067472,
+    11: 0.647848951,
+    12: 0.58949479,
+    13: 0.529846938,
+    14: 0.469765855,
+    15: 0.410118003,
+    16: 0.351763842,
+    17: 0.295545321,
+    18: 0.242272373,
+    19: 0.192714409,
+    20: 0.147585311,
+    21: 0.107536925,
+    22: 0.07314656,
+    23: 0.044909482,
+    24: 0.023234407,
+    25: 0.008432503,
+    26: 0.000718384,
+    27: 0.000202608,
+    28: 0.006892681,
+    29: 0.02069255,
+    30: 0.041403109,
+    31: 0.068725199,
+    32: 0.10226511,
+    33: 0.141539082,
+    34: 0.185980313,
+    35: 0.234947962,
+    36: 0.287736151,
+    37: 0.343582473,
+    38: 0.401682498,
+    39: 0.46119828,
+    40: 0.521270358,
+    41: 0.581032771,
+    42: 0.639624059,
+    43: 0.69619827,
+    44: 0.749939968,
+    45: 0.800073739,
+    46: 0.845876698,
+    47: 0.886688492,
+    48: 0.921919805,
+    49: 0.951062367,
+    50: 0.973696454,
+    51: 0.989495891,
+    52: 0.998231556,
+    53: 0.998,
+}
+
+wk_map_y = {
+    1: 0.534132227,
+    2: 0.593716044,
+    3: 0.651945139,
+    4: 0.707980061,
+    5: 0.761012381,
+    6: 0.810276688,
+    7: 0.855063604,
+    8: 0.894726284,
+    9: 0.928692922,
+    10: 0.956473257,
+    11: 0.977667074,
+    12: 0.991968211,
+    13: 0.999170557,
+    14: 0.999170557,
+    15: 0.991968211,
+    16: 0.977667074,
+    17: 0.956473257,
+    18: 0.928692922,
+    19: 0.894726284,
+    20: 0.855063604,
+    21: 0.810276688,
+    22: 0.761012381,
+    23: 0.707980061,
+    24: 0.651945139,
+    25: 0.593716044,
+    26: 0.534132227,
+    27: 0.474053144,
+    28: 0.414345761,
+    29: 0.355871035,
+    30: 0.299472418,
+    31: 0.245963344,
+    32: 0.196115226,
+    33: 0.150647946,
+    34: 0.110216356,
+    35: 0.075404266,
+    36: 0.046713445,
+    37: 0.024557614,
+    38: 0.009256943,
+    39: 0.001031051,
+    40: 0.0,
+    41: 0.006177299,
+    42: 0.0194749,
+    43: 0.0397007,
+    44: 0.066562544,
+    45: 0.099673226,
+    46: 0.138554988,
+    47: 0.182648034,
+    48: 0.231315022,
+    49: 0.283854578,
+    50: 0.339509298,
+    51: 0.397475752,
+    52: 0.456917994,
+    53: 0.457,
+}
+
+DOW_DAY_NAMES = [
+    (1, "monday"),
+    (2, "tuesday"),
+    (3, "wednesday"),
+    (4, "thursday"),
+    (5, "friday"),
+    (6, "saturday"),
+    (7, "sunday"),
+]
+
+
+WEEK_NUMBERS = range(1, 54)
+WEEK_COLUMNS = [f"week_{week}" for week in WEEK_NUMBERS]
+
+
+def _lookup_table(mapping):
+    """ndarray t with t[key] = mapping[key] (NaN elsewhere), for integer keys >= 0."""
+    table = np.full(max(mapping) + 1, np.nan)
+    table[list(mapping)] = list(mapping.values())
+    return table
+
+
+def cyclic_encoding(values, mapping):
+    """Vectorized values.map(mapping) for the integer keyed dow_map_x / wk_map_x style dicts.
+
+    Args:
+        values (pd.Series): Day of week or week number
+        mapping (dict): int -> encoded value
+
+    Returns:
+        pd.Series: float64, NaN where the value is missing or not a key of mapping
+    """
+    table = _lookup_table(mapping)
+    numbers = pd.to_numeric(values).to_numpy(dtype=float, na_value=np.nan)
+    known = np.isfinite(numbers) & (numbers >= 0) & (numbers < len(table)) & (numbers == np.floor(numbers))
+    encoded = np.full(len(numbers), np.nan)
+    encoded[known] = table[numbers[known].astype(np.int64)]
+    return pd.Series(encoded, index=values.index, name=values.name)
+
+
+def one_hot(values, categories, columns, dtype="uint8", sparse=False):
+    """0/1 block with one column per category, built by scattering ones into a zero ndarray.
+
+    Args:
+        values (pd.Series): Values to encode (values outside categories, or missing, get an all-zero row)
+        categories (list): Encoded values, in column order
+        columns (list): Column names, one per category
+        dtype (str, optional): dtype of the block. Defaults to "uint8".
+        sparse (bool, optional): Return pandas sparse columns (fill value 0). Defaults to False.
+
+    Returns:
+        pd.DataFrame: indexed like values
+    """
+    codes = pd.Categorical(values, categories=categories).codes
+    block = np.zeros((len(values), len(categories)), dtype=dtype)
+    rows = np.flatnonzero(codes >= 0)
+    block[rows, codes[rows]] = 1
+    if sparse:
+        return pd.DataFrame(
+            {column: pd.arrays.SparseArray(block[:, i], fill_value=0) for i, column in enumerate(columns)},
+            index=values.index,
+        )
+    return pd.DataFrame(block, index=values.index, columns=columns)
+
+
+def day_of_week_one_hot(dow, dtype="uint8", sparse=False):
+    """monday .. sunday columns, 1 where dow (1 = monday .. 7 = sunday) is that day."""
+    return one_hot(dow, [number for number, _ in DOW_DAY_NAMES], [name for _, name in DOW_DAY_NAMES], dtype, sparse)
+
+
+def week_of_year_one_hot(week_number, dtype="uint8", sparse=False):
+    """week_1 .. week_53 columns, 1 where week_number is that week."""
+    return one_hot(week_number, list(WEEK_NUMBERS), WEEK_COLUMNS, dtype, sparse)
+
+
+def forecast_departure_date(flight_departure_date, forecast_dow):
+    """Latest date on or before the flight departure date that falls on the forecast day of week.
+
+    Equal to the flight departure date when both days of week match; a departure after midnight that is
+    forecast with the previous day (e.g. a monday 00:30 flight of the sunday forecast) moves back to that day.
+
+    Args:
+        flight_departure_date (pd.Series): Departure dates
+        forecast_dow (pd.Series): Forecast day of week (1 = monday .. 7 = sunday)
+
+    Returns:
+        pd.Series: datetime64 forecast departure dates
+    """
+    dates = pd.to_datetime(flight_departure_date)
+    days_back = (dates.dt.dayofweek + 1 - pd.to_numeric(forecast_dow).astype("int64")) % 7
+    return dates - pd.to_timedelta(days_back, unit="D")
+
+
+def add_cyclic_features(df, date_column="forecastDepartureDate", dow_column="forecastDayOfWeek"):
+    """Adds (in place) weekNumber and the week_x/week_y, dow_x/dow_y cyclic encodings.
+
+    Args:
+        df (pd.DataFrame): Frame with a departure date and a day of week column
+        date_column (str, optional): Departure date column. Defaults to "forecastDepartureDate".
+        dow_column (str, optional): Day of week column. Defaults to "forecastDayOfWeek".
+
+    Returns:
+        pd.DataFrame: df
+    """
+    df["weekNumber"] = pd.DatetimeIndex(df[date_column]).isocalendar().week.to_numpy(dtype="int64")
+    df["week_x"] = cyclic_encoding(df["weekNumber"], wk_map_x)
+    df["week_y"] = cyclic_encoding(df["weekNumber"], wk_map_y)
+    df["dow_x"] = cyclic_encoding(df[dow_column], dow_map_x)
+    df["dow_y"] = cyclic_encoding(df[dow_column], dow_map_y)
+    return df
+
+
+def add_one_hot_features(df, dow_column="forecastDayOfWeek", week_column="weekNumber", dtype="uint8", sparse=False):
+    """Adds (in place) the monday .. sunday and week_1 .. week_53 one-hot columns.
+
+    Args:
+        df (pd.DataFrame): Frame with a day of week and a week number column
+        dow_column (str, optional): Day of week column. Defaults to "forecastDayOfWeek".
+        week_column (str, optional): Week number column. Defaults to "weekNumber".
+        dtype (str, optional): dtype of the one-hot columns. Defaults to "uint8".
+        sparse (bool, optional): Store the one-hot columns as pandas sparse columns. Defaults to False.
+
+    Returns:
+        pd.DataFrame: df
+    """
+    blocks = [day_of_week_one_hot(df[dow_column], dtype, sparse), week_of_year_one_hot(df[week_column], dtype, sparse)]
+    for block in blocks:
+        for column in block.columns:
+            df[column] = block[column]
+    return df
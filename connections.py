@@ -0,0 +1,155 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import queries
+
+# ---------- Lazy, pooled database connections (HERCCRT, Mosaic, Azure):
+
+# Cheap statement used to check a connection that has no ping()
+HEALTH_CHECK_QUERIES = {
+    "herccrt": "SELECT 1 FROM DUAL",
+    "mosaic": "SELECT 1",
+    "azure": "SELECT 1",
+}
+
+
+def open_connection(backend):
+    """Opens a new connection through the config package (herccrt().con(), mosaic().con(), azure().con()).
+
+    Args:
+        backend (string): "herccrt", "mosaic" or "azure"
+
+    Returns:
+        Connection: cx_Oracle / pyodbc connection
+    """
+    import config
+
+    if backend not in HEALTH_CHECK_QUERIES:
+        raise ValueError(f"Unknown backend: {backend}")
+    return getattr(config, backend)().con()
+
+
+def is_healthy(backend, con):
+    """Returns True if the connection still answers (ping() when the driver has it, else the health check query)."""
+    try:
+        if hasattr(con, "ping"):
+            con.ping()
+        else:
+            cursor = con.cursor()
+            cursor.execute(HEALTH_CHECK_QUERIES[backend])
+            cursor.fetchall()
+            cursor.close()
+        return True
+    except Exception:
+        return False
+
+
+class ConnectionManager:
+    """Opens each backend on first use and reuses the connection for every market and fcst_id.
+
+    A connection that has not been used for `check_interval` seconds is health-checked before it is handed out
+    and only reopened if that check fails. Concurrent callers check connections out of a small per-backend pool
+    (`pool_size` connections at most) with the `connection()` context manager.
+    """
+
+    def __init__(self, pool_size=4, check_interval=60, opener=open_connection):
+        """
+        Args:
+            pool_size (int, optional): Max open connections per backend for concurrent callers. Defaults to 4.
+            check_interval (int, optional): Seconds of idle time after which a connection is health-checked. Defaults to 60.
+            opener (callable, optional): opener(backend) -> connection. Defaults to open_connection.
+        """
+        self.pool_size = pool_size
+        self.check_interval = check_interval
+        self.opener = opener
+        self._lock = threading.Lock()
+        self._shared = {}  # backend -> (connection, last used)
+        self._idle = {}  # backend -> LifoQueue of (connection, last used)
+        self._opened = {}  # backend -> number of pooled connections opened
+
+    def _checked(self, backend, con, last_used):
+        if con is not None and time.monotonic() - last_used < self.check_interval:
+            return con
+        if con is not None and is_healthy(backend, con):
+            return con
+        if con is not None:
+            queries.forget(con)
+            try:
+                con.close()
+            except Exception:
+                pass
+        return self.opener(backend)
+
+    def get(self, backend):
+        """Returns the shared connection of a backend (opened on first use, reopened only if it went stale).
+
+        Args:
+            backend (string): "herccrt", "mosaic" or "azure"
+
+        Returns:
+            Connection: Open connection
+        """
+        with self._lock:
+            con, last_used = self._shared.get(backend, (None, 0))
+            con = self._checked(backend, con, last_used)
+            self._shared[backend] = (con, time.monotonic())
+            return con
+
+    @contextmanager
+    def connection(self, backend, timeout=None):
+        """Checks a connection out of the backend pool for the duration of the with block.
+
+        Args:
+            backend (string): "herccrt", "mosaic" or "azure"
+            timeout (float, optional): Seconds to wait for a free connection when the pool is full. Defaults to None (wait).
+
+        Yields:
+            Connection: Open connection, returned to the pool afterwards
+        """
+        with self._lock:
+            idle = self._idle.setdefault(backend, queue.LifoQueue())
+            can_open = idle.empty() and self._opened.get(backend, 0) < self.pool_size
+            if can_open:
+                self._opened[backend] = self._opened.get(backend, 0) + 1
+
+        if can_open:
+            con, last_used = None, 0
+        else:
+            con, last_used = idle.get(timeout=timeout)
+        try:
+            con = self._checked(backend, con, last_used)
+        except Exception:
+            with self._lock:
+                self._opened[backend] -= 1
+            raise
+
+        try:
+            yield con
+        finally:
+            idle.put((con, time.monotonic()))
+
+    def close(self):
+        """Closes every open connection."""
+        with self._lock:
+            connections = [con for con, _ in self._shared.values()]
+            for idle in self._idle.values():
+                while not idle.empty():
+                    connections.append(idle.get_nowait()[0])
+            self._shared, self._idle, self._opened = {}, {}, {}
+        for con in connections:
+            queries.forget(con)
+            try:
+                con.close()
+            except Exception:
+                pass
+
+
+# Default manager shared by pullDate_FullPeriod and utility
+manager = ConnectionManager()
+
+
+def get_connection(backend):
+    """Shortcut for manager.get(backend)."""
+    return manager.get(backend)
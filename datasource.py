@@ -0,0 +1,310 @@
+import sqlite3
+from contextlib import contextmanager
+
+import pandas as pd
+
+import queries
+from connections import get_connection
+
+# ---------- Pluggable data source: live databases, or a local SQLite replay of recorded pulls:
+
+# Logical queries of the pipeline. For each one:
+#   table:        SQLite table the recorded rows are stored in
+#   filters:      query parameter -> (column, comparison) used to answer it locally
+#   columns:      result columns (None: every recorded column), the recorder may store extra key columns
+#   order_by:     ORDER BY of the production query
+#   date_columns: result columns the drivers return as dates
+_SEASONALITY_FILTERS = {"orig": ("LEG_ORIG", "="), "dest": ("LEG_DEST", "="), "cabin": ("CABIN_CODE", "=")}
+
+LOGICAL_QUERIES = {
+    "fcst_history": {
+        "table": "fcst_history_v",
+        "filters": {
+            "orig": ("LEG_ORIG", "="),
+            "dest": ("LEG_DEST", "="),
+            "fcst_id": ("FCST_ID", "="),
+            "start": ("FLT_DPTR_DATE", ">="),
+            "end": ("FLT_DPTR_DATE", "<"),
+        },
+        "columns": [
+            "FLT_DPTR_DATE",
+            "FCST_CLS",
+            "CABIN_CODE",
+            "LCL_FLW_IND",
+            "FCST_PERIOD",
+            "FRAC_CLOSURE",
+            "FRAC_CLOSURE_BELOW",
+            "TRAFFIC_CT",
+            "TRAFFIC_CT_AADV",
+            "POOL_CD",
+            "DOW",
+            "FCST_ID",
+            "FLT_ID",
+            "POS_IND",
+            "SNAPSHOT_DATE",
+            "LEG_DEST",
+        ],
+        "order_by": [],
+        "date_columns": [],
+    },
+    # POS / flightId aggregation pushed down to the database (queries.py)
+    "fcst_history_agg": {
+        "table": "fcst_history_agg",
+        "filters": {
+            "orig": ("LEG_ORIG", "="),
+            "dest": ("LEG_DEST", "="),
+            "fcst_id": ("FCST_ID", "="),
+            "start": ("FLT_DPTR_DATE", ">="),
+            "end": ("FLT_DPTR_DATE", "<"),
+        },
+        "columns": [
+            "FLT_DPTR_DATE",
+            "FCST_CLS",
+            "LCL_FLW_IND",
+            "FCST_PERIOD",
+            "FRAC_CLOSURE",
+            "TRAFFIC_SUM",
+            "TRAFFIC_CT_AADV",
+            "POOL_CD",
+            "DOW",
+            "FCST_ID",
+            "LEG_DEST",
+        ],
+        "order_by": [],
+        "date_columns": [],
+    },
+    # per market row counts / departure range of fcst_history_v (market_index.py)
+    "fcst_history_stats": {
+        "table": "fcst_history_stats",
+        "filters": {
+            "orig": ("LEG_ORIG", "="),
+            "dest": ("LEG_DEST", "="),
+            "fcst_id": ("FCST_ID", "="),
+            "start": ("FIRST_DPTR_DATE", ">="),
+            "end": ("LAST_DPTR_DATE", "<"),
+        },
+        "columns": ["LEG_ORIG", "LEG_DEST", "FCST_ID", "N_ROWS", "N_POINTS", "FIRST_DPTR_DATE", "LAST_DPTR_DATE"],
+        "order_by": ["LEG_ORIG", "LEG_DEST", "FCST_ID"],
+        "date_columns": [],
+    },
+    "week_seasonality": {
+        "table": "kronos_week_seasonality",
+        "filters": _SEASONALITY_FILTERS,
+        "columns": None,
+        "order_by": [],
+        "date_columns": [],
+    },
+    "dow_seasonality": {
+        "table": "kronos_dow_seasonality",
+        "filters": _SEASONALITY_FILTERS,
+        "columns": None,
+        "order_by": [],
+        "date_columns": [],
+    },
+    "pool_seasonality": {
+        "table": "kronos_pool_seasonality",
+        "filters": _SEASONALITY_FILTERS,
+        "columns": None,
+        "order_by": [],
+        "date_columns": [],
+    },
+    "oag": {
+        "table": "oag_curr",
+        "filters": {
+            "orig": ("orig", "="),
+            "dest": ("dest", "="),
+            "start": ("dep_date", "date>="),
+            "end": ("dep_date", "date<="),
+        },
+        "columns": None,
+        "order_by": ["orig", "dest", "dep_date", "dep_mam", "snapshot_date"],
+        "date_columns": ["dep_date", "snapshot_date"],
+    },
+    "cap": {
+        "table": "life_of_flight_leg_cabin",
+        "filters": {
+            "orig": ("orig", "="),
+            "dest": ("dest", "="),
+            "cabin": ("cabin", "="),
+            "start": ("dep_date", "date>="),
+            "end": ("dep_date", "date<="),
+        },
+        "columns": None,
+        "order_by": ["orig", "dest", "dep_date", "dep_time", "snapshot_date"],
+        "date_columns": ["dep_date", "snapshot_date"],
+    },
+    "fcst_destinations": {
+        "table": "fcst_id_ref_dest",
+        "filters": {"orig": ("ORIG", "=")},
+        "columns": ["DEST"],
+        "order_by": [],
+        "date_columns": [],
+    },
+    "fcst_ids": {
+        "table": "fcst_id_ref",
+        "filters": {"orig": ("ORIG", "="), "dest": ("DEST", "=")},
+        "columns": ["ORIG", "DEST", "FCST_ID", "TIME_BAND_START", "TIME_BAND_END"],
+        "order_by": ["ORIG", "DEST", "FCST_ID", "TIME_BAND_START"],
+        "date_columns": [],
+    },
+    # market_xref x FCST_PERIOD_REF of one market (get_prdMaps) ...
+    "prd_maps": {
+        "table": "fcst_period_ref",
+        "filters": {
+            "orig": ("ORIGIN", "="),
+            "dest": ("DESTINATION", "="),
+            "cabin": ("CABIN_CODE", "="),
+            "lfi": ("LCL_FLW_IND", "="),
+        },
+        "columns": ["ORIGIN", "DESTINATION", "FORECASTPERIOD", "RRD_START", "RRD_END"],
+        "order_by": ["FORECASTPERIOD"],
+        "date_columns": [],
+    },
+    # ... and of the whole network, with the cabin and local/flow indicator (ReferenceSnapshot)
+    "prd_maps_network": {
+        "table": "fcst_period_ref",
+        "filters": {},
+        "columns": ["ORIGIN", "DESTINATION", "FORECASTPERIOD", "RRD_START", "RRD_END", "CABIN_CODE", "LCL_FLW_IND"],
+        "order_by": ["FORECASTPERIOD"],
+        "date_columns": [],
+    },
+}
+
+
+def _where(name, params):
+    """SQLite WHERE clause + bind values answering a logical query from its recorded table."""
+    clauses, values = [], []
+    for param, value in params.items():
+        if value is None:
+            continue
+        column, comparison = LOGICAL_QUERIES[name]["filters"][param]
+        if comparison.startswith("date"):
+            clauses.append(f'date("{column}") {comparison[4:]} date(?)')
+        else:
+            clauses.append(f'"{column}" {comparison} ?')
+        values.append(value)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", values
+
+
+def _chunks(df, chunksize):
+    return (df.iloc[i : i + chunksize] for i in range(0, max(len(df), 1), chunksize))
+
+
+class LiveSource:
+    """Runs the production statements (queries.STATEMENTS) on HERCCRT / Mosaic (default source)."""
+
+    def read(self, name, params, con=None, chunksize=None):
+        if con is None:
+            con = get_connection(queries.STATEMENTS[name].backend)
+        return queries.execute(name, params, con, chunksize)
+
+
+class LocalSource:
+    """Answers the logical queries from a SQLite file written by Recorder, without VPN or production access."""
+
+    def __init__(self, path):
+        """
+        Args:
+            path (string): SQLite file with the recorded tables
+        """
+        self.path = path
+        self._con = sqlite3.connect(path, check_same_thread=False)
+
+    def read(self, name, params, con=None, chunksize=None):
+        spec = LOGICAL_QUERIES[name]
+        select = ", ".join(f'"{column}"' for column in spec["columns"]) if spec["columns"] else "*"
+        where, values = _where(name, params)
+        order_by = ", ".join([f'"{column}"' for column in spec["order_by"]] + ["rowid"])
+        query = f'SELECT {select} FROM "{spec["table"]}"{where} ORDER BY {order_by}'
+        df = pd.read_sql(query, con=self._con, params=values)
+        for column in spec["date_columns"]:
+            if column in df:
+                df[column] = pd.to_datetime(df[column])
+        if chunksize is not None:
+            return _chunks(df, chunksize)
+        return df
+
+    def close(self):
+        self._con.close()
+
+
+class Recorder:
+    """Runs the queries on a source (live by default) and stores every result in a SQLite file for LocalSource.
+
+    Recording the same logical query twice replaces the previously recorded rows of that query.
+    """
+
+    def __init__(self, path, source=None):
+        """
+        Args:
+            path (string): SQLite file to write
+            source (optional): Source to record from. Defaults to LiveSource().
+        """
+        self.path = path
+        self.source = LiveSource() if source is None else source
+        self._con = sqlite3.connect(path, check_same_thread=False)
+
+    def read(self, name, params, con=None, chunksize=None):
+        df = self.source.read(name, dict(params), con)
+        self.record(name, df, params)
+        if chunksize is not None:
+            return _chunks(df, chunksize)
+        return df
+
+    def record(self, name, df, params):
+        """Stores a query result, adding the key columns the result does not carry (e.g. LEG_ORIG)."""
+        table = LOGICAL_QUERIES[name]["table"]
+        stored = df.copy()
+        for param, value in params.items():
+            column, comparison = LOGICAL_QUERIES[name]["filters"][param]
+            if comparison == "=" and value is not None and column not in stored:
+                stored[column] = value
+
+        exists = self._con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table,)).fetchone()
+        if exists:
+            where, values = _where(name, params)
+            self._con.execute(f'DELETE FROM "{table}"{where}', values)
+        stored.to_sql(table, self._con, if_exists="append", index=False)
+        self._con.commit()
+
+    def close(self):
+        self._con.close()
+
+
+_source = LiveSource()
+
+
+def set_source(source):
+    """Routes every pull of the pipeline through `source` (LiveSource, LocalSource or Recorder)."""
+    global _source
+    _source = source
+
+
+def get_source():
+    return _source
+
+
+@contextmanager
+def using(source):
+    """Temporarily routes the pulls through `source`, e.g. `with using(LocalSource("replay.db")): ...`"""
+    previous = get_source()
+    set_source(source)
+    try:
+        yield source
+    finally:
+        set_source(previous)
+
+
+def read(name, params, con=None, chunksize=None):
+    """Runs one logical query on the active source.
+
+    Args:
+        name (string): Key of LOGICAL_QUERIES (and of queries.STATEMENTS)
+        params (dict): Query parameters (bind variables of the live statement / filters of the local replay)
+        con (Connection, optional): Live connection. Defaults to the shared connection of connections.manager.
+        chunksize (int, optional): Return an iterator of DataFrames of at most chunksize rows. Defaults to None.
+
+    Returns:
+        pd.DataFrame: Query result (or an iterator of DataFrames with chunksize)
+    """
+    return _source.read(name, dict(params), con, chunksize)
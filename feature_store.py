@@ -0,0 +1,227 @@
+import numpy as np
+import pandas as pd
+
+from calendar_features import cyclic_encoding, dow_map_x, dow_map_y, wk_map_x, wk_map_y
+from utility import (
+    CAP_FEATURE_COLUMNS,
+    OAG_DAY_COLUMNS,
+    OAG_FCST_COLUMNS,
+    aa_cap_fcst_bands,
+    oag_per_day,
+    oag_per_fcst_bands,
+)
+
+# ---------- Daily capacity / calendar features of a market as dense arrays, joined onto the history by day offset:
+
+# Columns gather() adds by default: the same ones (and order) as merging oag_per_fcst + oag_per_day on adj_dep_date
+OAG_COLUMNS = ["fcst_start", "fcst_end"] + OAG_FCST_COLUMNS + OAG_DAY_COLUMNS
+
+# Columns of an oag_per_fcst row (the fcst_id band part of OAG_COLUMNS)
+BAND_COLUMNS = ["fcst_start", "fcst_end"] + OAG_FCST_COLUMNS
+
+# Served by gather(columns=...) only, the history already carries them (finish_history)
+CALENDAR_COLUMNS = ["week_x", "week_y", "dow_x", "dow_y"]
+
+
+def _day_offsets(dates, epoch, n_days):
+    """Day offset of every date from epoch, n_days (the NaN sentinel day) for NaT and dates outside the store."""
+    days = (pd.DatetimeIndex(pd.to_datetime(dates)).normalize() - epoch).days.to_numpy(dtype=float, na_value=-1)
+    days = days.astype(np.int64)
+    days[(days < 0) | (days >= n_days)] = n_days
+    return days
+
+
+class FeatureStore:
+    """Capacity features of every fcst_id of a market, one float64 array slot per day since `epoch`.
+
+    values[column, fcst, day] holds the oag_per_fcst, oag_per_day (and optionally AA capacity) feature of a
+    fcst_id on a day; days without a row are NaN, as after the left merges. Joining the features onto the
+    history of a fcst_id is then one gather, values[:, fcst, day_offset], instead of a hash merge per frame, and
+    every fcst_id of the market is served from the one build. The last day slot is an all-NaN sentinel that
+    dates outside the store point to.
+    """
+
+    def __init__(self, epoch, fcst_ids, columns, values, present, calendar):
+        """
+        Args:
+            epoch (pd.Timestamp): Date of day offset 0
+            fcst_ids (list): fcst_id of every fcst row of values
+            columns (list): Column of every first-axis row of values
+            values (np.ndarray): float64 (columns x fcst_ids x days + 1)
+            present (np.ndarray): bool (fcst_ids x days + 1), the fcst_id had an oag_per_fcst row on that day
+            calendar (dict): CALENDAR_COLUMNS -> float64 (days + 1) array
+        """
+        self.epoch = epoch
+        self.fcst_ids = list(fcst_ids)
+        self.columns = list(columns)
+        self.values = values
+        self.present = present
+        self.calendar = calendar
+        self._fcst_position = {fcst_id: position for position, fcst_id in enumerate(self.fcst_ids)}
+        self._column_position = {column: position for position, column in enumerate(self.columns)}
+
+    @property
+    def n_days(self):
+        return self.values.shape[2] - 1
+
+    @property
+    def dates(self):
+        return pd.date_range(self.epoch, periods=self.n_days)
+
+    @classmethod
+    def build(cls, oag_df, fcst_id_df, cap_df=None):
+        """Builds the store of a market from its OAG (and AA capacity) flights.
+
+        Args:
+            oag_df (pd.DataFrame): OAG flights (get_oag_data)
+            fcst_id_df (pd.DataFrame): fcst_ids and time bands of the market (get_fcst_given_leg)
+            cap_df (pd.DataFrame, optional): AA capacity flights (get_cap_data), adds CAP_FEATURE_COLUMNS. Defaults to None.
+
+        Returns:
+            FeatureStore: one slot per day from the first to the last departure
+        """
+        per_day = oag_per_day(oag_df)
+        per_fcst = oag_per_fcst_bands(oag_df, fcst_id_df)
+        per_cap = aa_cap_fcst_bands(cap_df, fcst_id_df) if cap_df is not None else {}
+
+        dates = [pd.to_datetime(per_day["adj_dep_date"])]
+        dates += [pd.to_datetime(cap_kl["dep_date"]) for cap_kl in per_cap.values()]
+        dates = pd.concat(dates, ignore_index=True)
+        epoch = dates.min().normalize() if len(dates) else pd.Timestamp("1970-01-01")
+        n_days = (dates.max().normalize() - epoch).days + 1 if len(dates) else 0
+
+        fcst_ids = list(per_fcst)
+        columns = OAG_COLUMNS + (CAP_FEATURE_COLUMNS if cap_df is not None else [])
+        store = cls(
+            epoch,
+            fcst_ids,
+            columns,
+            np.full((len(columns), len(fcst_ids), n_days + 1), np.nan),
+            np.zeros((len(fcst_ids), n_days + 1), dtype=bool),
+            {},
+        )
+
+        # the market-wide features are the same for every fcst_id, but only kept on the days it has a band row
+        day_rows = np.full((len(OAG_DAY_COLUMNS), n_days + 1), np.nan)
+        day_rows[:, _day_offsets(per_day["adj_dep_date"], epoch, n_days)] = per_day[OAG_DAY_COLUMNS].to_numpy(float).T
+        band_rows = [store._column_position[column] for column in BAND_COLUMNS]
+        day_rows_position = [store._column_position[column] for column in OAG_DAY_COLUMNS]
+        cap_rows = [store._column_position[column] for column in columns if column in CAP_FEATURE_COLUMNS]
+        for position, fcst_id in enumerate(fcst_ids):
+            # (columns x days) view of the fcst_id
+            block = store.values[:, position, :]
+            oag_kl = per_fcst[fcst_id]
+            days = _day_offsets(oag_kl["adj_dep_date"], epoch, n_days)
+            store.present[position, days] = True
+            block[np.ix_(band_rows, days)] = oag_kl[BAND_COLUMNS].to_numpy(float).T
+            block[np.ix_(day_rows_position, days)] = day_rows[:, days]
+            if fcst_id in per_cap:
+                cap_kl = per_cap[fcst_id]
+                cap_days = _day_offsets(cap_kl["dep_date"], epoch, n_days)
+                block[np.ix_(cap_rows, cap_days)] = cap_kl[CAP_FEATURE_COLUMNS].to_numpy(float).T
+        store.present[:, n_days] = False
+
+        calendar_dates = store.dates
+        week = pd.Series(calendar_dates.isocalendar().week.to_numpy(dtype="int64"))
+        dow = pd.Series(calendar_dates.dayofweek + 1)
+        for column, values, mapping in (
+            ("week_x", week, wk_map_x),
+            ("week_y", week, wk_map_y),
+            ("dow_x", dow, dow_map_x),
+            ("dow_y", dow, dow_map_y),
+        ):
+            store.calendar[column] = np.append(cyclic_encoding(values, mapping).to_numpy(), np.nan)
+        return store
+
+    def normalize(self, scalers=None, market=None, fit=True):
+        """Store with the OAG features min-max scaled per fcst_id, like normalize_oag_kl_fcst_total.
+
+        The days of a fcst_id with a missing feature are dropped (NaN) before scaling, as its dropna does.
+
+        Args:
+            scalers (ScalerStore, optional): Persisted min/max state, see normalize_oag_kl_fcst_total. Defaults to None.
+            market (string, optional): Market of the store, e.g. "ORD-DFW" (with scalers)
+            fit (bool, optional): Widen the stored min/max with the days not seen yet. Defaults to True.
+
+        Returns:
+            FeatureStore: new store, the AA capacity columns are left as they are
+        """
+        norm_cols = OAG_FCST_COLUMNS + OAG_DAY_COLUMNS
+        rows = [self._column_position[column] for column in OAG_COLUMNS]
+        norm_rows = [self._column_position[column] for column in norm_cols]
+        values = self.values.copy()
+        valid = self.present & np.isfinite(values[rows]).all(axis=0)
+        scaled = np.where(valid, values[norm_rows], np.nan)
+
+        if scalers is None:
+            low = np.where(valid, scaled, np.inf).min(axis=2, keepdims=True)
+            high = np.where(valid, scaled, -np.inf).max(axis=2, keepdims=True)
+            with np.errstate(invalid="ignore"):
+                span = high - low
+            # minmax_scale only shifts constant columns
+            span[~(span >= 10 * np.finfo(span.dtype).eps)] = 1.0
+            scaled = (scaled - low) / span
+        else:
+            for position, fcst_id in enumerate(self.fcst_ids):
+                days = np.flatnonzero(valid[position])
+                frame = pd.DataFrame(scaled[:, position, days].T, columns=norm_cols)
+                frame["adj_dep_date"] = self.epoch + pd.to_timedelta(days, unit="D")
+                if fit:
+                    scalers.update("oag", market, fcst_id, frame, norm_cols, date_column="adj_dep_date")
+                scaled[:, position, days] = scalers.transform("oag", market, fcst_id, frame, norm_cols).T
+
+        values[rows] = np.where(valid, values[rows], np.nan)
+        values[norm_rows] = scaled
+        return FeatureStore(self.epoch, self.fcst_ids, self.columns, values, valid, self.calendar)
+
+    def gather(self, df, fcst_id, columns=None, date_column="flightDepartureDate"):
+        """Adds the features of a fcst_id to every row of df, looked up by the day offset of date_column.
+
+        With the default columns the result matches pd.merge(df, oag_kl_fcst_total, left_on=date_column,
+        right_on="adj_dep_date", how="left"), rows and row order of df kept, NaN where the day has no features.
+
+        Args:
+            df (pd.DataFrame): Rows to enrich (e.g. the pull_data / pull_seas output of the fcst_id)
+            fcst_id (int): fcst_id whose features are joined
+            columns (list, optional): Feature and CALENDAR_COLUMNS names. Defaults to None (adj_dep_date + OAG_COLUMNS).
+            date_column (str, optional): Departure date column of df. Defaults to "flightDepartureDate".
+
+        Returns:
+            pd.DataFrame: copy of df with the feature columns appended (columns df already has are overwritten)
+        """
+        days = _day_offsets(df[date_column], self.epoch, self.n_days)
+        position = self._fcst_position.get(fcst_id)
+        features = {}
+        if columns is None:
+            present = self.present[position, days] if position is not None else np.zeros(len(days), dtype=bool)
+            features["adj_dep_date"] = pd.to_datetime(df[date_column]).where(present).to_numpy()
+            columns = OAG_COLUMNS
+
+        for column in columns:
+            if column in self.calendar:
+                features[column] = self.calendar[column][days]
+            elif position is None:
+                features[column] = np.full(len(days), np.nan)
+            else:
+                features[column] = self.values[self._column_position[column], position, days]
+        return df.assign(**features)
+
+
+def market_features(oag_df, fcst_id_df, cap_df=None, scalers=None, market=None, fit=True):
+    """Normalized FeatureStore of a market, built once before its fcst_id loop.
+
+    store.gather(df, fcst_id) then takes the place of the per fcst_id chain oag_per_fcst -> merge with oag_per_day
+    -> normalize_oag_kl_fcst_total -> merge into the history on flightDepartureDate.
+
+    Args:
+        oag_df (pd.DataFrame): OAG flights (get_oag_data)
+        fcst_id_df (pd.DataFrame): fcst_ids and time bands of the market (get_fcst_given_leg)
+        cap_df (pd.DataFrame, optional): AA capacity flights (get_cap_data). Defaults to None.
+        scalers (ScalerStore, optional): Persisted min/max state, see normalize_oag_kl_fcst_total. Defaults to None.
+        market (string, optional): Market, e.g. "ORD-DFW" (with scalers)
+        fit (bool, optional): Widen the stored min/max with the days not seen yet; False for scoring. Defaults to True.
+
+    Returns:
+        FeatureStore: normalized store of every fcst_id of fcst_id_df
+    """
+    return FeatureStore.build(oag_df, fcst_id_df, cap_df).normalize(scalers, market, fit)
@@ -0,0 +1,123 @@
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# ---------- Local columnar cache for the history / schedule pulls:
+
+
+class HistoryCache:
+    """On-disk Parquet (or Feather) cache of raw query results, one file per (orig, dest, fcst_id, cabin) key.
+
+    Every refresh only pulls the rows departing on or after the cached high-water mark minus `overlap_days`
+    (so late corrections are picked up), drops the cached rows in that window and appends the fresh ones.
+    The high-water mark is capped at today: departures that have not flown yet are always re-pulled.
+
+    Needs pyarrow (or fastparquet for the parquet format) to be installed.
+    """
+
+    def __init__(self, root, overlap_days=7, file_format="parquet"):
+        """
+        Args:
+            root (string): Folder where the cache files are written
+            overlap_days (int, optional): Days before the high-water mark to re-pull for late corrections. Defaults to 7.
+            file_format (str, optional): "parquet" or "feather". Defaults to "parquet".
+        """
+        if file_format not in ("parquet", "feather"):
+            raise ValueError(f"Unknown cache format: {file_format}")
+        self.root = root
+        self.overlap_days = overlap_days
+        self.file_format = file_format
+
+    def path(self, kind, key):
+        """File path of a cached pull.
+
+        Args:
+            kind (string): Query family, e.g. "history", "oag" or "cap"
+            key (tuple): (orig, dest, fcst_id, cabin), None fields are stored as "all"
+
+        Returns:
+            string: path of the cache file
+        """
+        name = "_".join("all" if part is None else str(part) for part in key)
+        return os.path.join(self.root, kind, f"{name}.{self.file_format}")
+
+    def load(self, kind, key):
+        """Returns the cached DataFrame or None if the key was never pulled."""
+        path = self.path(kind, key)
+        if not os.path.exists(path):
+            return None
+        if self.file_format == "parquet":
+            return pd.read_parquet(path)
+        return pd.read_feather(path)
+
+    def save(self, kind, key, df):
+        """Writes (overwrites) the cache file of the given key."""
+        path = self.path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df = df.reset_index(drop=True)
+        if self.file_format == "parquet":
+            df.to_parquet(path, index=False)
+        else:
+            df.to_feather(path)
+
+    def refresh_start(self, cached, date_column):
+        """First departure date to re-pull for a cached frame: min(high-water mark, today) - overlap_days.
+
+        Args:
+            cached (pd.DataFrame): Cached rows
+            date_column (string): Departure date column of the cached rows
+
+        Returns:
+            string: 'YYYY-MM-DD'
+        """
+        high_water_mark = min(pd.to_datetime(cached[date_column]).max(), pd.Timestamp(datetime.today().date()))
+        return (high_water_mark - timedelta(days=self.overlap_days)).strftime("%Y-%m-%d")
+
+    def refresh(self, kind, key, fetch, date_column, start=None, end=None):
+        """Incrementally refreshes a cached pull and returns the merged rows.
+
+        Args:
+            kind (string): Query family, e.g. "history", "oag" or "cap"
+            key (tuple): (orig, dest, fcst_id, cabin)
+            fetch (callable): fetch(since, end) -> pd.DataFrame with the rows departing in [since, end] (since=None: everything)
+            date_column (string): Departure date column used as the high-water mark
+            start (string, optional): First departure date the caller needs ('YYYY-MM-DD'). Defaults to None.
+            end (string, optional): Last departure date the caller needs ('YYYY-MM-DD'). Defaults to None.
+
+        Returns:
+            pd.DataFrame: Cached + fresh rows, restricted to [start, end]
+        """
+        cached = self.load(kind, key)
+        if cached is not None and len(cached) > 0:
+            cached_dates = pd.to_datetime(cached[date_column])
+            if start is not None and cached_dates.min() > pd.Timestamp(start):
+                # The cache does not reach back far enough, pull everything again
+                cached = None
+
+        if cached is None or len(cached) == 0:
+            merged = fetch(start, end).reset_index(drop=True)
+            self.save(kind, key, merged)
+        else:
+            since = self.refresh_start(cached, date_column)
+            if start is not None:
+                since = max(since, start)
+            if end is not None and pd.Timestamp(since) > pd.Timestamp(end):
+                # Nothing in the requested window can have changed since the last pull
+                merged = cached
+            else:
+                keep = cached_dates < pd.Timestamp(since)
+                if end is not None:
+                    keep |= cached_dates > pd.Timestamp(end)
+                merged = pd.concat([cached[keep], fetch(since, end)], ignore_index=True)
+                order = pd.to_datetime(merged[date_column]).argsort(kind="stable").to_numpy()
+                merged = merged.iloc[order].reset_index(drop=True)
+                self.save(kind, key, merged)
+
+        dates = pd.to_datetime(merged[date_column])
+        window = pd.Series(True, index=merged.index)
+        if start is not None:
+            window &= dates >= pd.Timestamp(start)
+        if end is not None:
+            window &= dates <= pd.Timestamp(end)
+        return merged[window].reset_index(drop=True)
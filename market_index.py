@@ -0,0 +1,151 @@
+import os
+
+import pandas as pd
+
+import datasource
+
+# ---------- Market metadata index (size of every market, known before any heavy pull):
+
+INDEX_COLUMNS = ["orig", "dest", "fcst_id", "rows", "points", "first_departure", "last_departure"]
+
+# Markets with less than this many points are IGNORED by the training loops (`if len(df) < 100`)
+MIN_POINTS = 100
+
+# One row of pull_data per distinct value of these columns (the rest of its index is constant within a market)
+POINT_COLUMNS = ["flightDepartureDate", "localFlowIndicator", "forecastPeriod", "poolCode", "forecastDayOfWeek"]
+
+
+class MarketIndex:
+    """Row counts, departure-date range and fcst_ids of every (orig, dest, fcst_id) of fcst_history_v.
+
+    `points` is the number of distinct (departure date, local/flow indicator, forecast period, pool code, day of
+    week) of a market, which is the number of rows pull_data returns for it (pull_seas can only drop some), so a
+    market with less than MIN_POINTS points can be skipped before pulling anything: it would be IGNORED anyway.
+    """
+
+    def __init__(self, markets):
+        """
+        Args:
+            markets (pd.DataFrame): One row per (orig, dest, fcst_id) with the INDEX_COLUMNS
+        """
+        self.markets = markets[INDEX_COLUMNS].reset_index(drop=True)
+
+    @classmethod
+    def from_database(cls, orig=None, date_range=None, hcrt=None):
+        """Builds the index with one COUNT / MIN / MAX query over fcst_history_v (fcst_history_stats statement).
+
+        Args:
+            orig (string, optional): Only index the markets of this origin. Defaults to None (whole network).
+            date_range (tuple, optional): (start, end) 'YYYY-MM-DD' bound on the departure date, end excluded. Defaults to None.
+            hcrt (cx_Oracle.Connection, optional): herccrt().con(). Defaults to the shared connection of connections.manager.
+
+        Returns:
+            MarketIndex: index of the markets
+        """
+        start, end = date_range if date_range is not None else (None, None)
+        stats = datasource.read("fcst_history_stats", {"orig": orig, "start": start, "end": end}, con=hcrt)
+        stats.columns = INDEX_COLUMNS
+        return cls(_typed(stats))
+
+    @classmethod
+    def from_cache(cls, cache, orig=None):
+        """Builds the index from the raw history files of a history_cache.HistoryCache (no database access).
+
+        Args:
+            cache (history_cache.HistoryCache): Cache the history pulls were stored in
+            orig (string, optional): Only index the markets of this origin. Defaults to None (every cached origin).
+
+        Returns:
+            MarketIndex: index of the cached markets
+        """
+        folder = os.path.join(cache.root, "history")
+        frames = []
+        for file_name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+            key = os.path.splitext(file_name)[0].split("_")
+            if len(key) != 4 or (orig is not None and key[0] != orig):
+                continue
+            cached = cache.load("history", tuple(key))
+            if cached is None or len(cached) == 0:
+                continue
+            point = cached["flightDepartureDate"].astype(str)
+            for column in POINT_COLUMNS[1:]:
+                point = point + "|" + cached[column].astype(str)
+            cached = cached.assign(origin=key[0], point=point)
+            frames.append(
+                cached.groupby(["origin", "destination", "forecastId"], observed=True)
+                .agg(
+                    rows=("point", "size"),
+                    points=("point", "nunique"),
+                    first_departure=("flightDepartureDate", "min"),
+                    last_departure=("flightDepartureDate", "max"),
+                )
+                .reset_index()
+                .rename(columns={"origin": "orig", "destination": "dest", "forecastId": "fcst_id"})
+            )
+        if not frames:
+            return cls(pd.DataFrame(columns=INDEX_COLUMNS))
+        markets = pd.concat(frames, ignore_index=True)
+        # a market can be cached under its own key and under a whole-origin key
+        markets = markets.sort_values("rows", ascending=False).drop_duplicates(["orig", "dest", "fcst_id"])
+        return cls(_typed(markets).sort_values(["orig", "dest", "fcst_id"]))
+
+    @classmethod
+    def read(cls, path):
+        """Reads an index saved with write()."""
+        return cls(pd.read_parquet(path))
+
+    def write(self, path):
+        """Saves the index to a Parquet file."""
+        self.markets.to_parquet(path, index=False)
+
+    # ---------- Lookups:
+
+    def fcst_ids(self, orig, dest):
+        """fcst_ids of a market that has history (sorted)."""
+        rows = self.markets[(self.markets["orig"] == orig) & (self.markets["dest"] == dest)]
+        return sorted(rows["fcst_id"].tolist())
+
+    def destinations(self, orig):
+        """Destinations of an origin that have history (sorted)."""
+        return sorted(self.markets.loc[self.markets["orig"] == orig, "dest"].unique())
+
+    def work(self, orig=None, min_points=MIN_POINTS):
+        """(orig, dest, fcst_id) markets worth pulling, largest first.
+
+        Args:
+            orig (string, optional): Only the markets of this origin. Defaults to None (every indexed origin).
+            min_points (int, optional): Skip the markets with fewer points. Defaults to MIN_POINTS.
+
+        Returns:
+            pd.DataFrame: Rows of the index, sorted by decreasing rows (the longest pulls first)
+        """
+        markets = self.markets
+        if orig is not None:
+            markets = markets[markets["orig"] == orig]
+        markets = markets[markets["points"] >= min_points]
+        return markets.sort_values(["rows", "points"], ascending=False, kind="stable").reset_index(drop=True)
+
+    def skipped(self, orig=None, min_points=MIN_POINTS):
+        """The indexed markets work() leaves out (fewer than min_points points)."""
+        markets = self.markets if orig is None else self.markets[self.markets["orig"] == orig]
+        return markets[markets["points"] < min_points].reset_index(drop=True)
+
+    def destinations_by_size(self, orig, min_points=MIN_POINTS):
+        """Destinations of an origin with at least one market worth pulling, largest (total rows) first.
+
+        Returns:
+            list: (dest, [fcst_id, ...]) tuples, the fcst_ids of a destination also largest first
+        """
+        work = self.work(orig, min_points)
+        totals = work.groupby("dest", sort=False)["rows"].sum().sort_values(ascending=False, kind="stable")
+        return [(dest, work.loc[work["dest"] == dest, "fcst_id"].tolist()) for dest in totals.index]
+
+
+def _typed(markets):
+    markets = markets.copy()
+    markets["fcst_id"] = markets["fcst_id"].astype("int64")
+    markets["rows"] = markets["rows"].astype("int64")
+    markets["points"] = markets["points"].astype("int64")
+    markets["first_departure"] = pd.to_datetime(markets["first_departure"])
+    markets["last_departure"] = pd.to_datetime(markets["last_departure"])
+    return markets
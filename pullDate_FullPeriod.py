@@ -1,145 +1,25 @@
+from datetime import datetime
+
+import numpy as np
 import pandas as pd
-from config import herccrt, mosaic
-
-hrc = herccrt().con()
-
-
-dow_map_x = {
-  1:1,
-  2:0.809,
-  3:0.381,
-  4:0.037,
-  5:0.037,
-  6:0.381,
-  7:0.809
-}
-dow_map_y = {
-  1:0.494,
-  2:0.89,
-  3:0.987,
-  4:0.713,
-  5:0.274,
-  6:0,
-  7:0.098
-}
-
-wk_map_x = {1: 0.99889441,
- 2: 0.99118029,
- 3: 0.976378386,
- 4: 0.954703312,
- 5: 0.926466233,
- 6: 0.892075869,
- 7: 0.852027483,
- 8: 0.806898384,
- 9: 0.75734042,
- 10: 0.704067472,
- 11: 0.647848951,
- 12: 0.58949479,
- 13: 0.529846938,
- 14: 0.469765855,
- 15: 0.410118003,
- 16: 0.351763842,
- 17: 0.295545321,
- 18: 0.242272373,
- 19: 0.192714409,
- 20: 0.147585311,
- 21: 0.107536925,
- 22: 0.07314656,
- 23: 0.044909482,
- 24: 0.023234407,
- 25: 0.008432503,
- 26: 0.000718384,
- 27: 0.000202608,
- 28: 0.006892681,
- 29: 0.02069255,
- 30: 0.041403109,
- 31: 0.068725199,
- 32: 0.10226511,
- 33: 0.141539082,
- 34: 0.185980313,
- 35: 0.234947962,
- 36: 0.287736151,
- 37: 0.343582473,
- 38: 0.401682498,
- 39: 0.46119828,
- 40: 0.521270358,
- 41: 0.581032771,
- 42: 0.639624059,
- 43: 0.69619827,
- 44: 0.749939968,
- 45: 0.800073739,
- 46: 0.845876698,
- 47: 0.886688492,
- 48: 0.921919805,
- 49: 0.951062367,
- 50: 0.973696454,
- 51: 0.989495891,
- 52: 0.998231556,
- 53: 0.998}
-
-wk_map_y = {1: 0.534132227,
- 2: 0.593716044,
- 3: 0.651945139,
- 4: 0.707980061,
- 5: 0.761012381,
- 6: 0.810276688,
- 7: 0.855063604,
- 8: 0.894726284,
- 9: 0.928692922,
- 10: 0.956473257,
- 11: 0.977667074,
- 12: 0.991968211,
- 13: 0.999170557,
- 14: 0.999170557,
- 15: 0.991968211,
- 16: 0.977667074,
- 17: 0.956473257,
- 18: 0.928692922,
- 19: 0.894726284,
- 20: 0.855063604,
- 21: 0.810276688,
- 22: 0.761012381,
- 23: 0.707980061,
- 24: 0.651945139,
- 25: 0.593716044,
- 26: 0.534132227,
- 27: 0.474053144,
- 28: 0.414345761,
- 29: 0.355871035,
- 30: 0.299472418,
- 31: 0.245963344,
- 32: 0.196115226,
- 33: 0.150647946,
- 34: 0.110216356,
- 35: 0.075404266,
- 36: 0.046713445,
- 37: 0.024557614,
- 38: 0.009256943,
- 39: 0.001031051,
- 40: 0.0,
- 41: 0.006177299,
- 42: 0.0194749,
- 43: 0.0397007,
- 44: 0.066562544,
- 45: 0.099673226,
- 46: 0.138554988,
- 47: 0.182648034,
- 48: 0.231315022,
- 49: 0.283854578,
- 50: 0.339509298,
- 51: 0.397475752,
- 52: 0.456917994,
- 53: 0.457}
-
-DOW_DAY_NAMES = [
-    (1, "monday"),
-    (2, "tuesday"),
-    (3, "wednesday"),
-    (4, "thursday"),
-    (5, "friday"),
-    (6, "saturday"),
-    (7, "sunday"),
-]
+from pandas.api.types import is_categorical_dtype
+
+import datasource
+
+# DOW_DAY_NAMES and the dow / wk maps used to be defined here and are still importable from this module
+from calendar_features import (  # noqa: F401
+    DOW_DAY_NAMES,
+    WEEK_COLUMNS,
+    add_cyclic_features,
+    day_of_week_one_hot,
+    dow_map_x,
+    dow_map_y,
+    forecast_departure_date,
+    week_of_year_one_hot,
+    wk_map_x,
+    wk_map_y,
+)
+from schema import apply_schema, restore_dtypes
 
 DEFAULT_POOL_RASM_H2 = 1.0
 DEFAULT_POOL_RASM_HL = 0.0
@@ -169,55 +49,76 @@ def week_of_year_binary(row, week_number_column):
     return row
 
 
-# TODO: Optimize this, it's really slow for PA
-def add_day_columns(data_frame, dow_column):
+def add_day_columns(data_frame, dow_column, dtype="uint8", sparse=False):
     """
      Add columns for each day of the week. Set value to 1 if it matches
-     the dow_column name
+     the dow_column name (vectorized, see calendar_features.day_of_week_one_hot)
     :param data_frame:
     :param dow_column:
+    :param dtype: dtype of the monday .. sunday columns
+    :param sparse: store them as pandas sparse columns
     :return:
     """
-    for val in DOW_DAY_NAMES:
-        (day_number, day_name) = val
-        data_frame[day_name] = data_frame.apply(dow_binary, axis=1, args=(day_number, dow_column))
+    days = day_of_week_one_hot(data_frame[dow_column], dtype, sparse)
+    for day_name in days.columns:
+        data_frame[day_name] = days[day_name]
 
     return True
 
-def add_week_binary(data_frame, source_column):
+def add_week_binary(data_frame, source_column, dtype="uint8", sparse=False):
     """
     add columns week_1 .. week_53 to dataframe
-    We set the matching week column to 1
+    We set the matching week column to 1 (vectorized, see calendar_features.week_of_year_one_hot)
     :param data_frame:
     :param source_column: name of column containing week number
+    :param dtype: dtype of the week columns
+    :param sparse: store them as pandas sparse columns
     :return:
     """
-    # Columns week_1 .. week_53 for binary columns of departure week-number
-    WEEK_COLUMNS = [f"week_{i+1}" for i in range(53)]
-    # Add the new columns with default 0
+    weeks = week_of_year_one_hot(data_frame[source_column], dtype, sparse)
+    new_df = data_frame.copy()
     for week in WEEK_COLUMNS:
-        data_frame[week] = 0
-
-    # we can't modify data_frame in place for "apply" so returning a new df
-    new_df = data_frame.apply(week_of_year_binary, axis=1, args=(source_column,))
+        new_df[week] = weeks[week]
     return new_df
 
 
 def add_forecast_departure_date(data_frame):
-    # Calculate forecastDepartureDate
-    data_frame["forecastDepartureDate"] = data_frame.apply(
-        compute_forecast_departure_date,
-        axis=1,
-        args=("flightDepartureDate", "forecastDayOfWeek"),
+    # Calculate forecastDepartureDate (see calendar_features.forecast_departure_date)
+    data_frame["forecastDepartureDate"] = forecast_departure_date(
+        data_frame["flightDepartureDate"], data_frame["forecastDayOfWeek"]
     )
 
 
-def add_holiday_features(df):
-    df["holiday"] = df.apply(lambda x: 1 if x.poolCode != 'M' else 0, axis=1)
-    HOLIDAY_POOL_CODES = ["H1", "H2", "H3", "HL"]
-    # We use the dow_binary function to identify pool codes rather than day-of-week
-    for holiday_pool_code in HOLIDAY_POOL_CODES:
-        df[holiday_pool_code] = df.apply(dow_binary, axis=1, args=(holiday_pool_code, "poolCode"))
+HOLIDAY_POOL_CODES = ["H1", "H2", "H3", "HL"]
+# Pool code of the regular (non holiday) departures
+NON_HOLIDAY_POOL_CODE = "M"
+
+
+def pool_code_indicators(pool_code, codes=HOLIDAY_POOL_CODES):
+    """
+        0/1 indicator column per pool code, all built in one vectorized pass: the pool codes are
+        categorical-coded once and compared to the requested codes with np.equal broadcasting.
+    :param pool_code: poolCode column (categorical or not)
+    :param codes: pool codes to build an indicator for, absent codes give an all-zero column
+    :return: dict of code -> int64 ndarray (1 where pool_code == code)
+    """
+    categorical = pd.Categorical(pool_code)
+    lookup = {code: i for i, code in enumerate(categorical.categories)}
+    # -2 never matches: codes are >= 0, and -1 marks a missing poolCode
+    targets = np.array([lookup.get(code, -2) for code in codes], dtype=np.int64)
+    matches = np.equal(categorical.codes[:, np.newaxis], targets[np.newaxis, :]).astype(np.int64)
+    return {code: matches[:, i] for i, code in enumerate(codes)}
+
+
+def add_holiday_features(df, holiday_pool_codes=HOLIDAY_POOL_CODES):
+    """
+        Add the holiday (poolCode != 'M') and the H1/H2/H3/HL pool code indicator columns in place.
+    :param holiday_pool_codes: pool codes that get their own indicator column
+    """
+    indicators = pool_code_indicators(df["poolCode"], [NON_HOLIDAY_POOL_CODE] + list(holiday_pool_codes))
+    df["holiday"] = 1 - indicators.pop(NON_HOLIDAY_POOL_CODE)
+    for holiday_pool_code, indicator in indicators.items():
+        df[holiday_pool_code] = indicator
 
 def multi_index_pivot(df, columns=None, values=None, flatten=False):
     """
@@ -237,6 +138,7 @@ def multi_index_pivot(df, columns=None, values=None, flatten=False):
     """
     names = list(df.index.names)
     df = df.reset_index()
+    index_dtypes = df[names].dtypes
     list_index = df[names].values
     tuples_index = [tuple(i) for i in list_index]  # hashable
     df = df.assign(tuples_index=tuples_index)
@@ -245,6 +147,8 @@ def multi_index_pivot(df, columns=None, values=None, flatten=False):
     # Remove confusing index column name #
     df.columns.name = None
     df = df.reset_index()
+    # from_tuples loses the dtypes of the index levels (categoricals, small ints)
+    restore_dtypes(df, index_dtypes)
 
     if flatten:
         # Collapse down to a single level
@@ -260,138 +164,337 @@ def multi_index_pivot(df, columns=None, values=None, flatten=False):
 
     return df
 
-def pull_data(orig,dest,fcst_id,new_market):
-    
-    if fcst_id == -1:
-        query = f"""SELECT /*+PARALLEL(8)*/  TO_CHAR(FLT_DPTR_DATE, 'YYYY-MM-DD') FLT_DPTR_DATE,  
-        FCST_CLS, 
-        CABIN_CODE,
-        LCL_FLW_IND, 
-        FCST_PERIOD, 
-        FRAC_CLOSURE, 
-        FRAC_CLOSURE_BELOW, 
-        TRAFFIC_CT, 
-        NVL(TRAFFIC_CT_AADV, 0) TRAFFIC_CT_AADV,
-        POOL_CD, 
-        DOW, 
-        nvl(FCST_ID,0) FCST_ID,
-        FLT_ID, 
-        POS_IND, 
-        TO_CHAR(TRUNC(SYSDATE),'YYYY-MM-DD') SNAPSHOT_DATE
-        FROM fcst_history_v
-        WHERE 1=1
-        and LEG_ORIG = '{orig}'
-        and leg_dest = '{dest}'
-        AND BAD_HIST_IND='N' 
-        AND CABIN_CODE = 'Y'
-        and dow in (1,2,3,4,5,6,7) 
-        and POOL_CD != 'I'
-        """
-        input_df = pd.read_sql(query, con=hrc)
+
+def sorted_codes(series):
+    """Integer code of each value, numbered in sorted value order (categories ranked by value, not code), -1 where missing."""
+    if is_categorical_dtype(series):
+        categories = series.cat.categories
+        rank = np.empty(len(categories) + 1, dtype=np.int64)
+        rank[np.argsort(np.asarray(categories, dtype=object), kind="stable")] = np.arange(len(categories))
+        # code -1 (missing) picks the last slot
+        rank[-1] = -1
+        return rank[series.cat.codes.to_numpy()], len(categories)
+    codes, uniques = pd.factorize(series, sort=True)
+    return codes.astype(np.int64), len(uniques)
+
+
+def sorted_key_codes(df, names, dropna=False):
+    """Dense integer code of each row's (names) key, numbered in lexicographic key order.
+
+    Missing values sort last; with dropna=True the rows with a missing key value get -1 instead (the rows a
+    groupby on names drops) and the others are numbered 0 .. n_keys - 1.
+    """
+    combined, size = np.zeros(len(df), dtype=np.int64), 1
+    missing = np.zeros(len(df), dtype=bool)
+    for name in names:
+        codes, n = sorted_codes(df[name])
+        missing |= codes < 0
+        # missing values (-1) sort last
+        codes[codes < 0] = n
+        n += 1
+        if size * n >= 2**62:
+            # keep the mixed-radix key inside int64: renumber the distinct prefixes first
+            combined, uniques = pd.factorize(combined, sort=True)
+            size = len(uniques)
+        combined = combined * n + codes
+        size *= n
+    if not dropna:
+        return pd.factorize(combined, sort=True)[0]
+    key = np.full(len(df), -1, dtype=np.int64)
+    key[~missing] = pd.factorize(combined[~missing], sort=True)[0]
+    return key
+
+
+def wide_pivot(df, columns=None, values=None, flatten=False):
+    """
+        Vectorized multi_index_pivot: same rows, columns, dtypes and order, without the per-row tuples.
+        Every index level and the pivot column are integer coded (sorted like the tuples pivot compares),
+        then each value column is scattered into a (rows x classes) ndarray.
+        multi_index_pivot is kept as the reference implementation (see benchmark_pivot.py).
+    :param df: long frame, the index (e.g. DATA_INDEX) identifies the output rows
+    :param columns: column whose values become the wide columns (e.g. "forecastClass")
+    :param values: value column (single level output) or list of value columns
+    :param flatten: name the columns f"{value}_{class}" instead of a (value, class) MultiIndex
+    :raises ValueError: if an (index, class) pair appears more than once, like pivot
+    """
+    names = list(df.index.names)
+    df = df.reset_index()
+    if values is None:
+        value_columns = [column for column in df.columns if column not in names and column != columns]
+    else:
+        value_columns = [values] if isinstance(values, str) else list(values)
+
+    # one code per distinct index row, numbered in lexicographic (i.e. tuple) order, + the first row of each
+    row_codes = sorted_key_codes(df, names)
+    _, first_rows = np.unique(row_codes, return_index=True)
+    class_codes, classes = pd.factorize(df[columns], sort=True)
+    n_rows, n_classes = len(first_rows), len(classes)
+
+    cells = row_codes.astype(np.int64) * n_classes + class_codes
+    if len(np.unique(cells)) != len(cells):
+        raise ValueError("Index contains duplicate entries, cannot reshape")
+    missing = len(cells) < n_rows * n_classes
+
+    dtypes = [df[value].dtype for value in value_columns]
+    if all(isinstance(dtype, np.dtype) and dtype.kind in "iufb" for dtype in dtypes):
+        dtype = np.result_type(*dtypes)
+        if missing and dtype.kind in "iub":
+            dtype = np.dtype("float64")
+    else:
+        dtype = np.dtype(object)
+
+    blocks = []
+    for value in value_columns:
+        block = np.full((n_rows, n_classes), np.nan if dtype.kind in "fO" else 0, dtype=dtype)
+        block[row_codes, class_codes] = df[value].to_numpy()
+        blocks.append(block)
+
+    wide = pd.DataFrame(np.hstack(blocks) if blocks else np.empty((n_rows, 0), dtype=dtype))
+    if isinstance(values, str):
+        wide.columns = pd.Index(classes)
+    elif flatten:
+        wide.columns = [
+            f"{value}{'' if not str(cls) else '_' + str(cls)}" for value in value_columns for cls in classes
+        ]
+    else:
+        wide.columns = pd.MultiIndex.from_product([value_columns, classes])
+
+    index = df[names].iloc[first_rows].reset_index(drop=True)
+    for name in names:
+        if is_categorical_dtype(index[name]):
+            # only the codes present in the output, as restore_dtypes gives multi_index_pivot
+            index[name] = index[name].astype(object).astype("category")
+    if not flatten and not isinstance(values, str):
+        index.columns = pd.MultiIndex.from_tuples([(name, "") for name in names])
+    wide = pd.concat([index, wide], axis=1)
+    if isinstance(wide.columns, pd.MultiIndex):
+        # pivot names the class level of its columns
+        wide.columns.names = [None, columns]
+    return wide
+
+
+HISTORY_COLUMNS = ['flightDepartureDate','forecastClass','cabinCode','localFlowIndicator',
+                   'forecastPeriod','fracClosure','fracClosureBelow',
+                   'trafficCount','trafficCountAadv','poolCode',
+                   'forecastDayOfWeek','forecastId','flightId','POS','snapshotDate','destination']
+
+# Columns of the fcst_history_agg statement (aggregated in the database, see read_history_aggregated)
+AGGREGATED_HISTORY_COLUMNS = ['flightDepartureDate','forecastClass','localFlowIndicator','forecastPeriod',
+                              'fracClosure','trafficSum','trafficCountAadv','poolCode',
+                              'forecastDayOfWeek','forecastId','destination']
+
+
+def history_date_batches(start, end, freq="12MS"):
+    """
+        Split [start, end) into consecutive date ranges for pull_data_bulk.
+    :param start: first departure date 'YYYY-MM-DD'
+    :param end: departure date (excluded) 'YYYY-MM-DD'
+    :param freq: pandas offset alias for the batch length
+    :return: list of (start, end) string tuples
+    """
+    bounds = [pd.Timestamp(start)] + list(pd.date_range(start, end, freq=freq)) + [pd.Timestamp(end)]
+    bounds = sorted(set(bounds))
+    return [(a.strftime("%Y-%m-%d"), b.strftime("%Y-%m-%d")) for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+GROUPBY_COLUMNS_POS = [
+  "snapshotDate",
+  "origin",
+  "destination",
+  "forecastId",
+  "forecastDepartureDate",
+  "forecastDayOfWeek",
+  "poolCode",
+  "cabinCode",
+  "forecastPeriod",
+  "forecastClass",
+  "localFlowIndicator",
+  "flightId",
+  "flightDepartureDate",
+]
+
+GROUPBY_COLUMNS_FLIGHT_ID = [
+  "snapshotDate",
+  "origin",
+  "destination",
+  "forecastId",
+  "forecastDepartureDate",
+  "forecastDayOfWeek",
+  "poolCode",
+  "cabinCode",
+  "forecastPeriod",
+  "forecastClass",
+  "localFlowIndicator",
+  "flightDepartureDate",
+]
+
+DATA_INDEX = [
+    "snapshotDate",
+    "origin",
+    "destination",
+    "forecastId",
+    "forecastDepartureDate",
+    "forecastDayOfWeek",
+    "poolCode",
+    "cabinCode",
+    "forecastPeriod",
+    "localFlowIndicator",
+    "flightDepartureDate",
+]
+
+
+def read_history(orig, dest=None, fcst_id=None, date_range=None, con=None, chunksize=None):
+    """
+        Run the fcst_history statement (queries.py) and name the columns as HISTORY_COLUMNS.
+        Leaving dest (or fcst_id) as None pulls every destination (or forecast id) of the origin;
+        date_range is an optional (start, end) 'YYYY-MM-DD' bound on FLT_DPTR_DATE, end excluded (None: open).
+        con defaults to the shared HERCCRT connection of connections.manager.
+        With chunksize, returns an iterator of DataFrames of at most chunksize rows instead.
+        The query runs on the active datasource (live, or a local replay).
+    """
+    start, end = date_range if date_range is not None else (None, None)
+    params = {"orig": orig, "dest": dest, "fcst_id": fcst_id, "start": start, "end": end}
+    if chunksize is not None:
+        chunks = datasource.read("fcst_history", params, con=con, chunksize=chunksize)
+        return (chunk.set_axis(HISTORY_COLUMNS, axis=1) for chunk in chunks)
+    input_df = datasource.read("fcst_history", params, con=con)
+    input_df.columns = HISTORY_COLUMNS
+    return input_df
+
+
+def read_history_aggregated(orig, dest=None, fcst_id=None, date_range=None, con=None):
+    """
+        Run the fcst_history_agg statement (queries.py), which aggregates across POS and flightId in the
+        database, and complete its rows into the output of aggregate_history
+        (constant snapshotDate / origin / cabinCode added locally, same column and row order).
+    """
+    start, end = date_range if date_range is not None else (None, None)
+    params = {"orig": orig, "dest": dest, "fcst_id": fcst_id, "start": start, "end": end}
+    ret_data = datasource.read("fcst_history_agg", params, con=con)
+    ret_data.columns = AGGREGATED_HISTORY_COLUMNS
+    ret_data['snapshotDate'] = datetime.today().strftime("%Y-%m-%d")
+    ret_data['origin'] = orig
+    ret_data['cabinCode'] = 'Y'
+    ret_data['forecastDepartureDate'] = ret_data.flightDepartureDate
+    ret_data['fracClosure'] = pd.to_numeric(ret_data['fracClosure'])
+    ret_data['trafficSum'] = pd.to_numeric(ret_data['trafficSum'])
+    ret_data['trafficCountAadv'] = pd.to_numeric(ret_data['trafficCountAadv'])
+    ret_data = apply_schema(ret_data)
+
+    # groupby(...).agg() returns its groups sorted by key
+    ret_data = ret_data.sort_values(GROUPBY_COLUMNS_FLIGHT_ID)
+    return ret_data[GROUPBY_COLUMNS_FLIGHT_ID + ["fracClosure", "trafficSum", "trafficCountAadv"]].reset_index(drop=True)
+
+
+def pull_data(orig,dest,fcst_id,new_market,cache=None,con=None,chunksize=None,pushdown=False,snapshots=None):
+    """
+        Pull and process the fcst_history_v data of one market.
+    :param cache: optional history_cache.HistoryCache, only the departures after its high-water mark are pulled
+    :param con: optional HERCCRT connection, defaults to the shared one of connections.manager
+    :param chunksize: stream the rows from the cursor in chunks of this size (see aggregate_history_chunks),
+        memory then grows with the number of groups instead of the number of raw rows. Ignored with a cache.
+    :param pushdown: aggregate across POS and flightId in the database (see read_history_aggregated), only the
+        aggregated rows are transferred. Ignored with a cache.
+    :param snapshots: optional snapshots.SnapshotStore, the result is also saved as the snapshot of the day
+        (SnapshotStore.as_of rebuilds it later without a pull)
+    """
+    if fcst_id == -1 or new_market == True:
+        fcst_id = None
+
+    if cache is not None:
+        input_df = cache.refresh(
+            "history",
+            (orig, dest, fcst_id, "Y"),
+            lambda since, end: read_history(orig, dest, fcst_id, (since, None), con=con),
+            "flightDepartureDate",
+        )
+        # cached rows were stamped on the day they were pulled
+        input_df["snapshotDate"] = datetime.today().strftime("%Y-%m-%d")
+        ret_data = aggregate_history(prepare_history(input_df, orig))
+    elif pushdown:
+        ret_data = read_history_aggregated(orig, dest, fcst_id, con=con)
+    elif chunksize is not None:
+        ret_data = aggregate_history_chunks(read_history(orig, dest, fcst_id, con=con, chunksize=chunksize), orig)
     else:
-        if new_market == False:
-            query = f"""SELECT /*+PARALLEL(8)*/  TO_CHAR(FLT_DPTR_DATE, 'YYYY-MM-DD') FLT_DPTR_DATE,  
-            FCST_CLS, 
-            CABIN_CODE,
-            LCL_FLW_IND, 
-            FCST_PERIOD, 
-            FRAC_CLOSURE, 
-            FRAC_CLOSURE_BELOW, 
-            TRAFFIC_CT, 
-            NVL(TRAFFIC_CT_AADV, 0) TRAFFIC_CT_AADV,
-            POOL_CD, 
-            DOW, 
-            nvl(FCST_ID,0) FCST_ID,
-            FLT_ID, 
-            POS_IND, 
-            TO_CHAR(TRUNC(SYSDATE),'YYYY-MM-DD') SNAPSHOT_DATE
-            FROM fcst_history_v
-            WHERE 1=1
-            and LEG_ORIG = '{orig}'
-            and leg_dest = '{dest}'
-            AND fcst_id = {fcst_id} 
-            AND BAD_HIST_IND='N' 
-            AND CABIN_CODE = 'Y'
-            and dow in (1,2,3,4,5,6,7) 
-            and POOL_CD != 'I'
-            """
-            input_df = pd.read_sql(query, con=hrc)
-        if new_market == True:
-            query = f"""SELECT /*+PARALLEL(8)*/  TO_CHAR(FLT_DPTR_DATE, 'YYYY-MM-DD') FLT_DPTR_DATE,  
-            FCST_CLS, 
-            CABIN_CODE,
-            LCL_FLW_IND, 
-            FCST_PERIOD, 
-            FRAC_CLOSURE, 
-            FRAC_CLOSURE_BELOW, 
-            TRAFFIC_CT, 
-            NVL(TRAFFIC_CT_AADV, 0) TRAFFIC_CT_AADV,
-            POOL_CD, 
-            DOW, 
-            nvl(FCST_ID,0) FCST_ID,
-            FLT_ID, 
-            POS_IND, 
-            TO_CHAR(TRUNC(SYSDATE),'YYYY-MM-DD') SNAPSHOT_DATE
-            FROM fcst_history_v
-            WHERE 1=1
-            and LEG_ORIG = '{orig}'
-            and leg_dest = '{dest}'
-            --AND fcst_id = {fcst_id} 
-            AND BAD_HIST_IND='N' 
-            AND CABIN_CODE = 'Y'
-            and dow in (1,2,3,4,5,6,7) 
-            and POOL_CD != 'I'
-            """
-            input_df = pd.read_sql(query, con=hrc)
-
-    input_df.columns = ['flightDepartureDate','forecastClass','cabinCode','localFlowIndicator',
-                    'forecastPeriod','fracClosure','fracClosureBelow',
-                    'trafficCount','trafficCountAadv','poolCode',
-                    'forecastDayOfWeek','forecastId','flightId','POS','snapshotDate']
+        ret_data = aggregate_history(prepare_history(read_history(orig, dest, fcst_id, con=con), orig))
+
+    df = finish_history(ret_data)
+    if snapshots is not None:
+        snapshots.save(orig, dest, fcst_id, df)
+    return df
 
+
+def pull_data_bulk(orig, date_batches=None, split_fcst_id=True, con=None, chunksize=None, pushdown=False):
+    """
+        Pull the history of every destination (and forecast id) of an origin with one
+        fcst_history_v query per date batch, instead of one query per (dest, fcst_id).
+        Each market is then processed exactly as pull_data does.
+        Note: rows with a null FCST_ID come back as forecastId 0 (same nvl as pull_data).
+    :param orig: origin airport code
+    :param date_batches: optional list of (start, end) ranges, see history_date_batches
+    :param split_fcst_id: key the result by (dest, fcst_id); False keys by dest only (new_market behaviour)
+    :param con: optional HERCCRT connection, defaults to the shared one of connections.manager
+    :param chunksize: stream the rows in chunks of this size (see aggregate_history_chunks)
+    :param pushdown: aggregate in the database (see pull_data)
+    :return: dict of (dest, fcst_id) -> DataFrame (or dest -> DataFrame), same frames as pull_data
+    """
+    batches = date_batches or [None]
+    if pushdown:
+        # batches split on departure date, which is part of every group key
+        ret_data = pd.concat([read_history_aggregated(orig, date_range=batch, con=con) for batch in batches])
+        ret_data = apply_schema(ret_data.sort_values(GROUPBY_COLUMNS_FLIGHT_ID).reset_index(drop=True))
+    elif chunksize is not None:
+        chunks = (
+            chunk
+            for batch in batches
+            for chunk in read_history(orig, date_range=batch, con=con, chunksize=chunksize)
+        )
+        ret_data = aggregate_history_chunks(chunks, orig)
+    else:
+        input_df = pd.concat([read_history(orig, date_range=batch, con=con) for batch in batches], ignore_index=True)
+        ret_data = aggregate_history(prepare_history(input_df, orig))
+
+    # the aggregation groups by destination and forecastId, so splitting afterwards gives the per-market result
+    split_columns = ["destination", "forecastId"] if split_fcst_id else "destination"
+    return {
+        key: finish_history(market_data.reset_index(drop=True))
+        for key, market_data in ret_data.groupby(split_columns, observed=True)
+    }
+
+
+def build_history(input_df, orig):
+    """
+        Aggregate the raw fcst_history_v rows of one market (across POS and flightId),
+        pivot the fare classes wide and add the calendar/holiday features.
+    :param input_df: raw history with HISTORY_COLUMNS
+    :param orig: origin airport code
+    :return: DataFrame as returned by pull_data
+    """
+    return finish_history(aggregate_history(prepare_history(input_df, orig)))
+
+
+def prepare_history(input_df, orig):
+    """
+        Convert the raw history columns and add the derived ones used by the aggregation.
+        This is where the typed schema (schema.py) is applied: dates are parsed once here.
+    """
+    input_df = input_df.copy()
     input_df['fracClosure'] = pd.to_numeric(input_df['fracClosure'])
     input_df['trafficCount'] = pd.to_numeric(input_df['trafficCount'])
     input_df['trafficCountAadv'] = pd.to_numeric(input_df['trafficCountAadv'])
 
     input_df["trafficSum"] = input_df.trafficCount + input_df.trafficCountAadv
     input_df['origin'] = orig
-    input_df['destination'] = dest
     input_df['forecastDepartureDate'] = input_df.flightDepartureDate
+    return apply_schema(input_df)
 
 
-    groupby_columns_pos = [
-      "snapshotDate",
-      "origin",
-      "destination",
-      "forecastId",
-      "forecastDepartureDate",
-      "forecastDayOfWeek",
-      "poolCode",
-      "cabinCode",
-      "forecastPeriod",
-      "forecastClass",
-      "localFlowIndicator",
-      "flightId",
-      "flightDepartureDate",
-    ]
-
-    groupby_columns_flight_id = [
-      "snapshotDate",
-      "origin",
-      "destination",
-      "forecastId",
-      "forecastDepartureDate",
-      "forecastDayOfWeek",
-      "poolCode",
-      "cabinCode",
-      "forecastPeriod",
-      "forecastClass",
-      "localFlowIndicator",
-      "flightDepartureDate",
-    ]
-
-
-
+def aggregate_history(input_df):
+    """
+        Mean of frac closure & sum of traffic across points of sale, then mean across flight-id's.
+    :param input_df: output of prepare_history
+    :return: one row per GROUPBY_COLUMNS_FLIGHT_ID key
+    """
     # generate mean of frac closure & sum of traffic across points of sale
     agg_columns = {"fracClosure": "mean", "trafficSum": "sum"}
     agg_columns_flight_id = {"fracClosure": "mean", "trafficSum": "mean"}
@@ -399,38 +502,95 @@ def pull_data(orig,dest,fcst_id,new_market):
     agg_columns["trafficCountAadv"] = "sum"
     agg_columns_flight_id["trafficCountAadv"] = "mean"
 
-    ret_data = input_df.groupby(groupby_columns_pos, as_index=False).agg(agg_columns)
+    ret_data = input_df.groupby(GROUPBY_COLUMNS_POS, as_index=False, observed=True).agg(agg_columns)
 
     # Group again to combine across multiple flight-id's (if they exist)
-    ret_data = ret_data.groupby(groupby_columns_flight_id, as_index=False).agg(agg_columns_flight_id)
+    ret_data = ret_data.groupby(GROUPBY_COLUMNS_FLIGHT_ID, as_index=False, observed=True).agg(agg_columns_flight_id)
+    return ret_data
+
+
+# Raw rows aggregate_history_chunks buffers before aggregating them into one partial sum
+BATCH_ROWS = 50000
+
+
+def _partial_sums(raw, orig):
+    """Sum / count accumulators of a batch of raw history rows, keyed by GROUPBY_COLUMNS_POS."""
+    return prepare_history(raw, orig).groupby(GROUPBY_COLUMNS_POS, observed=True).agg(
+        fracClosureSum=("fracClosure", "sum"),
+        fracClosureCount=("fracClosure", "count"),
+        trafficSum=("trafficSum", "sum"),
+        trafficCountAadv=("trafficCountAadv", "sum"),
+    )
+
 
+def _combine_partials(partials):
+    """Sums accumulators of _partial_sums key by key."""
+    if len(partials) == 1:
+        return partials[0]
+    combined = pd.concat(partials)
+    return combined.groupby(level=list(range(combined.index.nlevels)), observed=True).sum()
+
+
+def _push_partial(stack, partial, batches=1):
+    """
+        Pushes the partial sums of `batches` batches onto stack, merging the newest two entries while they cover
+        the same number of batches (a binary counter): each key is re-summed O(log batches) times and only
+        O(log batches) frames are kept, instead of realigning one running total on every chunk.
+    """
+    stack.append((batches, partial))
+    while len(stack) > 1 and stack[-2][0] == stack[-1][0]:
+        (n, first), (_, second) = stack[-2:]
+        stack[-2:] = [(2 * n, _combine_partials([first, second]))]
+
+
+def aggregate_history_chunks(chunks, orig):
+    """
+        Same result as aggregate_history, but folds the raw rows chunk by chunk into running
+        sum/count accumulators keyed by GROUPBY_COLUMNS_POS, so only the accumulators are kept in memory.
+        Chunks are buffered up to BATCH_ROWS raw rows and aggregated together, so small chunks don't pay the
+        preparation and groupby of every chunk.
+    :param chunks: iterable of raw history DataFrames (HISTORY_COLUMNS), e.g. read_history(..., chunksize=n)
+    :param orig: origin airport code
+    :return: one row per GROUPBY_COLUMNS_FLIGHT_ID key
+    """
+    buffered, buffered_rows, stack = [], 0, []
+    for chunk in chunks:
+        buffered.append(chunk)
+        buffered_rows += len(chunk)
+        if buffered_rows >= BATCH_ROWS:
+            _push_partial(stack, _partial_sums(pd.concat(buffered, ignore_index=True), orig))
+            buffered, buffered_rows = [], 0
+    if buffered:
+        _push_partial(stack, _partial_sums(pd.concat(buffered, ignore_index=True), orig))
+
+    if not stack:
+        return aggregate_history(prepare_history(pd.DataFrame(columns=HISTORY_COLUMNS), orig))
+
+    # the categories differ between chunks, so the accumulated keys are plain objects again
+    ret_data = apply_schema(_combine_partials([partial for _, partial in stack]).sort_index().reset_index())
+    # mean across points of sale (0/0 gives NaN like the mean of an all-null group)
+    ret_data["fracClosure"] = ret_data.pop("fracClosureSum") / ret_data.pop("fracClosureCount")
+    agg_columns_flight_id = {"fracClosure": "mean", "trafficSum": "mean", "trafficCountAadv": "mean"}
+    ret_data = ret_data.groupby(GROUPBY_COLUMNS_FLIGHT_ID, as_index=False, observed=True).agg(agg_columns_flight_id)
+    return apply_schema(ret_data)
+
+
+def finish_history(ret_data):
+    """
+        Pivot the aggregated history wide on forecastClass and add the holiday/calendar features.
+    :param ret_data: output of aggregate_history
+    :return: DataFrame as returned by pull_data
+    """
     # Rename column
     ret_data = ret_data.rename(columns={"trafficSum": "trafficActual"})
 
     ret_data = ret_data.rename(columns={"trafficCountAadv": "trafficActualAadv"})
 
-    DATA_INDEX = [
-        "snapshotDate",
-        "origin",
-        "destination",
-        "forecastId",
-        "forecastDepartureDate",
-        "forecastDayOfWeek",
-        "poolCode",
-        "cabinCode",
-        "forecastPeriod",
-        "localFlowIndicator",
-        "flightDepartureDate",
-    ]
-
-    # Group input data by PoS & FlightId to compute traffic/closure sum & average
-    # input_df = self.aggregate_input_data(self.data_frame)
-
-    ret_data.set_index(DATA_INDEX, inplace=True)
+    ret_data = ret_data.set_index(DATA_INDEX)
 
     pivot_value_columns = ["fracClosure", "trafficActual", "trafficActualAadv"]
 
-    df = multi_index_pivot(
+    df = wide_pivot(
       ret_data,
       columns="forecastClass",
       values=pivot_value_columns,
@@ -438,52 +598,54 @@ def pull_data(orig,dest,fcst_id,new_market):
     )
 
     add_holiday_features(df)
-    df['weekNumber'] = pd.DatetimeIndex(df['forecastDepartureDate']).week
-    df['week_x'] = df['weekNumber'].map(wk_map_x)
-    df['week_y'] = df['weekNumber'].map(wk_map_y)
+    # weekNumber, week_x/week_y and dow_x/dow_y
+    add_cyclic_features(df)
 #     add_day_columns(df, 'forecastDayOfWeek')
 #     df = add_week_binary(df, "weekNumber")
-    df['dow_x'] = df['forecastDayOfWeek'].map(dow_map_x)
-    df['dow_y'] = df['forecastDayOfWeek'].map(dow_map_y)
 
 
     return(df)
 
-def pull_seas(df,orig,dest):
-    week_query = f"""SELECT /*+PARALLEL(8)*/ *
-    FROM OR_LOAD.KRONOS_WEEK_SEASONALITY
-    where 1=1
-    and leg_orig = '{orig}' and leg_dest = '{dest}' 
-    and cabin_code = 'Y'
+
+def pull_seas(df,orig,dest,con=None,reference=None,seasonality=None):
+    """
+        Merge the week-of-year and day-of-week seasonality of the market into df.
+    :param con: optional HERCCRT connection, defaults to the shared one of connections.manager
+    :param reference: optional reference_data.ReferenceSnapshot, the seasonality is then looked up in memory
+    :param seasonality: optional seasonality.SeasonalityEngine, the seasonality is then computed locally from
+        the history instead of read from the KRONOS_*_SEASONALITY tables
     """
-    week_seas = pd.read_sql(week_query, con=hrc)
+    source = seasonality if seasonality is not None else reference
+    if source is not None:
+        week_seas = source.week_seasonality(orig, dest)
+        dow_seas = source.dow_seasonality(orig, dest)
+        return merge_seas(df, week_seas, dow_seas)
+
+    params = {"orig": orig, "dest": dest, "cabin": "Y"}
+    week_seas = datasource.read("week_seasonality", params, con=con)
     week_seas.columns = ['origin','destination','cabinCode','localFlowIndicator','weekNumber','avgtraffic',
                       'avgtrafficopenness','avgrasm']
 
-    dow_query = f"""SELECT /*+PARALLEL(8)*/ *
-    FROM OR_LOAD.KRONOS_DOW_SEASONALITY
-    where 1=1
-    and leg_orig = '{orig}' and leg_dest = '{dest}' 
-    and cabin_code = 'Y'
-    """
-
-    dow_seas = pd.read_sql(dow_query, con=hrc)
+    dow_seas = datasource.read("dow_seasonality", params, con=con)
     dow_seas.columns = ['origin','destination','cabinCode','localFlowIndicator','forecastDayOfWeek','dowavgtraffic',
                       'dowavgtrafficopenness','dowavgrasm']
 
-    pool_query = f"""SELECT /*+PARALLEL(8)*/ *
-    FROM OR_LOAD.KRONOS_POOL_SEASONALITY
-    where 1=1
-    and leg_orig = '{orig}' and leg_dest = '{dest}' 
-    and cabin_code = 'Y'
-    """
-
-    pool_seas = pd.read_sql(pool_query, con=hrc)
+    pool_seas = datasource.read("pool_seasonality", params, con=con)
     pool_seas.columns = ['origin','destination','cabinCode','poolCode','poolrasm']
 
+    return merge_seas(df, week_seas, dow_seas)
+
+
+def merge_seas(df, week_seas, dow_seas):
+    """
+        Join the week and dow seasonality rows of the market (pull_seas column names) into df.
+    """
     df['weekNumber'] = pd.DatetimeIndex(df['forecastDepartureDate']).week
+    dtypes = df.dtypes
     df = pd.merge(df, week_seas, on=['origin','destination','cabinCode','localFlowIndicator','weekNumber'])
     df = pd.merge(df, dow_seas, on=['origin','destination','cabinCode','localFlowIndicator','forecastDayOfWeek'])
 #     df = pd.merge(df, pool_seas, on=['origin','destination','cabinCode','poolCode'])
 
-    return(df)
\ No newline at end of file
+    # merging on object keys upcasts the categorical/small int keys of df
+    restore_dtypes(df, dtypes)
+    return apply_schema(df)
\ No newline at end of file
@@ -0,0 +1,582 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional, execute() then builds the frames like pd.read_sql
+    pa = None
+
+# ---------- Named, parameterised statements (bind variables) for every pull of the pipeline:
+
+# Client side statement cache of the cx_Oracle connections (statements kept parsed per connection)
+STATEMENT_CACHE_SIZE = 50
+
+# Bind placeholder style of each backend: cx_Oracle takes named binds, pyodbc (Teradata) qmark
+PARAM_STYLES = {"herccrt": "named", "mosaic": "qmark", "azure": "qmark"}
+
+# Fetch through Arrow record batches when pyarrow is installed and the statement declares its column types
+USE_ARROW = True
+
+
+class Statement:
+    """One named SQL statement of a backend.
+
+    The SQL text only depends on which optional filters are set (never on their values), so a multi-market run
+    reuses a handful of statements and the database plan cache stays warm.
+    """
+
+    def __init__(self, name, backend, sql, filters=None, arraysize=1000, prefetchrows=None, arrow_types=None):
+        """
+        Args:
+            name (string): Logical query name (same keys as datasource.LOGICAL_QUERIES)
+            backend (string): "herccrt" or "mosaic"
+            sql (string): Statement text with a {filters} slot
+            filters (dict, optional): param -> filter line, "{}" marks the bind placeholder. Defaults to None.
+            arraysize (int, optional): Rows fetched per round trip. Defaults to 1000.
+            prefetchrows (int, optional): Rows returned with the execute call (cx_Oracle). Defaults to arraysize.
+            arrow_types (list, optional): pyarrow type alias of each result column, in order ("string", "int64",
+                "float64", "date32[day]", "time64[us]"). Defaults to None (no Arrow fetch path).
+        """
+        self.name = name
+        self.backend = backend
+        self.sql = sql
+        self.filters = filters or {}
+        self.arraysize = arraysize
+        self.prefetchrows = arraysize if prefetchrows is None else prefetchrows
+        self.arrow_types = arrow_types
+
+    def render(self, params):
+        """SQL text + bind values for the given parameters (None parameters leave their filter out).
+
+        Args:
+            params (dict): param -> value
+
+        Returns:
+            tuple: (sql, binds), binds is a dict for named backends and a list for qmark ones
+        """
+        unknown = set(params) - set(self.filters)
+        if unknown:
+            raise ValueError(f"Unknown parameters for {self.name}: {sorted(unknown)}")
+
+        named = PARAM_STYLES[self.backend] == "named"
+        lines, binds = [], ({} if named else [])
+        for param, line in self.filters.items():
+            value = params.get(param)
+            if value is None:
+                continue
+            if named:
+                # prefixed so that no bind name collides with a reserved word (:end, :date, ...)
+                lines.append(line.format(f":p_{param}"))
+                binds[f"p_{param}"] = value
+            else:
+                lines.append(line.format("?"))
+                binds.append(value)
+        return self.sql.format(filters="\n    ".join(lines)), binds
+
+
+HISTORY_FILTERS = {
+    "orig": "and LEG_ORIG = {}",
+    "dest": "and leg_dest = {}",
+    "fcst_id": "AND fcst_id = {}",
+    "start": "AND FLT_DPTR_DATE >= TO_DATE({}, 'YYYY-MM-DD')",
+    "end": "AND FLT_DPTR_DATE < TO_DATE({}, 'YYYY-MM-DD')",
+}
+
+SEASONALITY_FILTERS = {
+    "orig": "and leg_orig = {}",
+    "dest": "and leg_dest = {}",
+    "cabin": "and cabin_code = {}",
+}
+
+STATEMENTS = {}
+
+
+def register(statement):
+    STATEMENTS[statement.name] = statement
+    return statement
+
+
+register(
+    Statement(
+        "fcst_history",
+        "herccrt",
+        """SELECT /*+PARALLEL(8)*/  TO_CHAR(FLT_DPTR_DATE, 'YYYY-MM-DD') FLT_DPTR_DATE,
+    FCST_CLS,
+    CABIN_CODE,
+    LCL_FLW_IND,
+    FCST_PERIOD,
+    FRAC_CLOSURE,
+    FRAC_CLOSURE_BELOW,
+    TRAFFIC_CT,
+    NVL(TRAFFIC_CT_AADV, 0) TRAFFIC_CT_AADV,
+    POOL_CD,
+    DOW,
+    nvl(FCST_ID,0) FCST_ID,
+    FLT_ID,
+    POS_IND,
+    TO_CHAR(TRUNC(SYSDATE),'YYYY-MM-DD') SNAPSHOT_DATE,
+    LEG_DEST
+    FROM fcst_history_v
+    WHERE 1=1
+    {filters}
+    AND BAD_HIST_IND='N'
+    AND CABIN_CODE = 'Y'
+    and dow in (1,2,3,4,5,6,7)
+    and POOL_CD != 'I'
+    """,
+        HISTORY_FILTERS,
+        arraysize=10000,
+        arrow_types=[
+            "string",
+            "int64",
+            "string",
+            "string",
+            "int64",
+            "float64",
+            "float64",
+            "float64",
+            "float64",
+            "string",
+            "int64",
+            "int64",
+            "int64",
+            "string",
+            "string",
+            "string",
+        ],
+    )
+)
+
+# Same rows as aggregate_history on fcst_history: the inner GROUP BY combines the points of sale (mean fracClosure,
+# sum of traffic), the outer one the flight-id's (means). The constant CABIN_CODE / SNAPSHOT_DATE are not sent.
+# Rows with a null group key are filtered out, as pandas' groupby drops them.
+register(
+    Statement(
+        "fcst_history_agg",
+        "herccrt",
+        """SELECT FLT_DPTR_DATE,
+    FCST_CLS,
+    LCL_FLW_IND,
+    FCST_PERIOD,
+    AVG(FRAC_CLOSURE) FRAC_CLOSURE,
+    AVG(TRAFFIC_SUM) TRAFFIC_SUM,
+    AVG(TRAFFIC_CT_AADV) TRAFFIC_CT_AADV,
+    POOL_CD,
+    DOW,
+    FCST_ID,
+    LEG_DEST
+    FROM (
+        SELECT /*+PARALLEL(8)*/  TO_CHAR(FLT_DPTR_DATE, 'YYYY-MM-DD') FLT_DPTR_DATE,
+        FCST_CLS,
+        LCL_FLW_IND,
+        FCST_PERIOD,
+        AVG(FRAC_CLOSURE) FRAC_CLOSURE,
+        NVL(SUM(TRAFFIC_CT + NVL(TRAFFIC_CT_AADV, 0)), 0) TRAFFIC_SUM,
+        NVL(SUM(NVL(TRAFFIC_CT_AADV, 0)), 0) TRAFFIC_CT_AADV,
+        POOL_CD,
+        DOW,
+        nvl(FCST_ID,0) FCST_ID,
+        FLT_ID,
+        LEG_DEST
+        FROM fcst_history_v
+        WHERE 1=1
+    {filters}
+        AND BAD_HIST_IND='N'
+        AND CABIN_CODE = 'Y'
+        and dow in (1,2,3,4,5,6,7)
+        and POOL_CD != 'I'
+        AND FLT_DPTR_DATE IS NOT NULL
+        AND FCST_CLS IS NOT NULL
+        AND LCL_FLW_IND IS NOT NULL
+        AND FCST_PERIOD IS NOT NULL
+        AND FLT_ID IS NOT NULL
+        AND LEG_DEST IS NOT NULL
+        GROUP BY TO_CHAR(FLT_DPTR_DATE, 'YYYY-MM-DD'), FCST_CLS, LCL_FLW_IND, FCST_PERIOD,
+            POOL_CD, DOW, nvl(FCST_ID,0), FLT_ID, LEG_DEST
+    )
+    GROUP BY FLT_DPTR_DATE, FCST_CLS, LCL_FLW_IND, FCST_PERIOD, POOL_CD, DOW, FCST_ID, LEG_DEST
+    """,
+        HISTORY_FILTERS,
+        arraysize=5000,
+        arrow_types=[
+            "string",
+            "int64",
+            "string",
+            "int64",
+            "float64",
+            "float64",
+            "float64",
+            "string",
+            "int64",
+            "int64",
+            "string",
+        ],
+    )
+)
+
+# Size of every market of fcst_history_v (market_index.py): raw rows, distinct (departure, lfi, period, pool, dow)
+# points, i.e. the rows pull_data returns, and the first / last departure. Same predicates as fcst_history.
+register(
+    Statement(
+        "fcst_history_stats",
+        "herccrt",
+        """SELECT /*+PARALLEL(8)*/ LEG_ORIG,
+    LEG_DEST,
+    nvl(FCST_ID,0) FCST_ID,
+    COUNT(*) N_ROWS,
+    COUNT(DISTINCT TO_CHAR(FLT_DPTR_DATE, 'YYYY-MM-DD') || '|' || LCL_FLW_IND || '|' || FCST_PERIOD || '|' || POOL_CD
+        || '|' || DOW) N_POINTS,
+    TO_CHAR(MIN(FLT_DPTR_DATE), 'YYYY-MM-DD') FIRST_DPTR_DATE,
+    TO_CHAR(MAX(FLT_DPTR_DATE), 'YYYY-MM-DD') LAST_DPTR_DATE
+    FROM fcst_history_v
+    WHERE 1=1
+    {filters}
+    AND BAD_HIST_IND='N'
+    AND CABIN_CODE = 'Y'
+    and dow in (1,2,3,4,5,6,7)
+    and POOL_CD != 'I'
+    GROUP BY LEG_ORIG, LEG_DEST, nvl(FCST_ID,0)
+    """,
+        HISTORY_FILTERS,
+        arraysize=5000,
+        arrow_types=["string", "string", "int64", "int64", "int64", "string", "string"],
+    )
+)
+
+# origin, destination, cabin, lfi/pool code, then the (week / day of week) number and the averages
+for _name, _table, _types in [
+    ("week_seasonality", "KRONOS_WEEK_SEASONALITY", ["string"] * 4 + ["int64"] + ["float64"] * 3),
+    ("dow_seasonality", "KRONOS_DOW_SEASONALITY", ["string"] * 4 + ["int64"] + ["float64"] * 3),
+    ("pool_seasonality", "KRONOS_POOL_SEASONALITY", ["string"] * 4 + ["float64"]),
+]:
+    register(
+        Statement(
+            _name,
+            "herccrt",
+            f"""SELECT /*+PARALLEL(8)*/ *
+    FROM OR_LOAD.{_table}
+    where 1=1
+    {{filters}}
+    """,
+            SEASONALITY_FILTERS,
+            arraysize=1000,
+            arrow_types=_types,
+        )
+    )
+
+register(
+    Statement(
+        "fcst_destinations",
+        "herccrt",
+        """select Distinct LEG_DEST_S as dest
+    from fcst.fcst_id_ref
+    where 1=1
+    {filters}
+    """,
+        {"orig": "and LEG_ORIG_S = {}"},
+        arraysize=500,
+    )
+)
+
+register(
+    Statement(
+        "fcst_ids",
+        "herccrt",
+        """select Distinct LEG_ORIG_S as orig, LEG_DEST_S as dest, FCST_ID as fcst_id,
+            TIME_BAND_START as time_band_start, TIME_BAND_END as time_band_end
+    from fcst.fcst_id_ref
+    where 1=1
+    {filters}
+    order by 1,2,3,4
+    """,
+        {"orig": "and LEG_ORIG_S = {}", "dest": "and LEG_DEST_S = {}"},
+        arraysize=500,
+    )
+)
+
+register(
+    Statement(
+        "prd_maps",
+        "herccrt",
+        """select DISTINCT leg_orig as origin, leg_dest as destination, fcst_period as forecastPeriod,
+            rrd_band_start_i as rrd_start, rrd_band_end_i as rrd_end
+    from market_xref a
+    join FCST.FCST_PERIOD_REF b
+    on a.infl_period_id = b.FCST_PERIOD_ID
+    where 1=1
+    {filters}
+    ORDER BY forecastPeriod
+    """,
+        {
+            "cabin": "and cabin_code = {}",
+            "orig": "and leg_orig = {}",
+            "dest": "and leg_dest = {}",
+            "lfi": "and lcl_flw_ind = {}",
+        },
+        arraysize=100,
+    )
+)
+
+register(
+    Statement(
+        "prd_maps_network",
+        "herccrt",
+        """select DISTINCT leg_orig as origin, leg_dest as destination, fcst_period as forecastPeriod,
+            rrd_band_start_i as rrd_start, rrd_band_end_i as rrd_end, cabin_code, lcl_flw_ind
+    from market_xref a
+    join FCST.FCST_PERIOD_REF b
+    on a.infl_period_id = b.FCST_PERIOD_ID
+    where 1=1
+    {filters}
+    ORDER BY forecastPeriod
+    """,
+        arraysize=5000,
+    )
+)
+
+register(
+    Statement(
+        "oag",
+        "mosaic",
+        """select DEP_AIRPRT_IATA_CD as orig,
+            ARVL_AIRPRT_IATA_CD as dest,
+            LOCAL_DEP_DT as dep_date,
+            DEP_MINUTE_PAST_MDNGHT_QTY as dep_mam,
+            FLIGHT_SCHD_PUBLSH_DT as snapshot_date,
+            OPERAT_AIRLN_IATA_CD as airline,
+            OPERAT_FLIGHT_NBR as flt_id, -- Flight Number
+            EQUIP_COACH_CABIN_SEAT_QTY as seats,
+            ASMS_QTY as asm,
+            EQUIP_COACH_CABIN_SEAT_QTY * MILE_GREAT_CIRCLE_DISTANC_QTY as asm_y -- ASM for Coach Cabin
+    from PROD_INDSTR_FLIGHT_SCHD_VW.OAG_CURR
+    where 1=1
+    {filters}
+    and OPERAT_PAX_FLIGHT_IND = 'Y' -- new field that determines if record is a scheduled operating flight record
+    and FLIGHT_OAG_PUBLSH_CD <> 'X' -- record is active and not cancelled
+    order by 1,2,3,4,5
+    """,
+        {
+            "orig": "and DEP_AIRPRT_IATA_CD = {}",
+            "dest": "and ARVL_AIRPRT_IATA_CD = {}",
+            "start": "and LOCAL_DEP_DT >= CAST({} AS DATE)",
+            "end": "and LOCAL_DEP_DT <= CAST({} AS DATE)",
+        },
+        arraysize=5000,
+        arrow_types=[
+            "string",
+            "string",
+            "date32[day]",
+            "int64",
+            "date32[day]",
+            "string",
+            "int64",
+            "int64",
+            "float64",
+            "float64",
+        ],
+    )
+)
+
+register(
+    Statement(
+        "cap",
+        "mosaic",
+        """select LEG_DEP_AIRPRT_IATA_CD as orig,
+            LEG_ARVL_AIRPRT_IATA_CD as dest,
+            SCHD_LEG_DEP_DT as dep_date,
+            SCHD_LEG_DEP_TM as dep_time,
+            FILE_SNPSHT_DT as snapshot_date,
+            LEG_CABIN_CD as cabin,
+            OPERAT_AIRLN_IATA_CD as airline,
+            MKT_FLIGHT_NBR as flt_id,  --Flight Number
+            CABIN_CAPCTY_SEAT_QTY as seats,
+            CAB_ASM_QTY as asm,
+            CAB_TOT_RPM_QTY as rpm,
+            CAB_TOT_REVNUE_AMT as rev,
+            CAB_TOT_PAX_QTY as pax
+    from PROD_RM_BUSINES_VW.LIFE_OF_FLIGHT_LEG_CABIN
+    where 1=1
+    and FILE_SNPSHT_DT = SCHD_LEG_DEP_DT-1 -- only extract the data one day before departure
+    {filters}
+    order by 1,2,3,4,5
+    """,
+        {
+            "orig": "and LEG_DEP_AIRPRT_IATA_CD = {}",
+            "dest": "and LEG_ARVL_AIRPRT_IATA_CD = {}",
+            "start": "and SCHD_LEG_DEP_DT >= CAST({} AS DATE)",
+            "end": "and SCHD_LEG_DEP_DT <= CAST({} AS DATE)",
+            "cabin": "and LEG_CABIN_CD = {}",
+        },
+        arraysize=5000,
+        arrow_types=[
+            "string",
+            "string",
+            "date32[day]",
+            "time64[us]",
+            "date32[day]",
+            "string",
+            "string",
+            "int64",
+            "int64",
+            "float64",
+            "float64",
+            "float64",
+            "int64",
+        ],
+    )
+)
+
+
+# ---------- Execution (cached cursors per connection, thread and statement text):
+
+_lock = threading.Lock()
+_cursors = {}  # (id(connection), thread id) -> (connection, {sql: cursor})
+
+
+def _cursor(con, statement, sql):
+    """Returns the cached cursor of (connection, calling thread, statement text), tuned with the statement fetch sizes.
+
+    Threads sharing a connection (e.g. manager.get()'s) each get their own cursors, so one thread never executes
+    on a cursor another thread is still fetching from.
+    """
+    key = (id(con), threading.get_ident())
+    with _lock:
+        entry = _cursors.get(key)
+        if entry is None or entry[0] is not con:
+            if getattr(con, "stmtcachesize", STATEMENT_CACHE_SIZE) < STATEMENT_CACHE_SIZE:
+                con.stmtcachesize = STATEMENT_CACHE_SIZE
+            entry = _cursors[key] = (con, {})
+        cursor = entry[1].get(sql)
+        if cursor is None:
+            cursor = entry[1][sql] = _new_cursor(con, statement)
+        return cursor
+
+
+def _new_cursor(con, statement):
+    cursor = con.cursor()
+    cursor.arraysize = statement.arraysize
+    if hasattr(cursor, "prefetchrows"):
+        cursor.prefetchrows = statement.prefetchrows
+    return cursor
+
+
+def forget(con):
+    """Drops the cached cursors of a connection, of every thread (call before closing it)."""
+    with _lock:
+        keys = [key for key in _cursors if key[0] == id(con)]
+        entries = [_cursors.pop(key) for key in keys]
+    for entry in entries:
+        for cursor in entry[1].values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+
+
+def _frame(rows, columns):
+    # same conversion as pd.read_sql
+    return pd.DataFrame.from_records(list(rows), columns=columns, coerce_float=True)
+
+
+def _arrow_column(values, arrow_type, name):
+    try:
+        return pa.array(values, type=arrow_type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # e.g. Decimal values of a float64 column or digits in a CHAR column: infer, then cast
+        try:
+            return pa.array(values).cast(arrow_type)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as error:
+            raise TypeError(f"Column {name} does not match its declared Arrow type {arrow_type}: {error}") from error
+
+
+def _record_batch(rows, schema):
+    """Builds a typed Arrow record batch from driver row tuples (one array per column).
+
+    cx_Oracle and pyodbc only fetch rows, so the fetched batch is copied once into a 2-D object buffer and each
+    column slice of it goes to pa.array, with no Python list per column.
+    """
+    buffer = np.empty((len(rows), len(schema)), dtype=object)
+    if rows:
+        buffer[:] = rows
+    arrays = [_arrow_column(buffer[:, position], field.type, field.name) for position, field in enumerate(schema)]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _arrow_frame(batches, schema):
+    # zero-copy where the column layout allows it (numeric columns without nulls)
+    table = pa.Table.from_batches(batches, schema=schema)
+    return table.to_pandas(date_as_object=False, split_blocks=True, self_destruct=True)
+
+
+def _arrow_schema(statement, columns, arrow):
+    """Arrow schema of a result, None when the pandas conversion is used."""
+    use_arrow = USE_ARROW if arrow is None else arrow
+    if not use_arrow or pa is None or statement.arrow_types is None:
+        return None
+    if len(statement.arrow_types) != len(columns):
+        # table layout differs from the declaration (SELECT *), don't guess the types
+        return None
+    return pa.schema([(column, pa.type_for_alias(alias)) for column, alias in zip(columns, statement.arrow_types)])
+
+
+def execute(name, params, con, chunksize=None, arrow=None):
+    """Runs a named statement with bind variables.
+
+    With pyarrow installed and declared column types, the rows are fetched in arraysize batches into typed
+    Arrow record batches (numbers, dates and times already converted) and the DataFrame is built from them;
+    otherwise the rows are converted like pd.read_sql does.
+
+    Args:
+        name (string): Key of STATEMENTS
+        params (dict): Statement parameters (None values leave their filter out)
+        con (Connection): Open cx_Oracle / pyodbc connection of the statement backend
+        chunksize (int, optional): Return an iterator of DataFrames of at most chunksize rows. Defaults to None.
+        arrow (bool, optional): Force (True) or disable (False) the Arrow fetch path. Defaults to USE_ARROW.
+
+    Returns:
+        pd.DataFrame: Query result (or an iterator of DataFrames with chunksize)
+    """
+    statement = STATEMENTS[name]
+    sql, binds = statement.render(params)
+    if chunksize is not None:
+        # the cursor stays open while the chunks are consumed, so it is not shared through the cache
+        return _iter_chunks(_new_cursor(con, statement), statement, sql, binds, chunksize, arrow)
+
+    cursor = _cursor(con, statement, sql)
+    cursor.execute(sql, binds)
+    columns = [column[0] for column in cursor.description]
+    schema = _arrow_schema(statement, columns, arrow)
+    if schema is None:
+        return _frame(cursor.fetchall(), columns)
+
+    batches = []
+    while True:
+        rows = cursor.fetchmany(statement.arraysize)
+        if not rows:
+            break
+        batches.append(_record_batch(rows, schema))
+    return _arrow_frame(batches, schema)
+
+
+def _iter_chunks(cursor, statement, sql, binds, chunksize, arrow):
+    try:
+        cursor.execute(sql, binds)
+        columns = [column[0] for column in cursor.description]
+        schema = _arrow_schema(statement, columns, arrow)
+        read_rows = False
+        while True:
+            rows = cursor.fetchmany(chunksize)
+            if not rows and read_rows:
+                break
+            # like pd.read_sql, an empty result still gives one (empty) chunk
+            read_rows = True
+            if schema is None:
+                yield _frame(rows, columns)
+            else:
+                yield _arrow_frame([_record_batch(rows, schema)], schema)
+            if not rows:
+                break
+    finally:
+        cursor.close()
@@ -0,0 +1,139 @@
+from datetime import datetime
+
+import pandas as pd
+
+import datasource
+
+# ---------- Network-wide reference data (seasonality, fcst_id bands, period maps), loaded once per run:
+
+# Bump when the layout of the saved snapshot changes
+SNAPSHOT_FORMAT = 1
+
+WEEK_SEASONALITY_COLUMNS = [
+    "origin",
+    "destination",
+    "cabinCode",
+    "localFlowIndicator",
+    "weekNumber",
+    "avgtraffic",
+    "avgtrafficopenness",
+    "avgrasm",
+]
+DOW_SEASONALITY_COLUMNS = [
+    "origin",
+    "destination",
+    "cabinCode",
+    "localFlowIndicator",
+    "forecastDayOfWeek",
+    "dowavgtraffic",
+    "dowavgtrafficopenness",
+    "dowavgrasm",
+]
+POOL_SEASONALITY_COLUMNS = ["origin", "destination", "cabinCode", "poolCode", "poolrasm"]
+
+# Same columns (and order) as get_fcst_given_leg and get_prdMaps return
+FCST_ID_COLUMNS = ["ORIG", "DEST", "FCST_ID", "TIME_BAND_START", "TIME_BAND_END"]
+PRD_MAP_COLUMNS = ["ORIGIN", "DESTINATION", "FORECASTPERIOD", "RRD_START", "RRD_END"]
+
+
+def _index(df, keys):
+    """dict of key tuple -> rows of that key (index reset)."""
+    return {key: rows.reset_index(drop=True) for key, rows in df.groupby(keys, sort=False)}
+
+
+class ReferenceSnapshot:
+    """In-memory copy of the small reference tables of the whole network:
+    KRONOS_WEEK/DOW/POOL_SEASONALITY, fcst.fcst_id_ref and market_xref x FCST_PERIOD_REF.
+
+    The tables are pulled once (from_database) or read back from disk (read), then every market lookup is a
+    dict access keyed by (orig, dest, cabin, lfi) instead of a database round trip.
+    """
+
+    def __init__(self, tables, version=None):
+        """
+        Args:
+            tables (dict): name -> DataFrame for "week", "dow", "pool", "fcst_id" and "prd_map"
+            version (string, optional): Version stamp of the snapshot. Defaults to the current time (YYYYMMDDHHMMSS).
+        """
+        self.tables = tables
+        self.version = version or datetime.now().strftime("%Y%m%d%H%M%S")
+
+        week, dow, pool = tables["week"], tables["dow"], tables["pool"]
+        fcst_id, prd_map = tables["fcst_id"], tables["prd_map"]
+
+        self._week = _index(week, ["origin", "destination", "cabinCode"])
+        self._week_lfi = _index(week, ["origin", "destination", "cabinCode", "localFlowIndicator"])
+        self._dow = _index(dow, ["origin", "destination", "cabinCode"])
+        self._dow_lfi = _index(dow, ["origin", "destination", "cabinCode", "localFlowIndicator"])
+        self._pool = _index(pool, ["origin", "destination", "cabinCode"])
+        self._fcst_id = _index(fcst_id, ["ORIG", "DEST"])
+        self._dests = {orig: sorted(rows["DEST"].unique()) for orig, rows in fcst_id.groupby("ORIG", sort=False)}
+        self._prd_map = {
+            key: rows[PRD_MAP_COLUMNS].drop_duplicates().sort_values("FORECASTPERIOD").reset_index(drop=True)
+            for key, rows in prd_map.groupby(["ORIGIN", "DESTINATION", "CABIN_CODE", "LCL_FLW_IND"], sort=False)
+        }
+
+    @classmethod
+    def from_database(cls, hcrt=None):
+        """Pulls every reference table for the whole network (one query per table).
+
+        Args:
+            hcrt (cx_Oracle.Connection, optional): herccrt().con(). Defaults to the shared connection of connections.manager.
+
+        Returns:
+            ReferenceSnapshot: snapshot of the current reference data
+        """
+        week = datasource.read("week_seasonality", {}, con=hcrt)
+        week.columns = WEEK_SEASONALITY_COLUMNS
+        dow = datasource.read("dow_seasonality", {}, con=hcrt)
+        dow.columns = DOW_SEASONALITY_COLUMNS
+        pool = datasource.read("pool_seasonality", {}, con=hcrt)
+        pool.columns = POOL_SEASONALITY_COLUMNS
+
+        fcst_id = datasource.read("fcst_ids", {}, con=hcrt)
+        fcst_id.columns = FCST_ID_COLUMNS
+        prd_map = datasource.read("prd_maps_network", {}, con=hcrt)
+        prd_map.columns = PRD_MAP_COLUMNS + ["CABIN_CODE", "LCL_FLW_IND"]
+        return cls({"week": week, "dow": dow, "pool": pool, "fcst_id": fcst_id, "prd_map": prd_map})
+
+    @classmethod
+    def read(cls, path):
+        """Reads a snapshot saved with write()."""
+        saved = pd.read_pickle(path)
+        if saved["format"] != SNAPSHOT_FORMAT:
+            raise ValueError(f"Reference snapshot {path} has format {saved['format']}, expected {SNAPSHOT_FORMAT}")
+        return cls(saved["tables"], saved["version"])
+
+    def write(self, path):
+        """Saves the snapshot (tables + version stamp) to a pickle file."""
+        pd.to_pickle({"format": SNAPSHOT_FORMAT, "version": self.version, "tables": self.tables}, path)
+
+    # ---------- Lookups:
+
+    def week_seasonality(self, orig, dest, cabin="Y", lfi=None):
+        """Rows of KRONOS_WEEK_SEASONALITY for a market (columns as in pull_seas)."""
+        if lfi is None:
+            return self._week.get((orig, dest, cabin), self.tables["week"].iloc[:0])
+        return self._week_lfi.get((orig, dest, cabin, lfi), self.tables["week"].iloc[:0])
+
+    def dow_seasonality(self, orig, dest, cabin="Y", lfi=None):
+        """Rows of KRONOS_DOW_SEASONALITY for a market (columns as in pull_seas)."""
+        if lfi is None:
+            return self._dow.get((orig, dest, cabin), self.tables["dow"].iloc[:0])
+        return self._dow_lfi.get((orig, dest, cabin, lfi), self.tables["dow"].iloc[:0])
+
+    def pool_seasonality(self, orig, dest, cabin="Y"):
+        """Rows of KRONOS_POOL_SEASONALITY for a market (columns as in pull_seas)."""
+        return self._pool.get((orig, dest, cabin), self.tables["pool"].iloc[:0])
+
+    def destinations(self, orig):
+        """Same list as find_all_dest_given_leg (sorted)."""
+        return list(self._dests.get(orig, []))
+
+    def fcst_ids(self, orig, dest):
+        """Same DataFrame as get_fcst_given_leg."""
+        return self._fcst_id.get((orig, dest), pd.DataFrame(columns=FCST_ID_COLUMNS))
+
+    def prd_maps(self, orig, dest, cabin="Y", lfi="L"):
+        """Same DataFrame as get_prdMaps."""
+        return self._prd_map.get((orig, dest, cabin, lfi), pd.DataFrame(columns=PRD_MAP_COLUMNS))
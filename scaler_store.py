@@ -0,0 +1,115 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# ---------- Persistent min/max scaling state (fit incrementally on training, reused as is for scoring):
+
+
+class ScalerStore:
+    """Min/max per (group, market, fcst_id, column), the state of sklearn's minmax_scale kept between runs.
+
+    update() skips the rows departed on or before the last flown date it saw for a market / fcst_id (their values no
+    longer change), so refreshing the state is O(departures not flown yet); transform() scales with the stored state,
+    so future-only scoring frames get the scale the model was trained with instead of one refit on whatever rows they
+    contain. The state is a small JSON file,
+    saved next to the model.
+    """
+
+    def __init__(self, state=None):
+        """
+        Args:
+            state (dict, optional): "group|market|fcst_id" -> {"flown_until": date or None, "columns": {column: [min, max]}}. Defaults to None (empty).
+        """
+        self.state = state or {}
+
+    @staticmethod
+    def key(group, market, fcst_id):
+        """State key, e.g. ("oag", "ORD-DFW", 3) -> "oag|ORD-DFW|3"."""
+        return f"{group}|{market}|{fcst_id}"
+
+    @classmethod
+    def read(cls, path):
+        """Reads a store saved with write()."""
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def write(self, path):
+        """Saves the state to a JSON file (e.g. next to the saved model)."""
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+
+    def update(self, group, market, fcst_id, df, columns, date_column=None, as_of=None):
+        """Widens the stored min/max of the columns with the rows of df not flown yet at the last update.
+
+        The departures on or after as_of are scanned again by every update, as later snapshots revise their values.
+
+        Args:
+            group (string): Feature set the columns belong to, e.g. "oag" or "oag_cap"
+            market (string): Market, e.g. "ORD-DFW"
+            fcst_id (int): Forecast id
+            df (pd.DataFrame): Rows (unscaled)
+            columns (list): Columns to track
+            date_column (str, optional): Departure date column; only the rows after the last flown date are scanned. Defaults to None (every row).
+            as_of (string, optional): 'YYYY-MM-DD' observation date of df, the departures before it have flown. Defaults to None (today).
+
+        Returns:
+            ScalerStore: self
+        """
+        entry = self.state.setdefault(self.key(group, market, fcst_id), {"flown_until": None, "columns": {}})
+        rows = df
+        if date_column is not None:
+            dates = pd.to_datetime(df[date_column])
+            if entry["flown_until"] is not None:
+                rows = df[(dates > pd.Timestamp(entry["flown_until"])).to_numpy()]
+            if len(rows):
+                as_of = pd.Timestamp(datetime.today() if as_of is None else as_of).normalize()
+                flown = min(dates.max(), as_of - pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+                entry["flown_until"] = flown if entry["flown_until"] is None else max(entry["flown_until"], flown)
+        if len(rows) == 0:
+            return self
+
+        values = rows[columns].to_numpy(dtype=float)
+        new_min, new_max = np.nanmin(values, axis=0), np.nanmax(values, axis=0)
+        for column, low, high in zip(columns, new_min, new_max):
+            if column in entry["columns"]:
+                stored_low, stored_high = entry["columns"][column]
+                low, high = min(low, stored_low), max(high, stored_high)
+            entry["columns"][column] = [float(low), float(high)]
+        return self
+
+    def transform(self, group, market, fcst_id, df, columns):
+        """Scales the columns with the stored min/max (same formula as minmax_scale, constant columns give 0).
+
+        Args:
+            group (string): Feature set the columns belong to
+            market (string): Market, e.g. "ORD-DFW"
+            fcst_id (int): Forecast id
+            df (pd.DataFrame): Rows to scale
+            columns (list): Columns to scale
+
+        Returns:
+            np.ndarray: float64 (rows x columns) scaled values
+
+        Raises:
+            KeyError: if a column was never fit for this market / fcst_id
+        """
+        entry = self.state.get(self.key(group, market, fcst_id), {"columns": {}})
+        missing = [column for column in columns if column not in entry["columns"]]
+        if missing:
+            raise KeyError(f"No scaler state for {self.key(group, market, fcst_id)}: {missing}")
+        bounds = np.array([entry["columns"][column] for column in columns], dtype=float)
+        low, span = bounds[:, 0], bounds[:, 1] - bounds[:, 0]
+        # sklearn's _handle_zeros_in_scale: a constant column is only shifted
+        span[span < 10 * np.finfo(span.dtype).eps] = 1.0
+        return (df[columns].to_numpy(dtype=float) - low) / span
+
+    def fit_transform(self, group, market, fcst_id, df, columns, date_column=None, as_of=None):
+        """update() then transform()."""
+        self.update(group, market, fcst_id, df, columns, date_column, as_of)
+        return self.transform(group, market, fcst_id, df, columns)
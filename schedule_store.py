@@ -0,0 +1,273 @@
+import argparse
+import json
+import os
+import shutil
+from datetime import datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import datasource
+import queries
+
+# ---------- Network-wide OAG / AA capacity store (one bulk extract per day instead of one query per market):
+
+# Hive partitions of every stored pull: departure month ('YYYY-MM') / origin airport
+PARTITIONING = ds.partitioning(pa.schema([("dep_month", pa.string()), ("orig", pa.string())]), flavor="hive")
+
+KINDS = ("oag", "cap")
+
+# Result columns of the "oag" / "cap" statements, in the order of their declared arrow_types
+COLUMNS = {
+    "oag": ["orig", "dest", "dep_date", "dep_mam", "snapshot_date", "airline", "flt_id", "seats", "asm", "asm_y"],
+    "cap": [
+        "orig",
+        "dest",
+        "dep_date",
+        "dep_time",
+        "snapshot_date",
+        "cabin",
+        "airline",
+        "flt_id",
+        "seats",
+        "asm",
+        "rpm",
+        "rev",
+        "pax",
+    ],
+}
+
+
+def file_schema(kind):
+    """Arrow schema every Parquet file of a kind is written with: the declared statement types, without the orig
+    partition column, the dates as the timestamps _normalize parses them to.
+
+    One schema for every file keeps a column that is all null in one chunk from being written (and then read) as
+    the null type.
+    """
+    fields = []
+    for column, alias in zip(COLUMNS[kind], queries.STATEMENTS[kind].arrow_types):
+        if column != "orig":
+            fields.append((column, pa.timestamp("ns") if alias.startswith("date") else pa.type_for_alias(alias)))
+    return pa.schema(fields)
+
+
+def dataset_schema(kind):
+    """file_schema of a kind + the dep_month / orig partition columns."""
+    return pa.schema(list(file_schema(kind)) + list(PARTITIONING.schema))
+
+
+class ScheduleStore:
+    """Parquet store of the OAG_CURR ("oag") and LIFE_OF_FLIGHT_LEG_CABIN ("cap") pulls of the whole network.
+
+    A daily job (extract) runs each query once without any orig/dest filter and writes the rows partitioned by
+    departure month and origin: root/<kind>/dep_month=YYYY-MM/orig=XXX/*.parquet. get_oag_data / get_cap_data then
+    read one market from the store (read), the partition filters skip every other month and origin and the
+    dest / dep_date filters are pushed down to the Parquet row groups.
+
+    Needs pyarrow to be installed.
+    """
+
+    def __init__(self, root):
+        """
+        Args:
+            root (string): Folder of the store
+        """
+        self.root = root
+
+    def path(self, kind):
+        if kind not in KINDS:
+            raise ValueError(f"Unknown schedule kind: {kind}")
+        return os.path.join(self.root, kind)
+
+    def extract(self, kind, pull_start, pull_end, mos=None, cabin="Y", chunksize=500000):
+        """Pulls every market of the network departing in [pull_start, pull_end] and replaces those departures in the store.
+
+        The rows are streamed into a staging folder first, so a failed pull leaves the store untouched.
+
+        Args:
+            kind (string): "oag" or "cap"
+            pull_start (string): Starting bound for the pull date ('YYYY-MM-DD')
+            pull_end (string): Ending bound for the pull date ('YYYY-MM-DD')
+            mos (pyodbc.Connection, optional): mosaic().con(). Defaults to the shared connection of connections.manager.
+            cabin (str, optional): Cabin of the capacity pull (ignored for "oag"). Defaults to 'Y'.
+            chunksize (int, optional): Rows fetched and written at a time. Defaults to 500000.
+
+        Returns:
+            int: number of rows extracted
+        """
+        params = {"start": pull_start, "end": pull_end}
+        if kind == "cap":
+            params["cabin"] = cabin
+        else:
+            cabin = None
+
+        # "_" prefixed folders are ignored by the dataset reader
+        staging = os.path.join(self.path(kind), "_staging")
+        shutil.rmtree(staging, ignore_errors=True)
+        schema = file_schema(kind)
+        rows = 0
+        for i, chunk in enumerate(datasource.read(kind, params, con=mos, chunksize=chunksize)):
+            chunk = _normalize(chunk, schema, kind)
+            for (month, orig), part in chunk.groupby(["dep_month", "orig"], sort=False):
+                folder = os.path.join(staging, f"dep_month={month}", f"orig={orig}")
+                os.makedirs(folder, exist_ok=True)
+                _write(part, schema, os.path.join(folder, f"part-{i:05d}.parquet"))
+            rows += len(chunk)
+
+        self._swap(kind, staging, pull_start, pull_end, cabin)
+        shutil.rmtree(staging, ignore_errors=True)
+        self._write_log(kind, pull_start, pull_end, rows)
+        return rows
+
+    def _swap(self, kind, staging, pull_start, pull_end, cabin):
+        """Moves the staged partitions in, keeping the stored rows the extract does not cover (other days / cabins)."""
+        start, end = pd.Timestamp(pull_start), pd.Timestamp(pull_end)
+        schema = file_schema(kind)
+        for month in pd.period_range(start, end, freq="M").strftime("%Y-%m"):
+            target_month = os.path.join(self.path(kind), f"dep_month={month}")
+            staged_month = os.path.join(staging, f"dep_month={month}")
+            origs = set()
+            for folder in (target_month, staged_month):
+                if os.path.isdir(folder):
+                    origs.update(name for name in os.listdir(folder) if name.startswith("orig="))
+
+            for name in sorted(origs):
+                target = os.path.join(target_month, name)
+                replacement = target + ".new"
+                shutil.rmtree(replacement, ignore_errors=True)
+                os.makedirs(replacement)
+
+                if os.path.isdir(target):
+                    stored = ds.dataset(target, format="parquet", schema=schema).to_table().to_pandas()
+                    replaced = (stored["dep_date"] >= start) & (stored["dep_date"] <= end)
+                    if cabin is not None:
+                        replaced &= stored["cabin"] == cabin
+                    if not replaced.all():
+                        _write(stored[~replaced], schema, os.path.join(replacement, "part-kept.parquet"))
+
+                staged = os.path.join(staged_month, name)
+                if os.path.isdir(staged):
+                    for file_name in os.listdir(staged):
+                        shutil.move(os.path.join(staged, file_name), os.path.join(replacement, file_name))
+
+                shutil.rmtree(target, ignore_errors=True)
+                if os.listdir(replacement):
+                    os.replace(replacement, target)
+                else:
+                    os.rmdir(replacement)
+
+    def _write_log(self, kind, pull_start, pull_end, rows):
+        log = {
+            "start": pull_start,
+            "end": pull_end,
+            "rows": rows,
+            "extracted_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        with open(os.path.join(self.path(kind), "_extract.json"), "w") as f:
+            json.dump(log, f)
+
+    def last_extract(self, kind):
+        """Window, row count and time of the last extract of a kind (None if it was never extracted)."""
+        path = os.path.join(self.path(kind), "_extract.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def read(self, kind, orig=None, dest=None, pull_start=None, pull_end=None, cabin=None):
+        """Rows of the store for one market, in the same shape and order as the live "oag" / "cap" query.
+
+        Args:
+            kind (string): "oag" or "cap"
+            orig (string, optional): Origen Airport Code. Defaults to None (every origin).
+            dest (string, optional): Destination Airport Code. Defaults to None (every destination).
+            pull_start (string, optional): Starting bound for the departure date. Defaults to None.
+            pull_end (string, optional): Ending bound for the departure date. Defaults to None.
+            cabin (str, optional): Cabin of the capacity rows. Defaults to None (every stored cabin).
+
+        Returns:
+            pd.DataFrame: OAG / capacity rows
+        """
+        path = self.path(kind)
+        if not os.path.isdir(path):
+            raise FileNotFoundError(f"No {kind} extract in {self.root}, run ScheduleStore.extract first")
+
+        conditions = []
+        if orig is not None:
+            conditions.append(ds.field("orig") == orig)
+        if dest is not None:
+            conditions.append(ds.field("dest") == dest)
+        if pull_start is not None:
+            conditions.append(ds.field("dep_month") >= pd.Timestamp(pull_start).strftime("%Y-%m"))
+            conditions.append(ds.field("dep_date") >= pd.Timestamp(pull_start))
+        if pull_end is not None:
+            conditions.append(ds.field("dep_month") <= pd.Timestamp(pull_end).strftime("%Y-%m"))
+            conditions.append(ds.field("dep_date") <= pd.Timestamp(pull_end))
+        if cabin is not None:
+            conditions.append(ds.field("cabin") == cabin)
+
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        dataset = ds.dataset(path, format="parquet", partitioning=PARTITIONING, schema=dataset_schema(kind))
+        df = dataset.to_table(filter=expression).to_pandas()
+        columns = ["orig"] + [column for column in df.columns if column not in ("orig", "dep_month")]
+        order_by = datasource.LOGICAL_QUERIES[kind]["order_by"]
+        return df[columns].sort_values(order_by, kind="stable").reset_index(drop=True)
+
+    def oag(self, orig, dest, pull_start, pull_end):
+        return self.read("oag", orig, dest, pull_start, pull_end)
+
+    def cap(self, orig, dest, pull_start, pull_end, cabin="Y"):
+        return self.read("cap", orig, dest, pull_start, pull_end, cabin)
+
+
+def _normalize(df, schema, kind):
+    """Parses the date / time columns of a pulled chunk of a kind (drivers return dates, strings or datetime64) and
+    adds dep_month."""
+    df = df.copy()
+    for column in datasource.LOGICAL_QUERIES[kind]["date_columns"]:
+        df[column] = pd.to_datetime(df[column])
+    for field in schema:
+        if pa.types.is_time(field.type):
+            # the live query returns datetime.time, a replayed one "HH:MM:SS" text: parse the distinct values once
+            codes, values = pd.factorize(df[field.name])
+            parsed = np.array([None] + [v if isinstance(v, time) else time.fromisoformat(str(v)) for v in values])
+            df[field.name] = parsed[codes + 1]
+    df["dep_month"] = df["dep_date"].dt.strftime("%Y-%m")
+    return df
+
+
+def _write(df, schema, path):
+    """Writes the rows of df as a Parquet file with the schema of the store."""
+    table = pa.Table.from_pandas(df[schema.names], schema=schema, preserve_index=False)
+    # without the pandas metadata: its dtypes are the ones inferred for this chunk
+    pq.write_table(table.replace_schema_metadata(), path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Daily network-wide OAG / AA capacity extract")
+    parser.add_argument("root", help="Folder of the store")
+    parser.add_argument("--start", default="2017-09-01", help="First departure date. Defaults to 2017-09-01.")
+    parser.add_argument(
+        "--end",
+        default=(datetime.today() + timedelta(days=365)).strftime("%Y-%m-%d"),
+        help="Last departure date. Defaults to a year from today.",
+    )
+    parser.add_argument("--kinds", nargs="+", default=list(KINDS), choices=KINDS)
+    parser.add_argument("--cabin", default="Y")
+    args = parser.parse_args()
+
+    store = ScheduleStore(args.root)
+    for kind in args.kinds:
+        rows = store.extract(kind, args.start, args.end, cabin=args.cabin)
+        print(f"{kind}: {rows} rows extracted ({args.start} - {args.end})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from connections import manager as default_manager
+from feature_store import market_features
+from market_index import MIN_POINTS
+from pullDate_FullPeriod import pull_data, pull_seas
+from utility import get_cap_data, get_oag_data, get_prdMaps, oag_per_day
+
+# ---------- Concurrent query scheduler (HERCCRT / Mosaic pulls of a market run side by side):
+
+logger = logging.getLogger(__name__)
+
+# Max concurrent queries per database
+DEFAULT_LIMITS = {"herccrt": 4, "mosaic": 2, "azure": 1}
+
+
+def _copy_outcome(source, target):
+    """Copies the result (or exception) of a finished future into another one."""
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+class QueryScheduler:
+    """Runs independent pulls concurrently, with a separate concurrency limit per database.
+
+    Each database gets its own thread pool of `limits[backend]` workers, and every task checks a connection
+    out of the connection manager pool for its duration. Preprocessing steps are chained on the returned
+    futures with then(), so a market takes about as long as its slowest query instead of the sum of all of them.
+    """
+
+    def __init__(self, limits=None, local_workers=2, manager=None):
+        """
+        Args:
+            limits (dict, optional): backend -> max concurrent queries. Defaults to DEFAULT_LIMITS.
+            local_workers (int, optional): Threads for the chained (non database) steps. Defaults to 2.
+            manager (connections.ConnectionManager, optional): Connection pool to use. Defaults to connections.manager.
+        """
+        self.limits = dict(DEFAULT_LIMITS if limits is None else limits)
+        self.manager = default_manager if manager is None else manager
+        self._executors = {
+            backend: ThreadPoolExecutor(max_workers=limit, thread_name_prefix=f"query-{backend}")
+            for backend, limit in self.limits.items()
+        }
+        self._local = ThreadPoolExecutor(max_workers=local_workers, thread_name_prefix="query-local")
+
+    def _run(self, backend, fn, args, kwargs, connection_arg):
+        with self.manager.connection(backend) as con:
+            return fn(*args, **{**kwargs, connection_arg: con})
+
+    def submit(self, backend, fn, *args, connection_arg="con", **kwargs):
+        """Queues fn(*args, **kwargs) on the pool of a database; the pooled connection is passed as `connection_arg`.
+
+        Args:
+            backend (string): "herccrt", "mosaic" or "azure"
+            fn (callable): Pull function, e.g. pull_data or get_oag_data
+            connection_arg (str, optional): Keyword fn takes its connection from (con, hcrt, mos). Defaults to "con".
+
+        Returns:
+            Future: result of fn
+        """
+        if backend not in self._executors:
+            raise ValueError(f"No concurrency limit configured for backend: {backend}")
+        return self._executors[backend].submit(self._run, backend, fn, args, kwargs, connection_arg)
+
+    def local(self, fn, *args, **kwargs):
+        """Queues fn(*args, **kwargs) on the local (non database) pool, e.g. a read from a local store.
+
+        Returns:
+            Future: result of fn
+        """
+        return self._local.submit(fn, *args, **kwargs)
+
+    def then(self, future, fn, *args, backend=None, connection_arg="con", **kwargs):
+        """Runs fn(future.result(), *args, **kwargs) once the future is done.
+
+        Args:
+            future (Future): Upstream pull
+            fn (callable): Step to run on the upstream result, e.g. oag_per_day or pull_seas
+            backend (string, optional): Database fn queries (runs on that pool with a connection). Defaults to None (local step).
+            connection_arg (str, optional): Keyword fn takes its connection from. Defaults to "con".
+
+        Returns:
+            Future: result of fn (or the upstream exception)
+        """
+        chained = Future()
+
+        def _start(done):
+            if done.exception() is not None:
+                chained.set_exception(done.exception())
+                return
+            # an exception raised in a done-callback is only logged by concurrent.futures: pass it on to chained
+            try:
+                if backend is None:
+                    step = self._local.submit(fn, done.result(), *args, **kwargs)
+                else:
+                    step = self.submit(backend, fn, done.result(), *args, connection_arg=connection_arg, **kwargs)
+            except BaseException as exc:
+                chained.set_exception(exc)
+                return
+            step.add_done_callback(lambda finished: _copy_outcome(finished, chained))
+
+        future.add_done_callback(_start)
+        return chained
+
+    def shutdown(self, wait=True):
+        """Stops the worker threads."""
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait)
+        self._local.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+def indexed_fcst_ids(index, orig, dest, fcst_ids, new_market=False, min_points=MIN_POINTS):
+    """The requested fcst_ids of a market worth pulling according to a market index, largest first.
+
+    A whole-market pull (new_market, or the -1 fcst_id pull_data treats the same way) is kept on the total points
+    of the market. fcst_ids the index does not know (e.g. no history when it was built) are not skipped: they
+    are logged and pulled last, and the live pull decides.
+
+    Args:
+        index (market_index.MarketIndex): Index of the markets
+        orig (string): Origen Airport Code
+        dest (string): Destination Airport Code
+        fcst_ids (list): Requested fcst_ids
+        new_market (bool, optional): pull_data pulls the whole market for every fcst_id. Defaults to False.
+        min_points (int, optional): Skip the pulls with fewer points. Defaults to MIN_POINTS.
+
+    Returns:
+        list: fcst_ids to pull
+    """
+    markets = index.markets[(index.markets["orig"] == orig) & (index.markets["dest"] == dest)]
+    size = {
+        fcst_id: (rows, points) for fcst_id, rows, points in zip(markets["fcst_id"], markets["rows"], markets["points"])
+    }
+    market_size = (int(markets["rows"].sum()), int(markets["points"].sum()))
+
+    kept, unknown = [], []
+    for fcst_id in fcst_ids:
+        if new_market or fcst_id == -1:
+            fcst_size = market_size if len(markets) else None
+        else:
+            fcst_size = size.get(fcst_id)
+        if fcst_size is None:
+            unknown.append(fcst_id)
+        elif fcst_size[1] >= min_points:
+            kept.append((fcst_size, fcst_id))
+    if unknown:
+        logger.warning(
+            "%s-%s: fcst_ids %s are not in the market index, pulled without a size check", orig, dest, unknown
+        )
+    return [fcst_id for _, fcst_id in sorted(kept, key=lambda item: item[0], reverse=True)] + unknown
+
+
+def schedule_market(
+    scheduler,
+    orig,
+    dest,
+    fcst_ids,
+    pull_start,
+    pull_end,
+    ulcc_list,
+    new_market=False,
+    with_cap=False,
+    reference=None,
+    store=None,
+    index=None,
+    fcst_id_df=None,
+):
+    """Issues every pull of one market at once (OAG, optional AA capacity, prdMaps and the history + seasonality
+    of each fcst_id) and chains oag_per_day (and the market FeatureStore) on the OAG pull.
+
+    Args:
+        scheduler (QueryScheduler): Scheduler to run the pulls on
+        orig (string): Origen Airport Code
+        dest (string): Destination Airport Code
+        fcst_ids (list): fcst_ids of the market (e.g. get_fcst_given_leg(...)["FCST_ID"])
+        pull_start (string): Starting bound for the OAG/capacity pull date
+        pull_end (string): Ending bound for the OAG/capacity pull date
+        ulcc_list (list): list of ULCC airline codes
+        new_market (bool, optional): Passed to pull_data. Defaults to False.
+        with_cap (bool, optional): Also pull the AA capacity (get_cap_data). Defaults to False.
+        reference (reference_data.ReferenceSnapshot, optional): Serve prdMaps and seasonality from memory. Defaults to None.
+        store (schedule_store.ScheduleStore, optional): Read OAG / capacity from the daily extract (no Mosaic query). Defaults to None.
+        index (market_index.MarketIndex, optional): Skip the fcst_ids too thin to be kept and pull the largest first
+            (see indexed_fcst_ids). Defaults to None.
+        fcst_id_df (pd.DataFrame, optional): Time bands of the market (get_fcst_given_leg); also builds the normalized
+            feature_store.FeatureStore of the market (market_features). Defaults to None.
+
+    Returns:
+        dict: "oag", "oag_per_day", "prdMaps", "cap" (if with_cap), "features" (with fcst_id_df) -> Future, and
+            "history" -> {fcst_id: Future}
+    """
+    if index is not None:
+        fcst_ids = indexed_fcst_ids(index, orig, dest, fcst_ids, new_market)
+
+    futures = {}
+    if store is None:
+        futures["oag"] = scheduler.submit(
+            "mosaic", get_oag_data, orig, dest, pull_start, pull_end, ulcc_list, connection_arg="mos"
+        )
+    else:
+        futures["oag"] = scheduler.local(get_oag_data, orig, dest, pull_start, pull_end, ulcc_list, store=store)
+    futures["oag_per_day"] = scheduler.then(futures["oag"], oag_per_day)
+    if fcst_id_df is not None:
+        futures["features"] = scheduler.then(futures["oag"], market_features, fcst_id_df)
+    if with_cap:
+        if store is None:
+            futures["cap"] = scheduler.submit(
+                "mosaic", get_cap_data, orig, dest, pull_start, pull_end, connection_arg="mos"
+            )
+        else:
+            futures["cap"] = scheduler.local(get_cap_data, orig, dest, pull_start, pull_end, store=store)
+
+    if reference is None:
+        futures["prdMaps"] = scheduler.submit("herccrt", get_prdMaps, orig, dest, connection_arg="hcrt")
+    else:
+        futures["prdMaps"] = Future()
+        futures["prdMaps"].set_result(get_prdMaps(orig, dest, reference=reference))
+
+    futures["history"] = {}
+    for fcst_id in fcst_ids:
+        history = scheduler.submit("herccrt", pull_data, orig, dest, fcst_id, new_market)
+        if reference is None:
+            futures["history"][fcst_id] = scheduler.then(history, pull_seas, orig, dest, backend="herccrt")
+        else:
+            futures["history"][fcst_id] = scheduler.then(history, pull_seas, orig, dest, reference=reference)
+    return futures
@@ -0,0 +1,98 @@
+import pandas as pd
+from pandas.api.types import is_categorical_dtype, is_datetime64_any_dtype
+
+# ---------- Typed schema of the history frames (parsed once at ingestion, kept through the pipeline):
+
+DATE_COLUMNS = ["flightDepartureDate", "forecastDepartureDate", "snapshotDate"]
+
+CODE_COLUMNS = ["origin", "destination", "poolCode", "cabinCode", "localFlowIndicator", "POS"]
+
+SMALL_INT_COLUMNS = {
+    "forecastPeriod": "int8",
+    "forecastDayOfWeek": "int8",
+    "forecastClass": "int8",
+    "forecastId": "int32",
+    "flightId": "int32",
+}
+
+MEASURE_COLUMNS = [
+    "fracClosure",
+    "fracClosureBelow",
+    "trafficCount",
+    "trafficCountAadv",
+    "trafficSum",
+    "avgtraffic",
+    "avgtrafficopenness",
+    "avgrasm",
+    "dowavgtraffic",
+    "dowavgtrafficopenness",
+    "dowavgrasm",
+    "poolrasm",
+]
+# Wide (pivoted) measures: fracClosure_1 .. fracClosure_10, trafficActual_1 .., trafficActualAadv_1 ..
+MEASURE_PREFIXES = ("fracClosure_", "trafficActual_", "trafficActualAadv_")
+MEASURE_DTYPE = "float32"
+
+
+def schema_dtype(column):
+    """dtype of a column in the typed schema ("datetime64[ns]", "category", int8/int32, float32), None if untyped."""
+    if column in DATE_COLUMNS:
+        return "datetime64[ns]"
+    if column in CODE_COLUMNS:
+        return "category"
+    if column in SMALL_INT_COLUMNS:
+        return SMALL_INT_COLUMNS[column]
+    if column in MEASURE_COLUMNS or column.startswith(MEASURE_PREFIXES):
+        return MEASURE_DTYPE
+    return None
+
+
+def _cast(series, dtype):
+    if dtype == "datetime64[ns]":
+        return series if is_datetime64_any_dtype(series) else pd.to_datetime(series, format="%Y-%m-%d")
+    if dtype == "category":
+        return series if is_categorical_dtype(series) else series.astype("category")
+    if dtype.startswith("int") and series.isna().any():
+        # nulls can't be stored in a numpy int column, keep the column as is
+        return series
+    if series.dtype == dtype:
+        return series
+    return series.astype(dtype)
+
+
+def apply_schema(df):
+    """Casts (in place) every column of df that is part of the typed schema.
+
+    Args:
+        df (pd.DataFrame): History frame (raw, aggregated, pivoted or padded)
+
+    Returns:
+        pd.DataFrame: df
+    """
+    for column in df.columns:
+        dtype = schema_dtype(column)
+        if dtype is not None:
+            df[column] = _cast(df[column], dtype)
+    return df
+
+
+def restore_dtypes(df, dtypes):
+    """Casts (in place) the columns of df back to the dtypes they had before a merge/concat/pivot upcast them.
+
+    Categorical columns get their categories recomputed (a concat may have added new codes, e.g. padded rows).
+
+    Args:
+        df (pd.DataFrame): Frame to fix
+        dtypes (pd.Series): column -> dtype, e.g. the .dtypes of the input frame
+
+    Returns:
+        pd.DataFrame: df
+    """
+    for column, dtype in dtypes.items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if is_categorical_dtype(dtype):
+            df[column] = df[column].astype("category")
+        else:
+            df[column] = _cast(df[column], str(dtype))
+    return df
@@ -0,0 +1,161 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from reference_data import DOW_SEASONALITY_COLUMNS, WEEK_SEASONALITY_COLUMNS
+
+# ---------- Week-of-year / day-of-week seasonality computed locally from the history, kept as running sums:
+
+# Bump when the layout of the saved state changes
+STATE_FORMAT = 2
+
+MARKET_KEY = ["origin", "destination", "cabinCode", "localFlowIndicator"]
+
+# update() keeps one watermark per fcst_id of a market, the pipeline folds the history one fcst_id at a time
+WATERMARK_KEY = ["origin", "destination", "cabinCode", "forecastId"]
+
+# Running sums kept per key; every average is sum / count
+SUM_COLUMNS = ["departures", "traffic", "trafficOpenness", "rasm", "rasmDepartures"]
+
+
+def departure_totals(history, rasm=None):
+    """One row per departure of a fcst_id (market, lfi, forecastId, flightDepartureDate) of an aggregate_history frame.
+
+    Args:
+        history (pd.DataFrame): Output of aggregate_history (one row per class / period / fcst_id of a departure)
+        rasm (pd.DataFrame, optional): origin, destination, dep_date, rasm (e.g. aa_cap_fcst of the market). Defaults to None.
+
+    Returns:
+        pd.DataFrame: MARKET_KEY, forecastId, flightDepartureDate, weekNumber, forecastDayOfWeek, traffic (all classes and
+            periods), openness (mean of 1 - fracClosure) and rasm (NaN without a rasm row for the day)
+    """
+    keys = MARKET_KEY + ["forecastId", "flightDepartureDate", "forecastDayOfWeek"]
+    rows = history[keys].astype({column: object for column in MARKET_KEY})
+    rows = rows.assign(
+        traffic=history["trafficSum"].to_numpy(dtype=float),
+        openness=1 - history["fracClosure"].to_numpy(dtype=float),
+    )
+    departures = rows.groupby(keys, sort=True).agg(traffic=("traffic", "sum"), openness=("openness", "mean"))
+    departures = departures.reset_index()
+    departures["flightDepartureDate"] = pd.to_datetime(departures["flightDepartureDate"])
+    # same week as merge_seas assigns (ISO week of forecastDepartureDate, which equals flightDepartureDate)
+    departures.insert(6, "weekNumber", departures["flightDepartureDate"].dt.isocalendar().week.astype("int64"))
+    departures["forecastDayOfWeek"] = departures["forecastDayOfWeek"].astype("int64")
+
+    if rasm is None:
+        departures["rasm"] = np.nan
+        return departures
+    daily = rasm[["origin", "destination", "dep_date", "rasm"]].rename(columns={"dep_date": "flightDepartureDate"})
+    daily = daily.astype({"origin": object, "destination": object})
+    daily["flightDepartureDate"] = pd.to_datetime(daily["flightDepartureDate"])
+    return departures.merge(daily, on=["origin", "destination", "flightDepartureDate"], how="left")
+
+
+class SeasonalityEngine:
+    """KRONOS_WEEK_SEASONALITY / KRONOS_DOW_SEASONALITY rebuilt from the history the pipeline already has.
+
+    Per (origin, destination, cabin, lfi) and week of year (or day of week) the engine keeps running sums over
+    the departed days: number of departures (of a fcst_id), traffic, traffic x openness (1 - fracClosure) and
+    rasm. update() folds only the departures of a fcst_id after the last one it has seen for that fcst_id, so a
+    daily refresh costs O(new days) instead of a rescan of the history, the fcst_ids of a market can be folded
+    one at a time or together, and the averages are sum / count:
+
+        avgtraffic          mean traffic of a departure of a fcst_id (all classes and periods)
+        avgtrafficopenness  mean of traffic x openness
+        avgrasm             mean AA rasm of the departures (needs the rasm rows, NaN otherwise)
+
+    week_seasonality() / dow_seasonality() return the rows with the pull_seas column names, so the engine can
+    stand in for the Oracle tables: pull_seas(df, orig, dest, seasonality=engine).
+    """
+
+    def __init__(self, week=None, dow=None, seen_until=None):
+        """
+        Args:
+            week (pd.DataFrame, optional): Running sums indexed by MARKET_KEY + weekNumber. Defaults to None (empty).
+            dow (pd.DataFrame, optional): Running sums indexed by MARKET_KEY + forecastDayOfWeek. Defaults to None (empty).
+            seen_until (dict, optional): WATERMARK_KEY tuple -> last departure folded in. Defaults to None.
+        """
+        self.week = week if week is not None else _empty_sums("weekNumber")
+        self.dow = dow if dow is not None else _empty_sums("forecastDayOfWeek")
+        self.seen_until = seen_until or {}
+
+    @classmethod
+    def read(cls, path):
+        """Reads a state saved with write()."""
+        saved = pd.read_pickle(path)
+        if saved["format"] != STATE_FORMAT:
+            raise ValueError(f"Seasonality state {path} has format {saved['format']}, expected {STATE_FORMAT}")
+        return cls(saved["week"], saved["dow"], saved["seen_until"])
+
+    def write(self, path):
+        """Saves the running sums to a pickle file."""
+        pd.to_pickle({"format": STATE_FORMAT, "week": self.week, "dow": self.dow, "seen_until": self.seen_until}, path)
+
+    def update(self, history, rasm=None, as_of=None):
+        """Folds the departed days of history that were not seen yet into the running sums.
+
+        Args:
+            history (pd.DataFrame): Output of aggregate_history (any number of markets)
+            rasm (pd.DataFrame, optional): origin, destination, dep_date, rasm of the departures. Defaults to None.
+            as_of (string, optional): 'YYYY-MM-DD', only departures before it have their final traffic. Defaults to today.
+
+        Returns:
+            int: Number of departures folded in
+        """
+        as_of = pd.Timestamp(as_of or datetime.today().date())
+        departures = departure_totals(history, rasm)
+        keys = list(zip(*(departures[column] for column in WATERMARK_KEY)))
+        seen = pd.to_datetime(pd.Series([self.seen_until.get(key) for key in keys], dtype=object))
+        dates = departures["flightDepartureDate"].to_numpy()
+        departures = departures[(dates < as_of.to_datetime64()) & ~(dates <= seen.to_numpy())]
+        if len(departures) == 0:
+            return 0
+
+        has_rasm = departures["rasm"].notna()
+        sums = pd.DataFrame(
+            {
+                "departures": 1.0,
+                "traffic": departures["traffic"],
+                "trafficOpenness": departures["traffic"] * departures["openness"],
+                "rasm": departures["rasm"].where(has_rasm, 0.0),
+                "rasmDepartures": has_rasm.astype(float),
+            }
+        )
+        for name, column in (("week", "weekNumber"), ("dow", "forecastDayOfWeek")):
+            partial = sums.groupby([departures[key] for key in MARKET_KEY + [column]]).sum()
+            setattr(self, name, getattr(self, name).add(partial, fill_value=0).sort_index())
+
+        last = departures.groupby(WATERMARK_KEY)["flightDepartureDate"].max()
+        for key, date in last.items():
+            self.seen_until[key] = max(self.seen_until.get(key, date), date)
+        return len(departures)
+
+    def week_seasonality(self, orig, dest, cabin="Y", lfi=None):
+        """Week-of-year seasonality of a market, same columns as KRONOS_WEEK_SEASONALITY in pull_seas."""
+        return _averages(self.week, orig, dest, cabin, lfi, "", WEEK_SEASONALITY_COLUMNS)
+
+    def dow_seasonality(self, orig, dest, cabin="Y", lfi=None):
+        """Day-of-week seasonality of a market, same columns as KRONOS_DOW_SEASONALITY in pull_seas."""
+        return _averages(self.dow, orig, dest, cabin, lfi, "dow", DOW_SEASONALITY_COLUMNS)
+
+
+def _empty_sums(period_column):
+    index = pd.MultiIndex.from_tuples([], names=MARKET_KEY + [period_column])
+    return pd.DataFrame({column: pd.Series(dtype=float) for column in SUM_COLUMNS}, index=index)
+
+
+def _averages(sums, orig, dest, cabin, lfi, prefix, columns):
+    """Rows of one market of the running sums turned into the averages of the seasonality tables."""
+    rows = sums.reset_index()
+    rows = rows[(rows["origin"] == orig) & (rows["destination"] == dest) & (rows["cabinCode"] == cabin)]
+    if lfi is not None:
+        rows = rows[rows["localFlowIndicator"] == lfi]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        averages = {
+            f"{prefix}avgtraffic": rows["traffic"] / rows["departures"],
+            f"{prefix}avgtrafficopenness": rows["trafficOpenness"] / rows["departures"],
+            f"{prefix}avgrasm": rows["rasm"] / rows["rasmDepartures"].where(rows["rasmDepartures"] > 0),
+        }
+    out = rows.assign(**averages)[columns].reset_index(drop=True)
+    return out.astype({columns[4]: "int64"})
@@ -0,0 +1,269 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas.api.types import is_categorical_dtype
+
+from schema import restore_dtypes
+
+# ---------- Daily snapshots of the pull_data output, stored as deltas against the previous snapshot:
+
+# pull_data rows are unique on its DATA_INDEX, snapshotDate being the only column that changes every day
+SNAPSHOT_KEY = [
+    "origin",
+    "destination",
+    "forecastId",
+    "forecastDepartureDate",
+    "forecastDayOfWeek",
+    "poolCode",
+    "cabinCode",
+    "forecastPeriod",
+    "localFlowIndicator",
+    "flightDepartureDate",
+]
+
+# Marks the rows of a delta that were in the previous snapshot and are gone from this one
+DELETED_COLUMN = "_deleted"
+
+# Snapshot date ('YYYY-MM-DD') of every row of a delta log
+SNAPSHOT_COLUMN = "_snapshot"
+
+# Parquet metadata key of a delta log listing its snapshot dates (a day without changes has no rows)
+DATES_METADATA = b"snapshots"
+
+# Once the delta log since the last full snapshot is this share of its bytes, the next snapshot is written in full
+CHECKPOINT_RATIO = 1.0
+
+
+def _same(a, b):
+    """Element-wise equality of two aligned columns, NaN equal to NaN."""
+    if a.dtype != b.dtype or is_categorical_dtype(a.dtype):
+        a, b = a.astype(object), b.astype(object)
+    a, b = a.to_numpy(), b.to_numpy()
+    equal = a == b
+    missing = pd.isna(a) & pd.isna(b)
+    return np.asarray(equal | missing, dtype=bool)
+
+
+class SnapshotStore:
+    """What pull_data returned on each day, for backtesting ("what did we know on date X") without a fresh pull.
+
+    The first snapshot of a market is written in full; every later one only stores the rows that changed or are
+    new since the previous snapshot, plus a tombstone per row that disappeared. The deltas since the last full
+    snapshot are kept in one log file, rewritten (compacted) on every save, so a day costs its changed rows and
+    not a file. Once the log reaches checkpoint_ratio of the full snapshot's bytes, the snapshot is written in full
+    again (a checkpoint): replaying a date reads one full snapshot and at most about as many bytes of deltas.
+    Files: root/<orig>_<dest>_<fcst_id>/<YYYY-MM-DD>.full.parquet, and <YYYY-MM-DD>.delta.parquet named after the
+    last snapshot of the log.
+
+    A snapshot whose columns differ from the previous one (e.g. a new forecastClass) is written in full again.
+    Needs pyarrow to be installed.
+    """
+
+    def __init__(self, root, checkpoint_ratio=CHECKPOINT_RATIO):
+        """
+        Args:
+            root (string): Folder of the snapshots
+            checkpoint_ratio (float, optional): Delta log bytes, as a share of the last full snapshot, after which a
+                snapshot is written in full. Defaults to CHECKPOINT_RATIO.
+        """
+        self.root = root
+        self.checkpoint_ratio = checkpoint_ratio
+
+    def folder(self, orig, dest, fcst_id):
+        """Folder of the snapshots of a market (fcst_id None: the whole market, as pulled with new_market)."""
+        name = "_".join("all" if part is None else str(part) for part in (orig, dest, fcst_id))
+        return os.path.join(self.root, name)
+
+    def snapshots(self, orig, dest, fcst_id):
+        """Saved snapshots of a market, oldest first.
+
+        Returns:
+            list: (date 'YYYY-MM-DD', "full" or "delta", path) tuples, the deltas of a log share its path
+        """
+        folder = self.folder(orig, dest, fcst_id)
+        if not os.path.isdir(folder):
+            return []
+        saved = []
+        for file_name in os.listdir(folder):
+            parts = file_name.split(".")
+            if len(parts) != 3 or parts[2] != "parquet":
+                continue
+            path = os.path.join(folder, file_name)
+            if parts[1] == "full":
+                saved.append((parts[0], "full", path))
+            elif parts[1] == "delta":
+                saved.extend((date, "delta", path) for date in _log_dates(path))
+        return sorted(saved)
+
+    def save(self, orig, dest, fcst_id, df, snapshot_date=None):
+        """Stores the pull_data output of a market as the snapshot of snapshot_date.
+
+        Saving the same date again replaces that snapshot; dates older than the latest snapshot are rejected.
+
+        Args:
+            orig (string): Origen Airport Code
+            dest (string): Destination Airport Code
+            fcst_id (int): Forecast id the market was pulled with (None for new_market pulls)
+            df (pd.DataFrame): Output of pull_data
+            snapshot_date (string, optional): 'YYYY-MM-DD'. Defaults to the snapshotDate of df (today if df is empty).
+
+        Returns:
+            string: path of the written file
+        """
+        if snapshot_date is None:
+            snapshot_date = pd.Timestamp(df["snapshotDate"].iloc[0]) if len(df) else pd.Timestamp(datetime.today())
+        snapshot_date = pd.Timestamp(snapshot_date).strftime("%Y-%m-%d")
+
+        saved = self.snapshots(orig, dest, fcst_id)
+        if saved and snapshot_date < saved[-1][0]:
+            raise ValueError(f"Snapshot {snapshot_date} is older than the latest one ({saved[-1][0]})")
+        replaced = None
+        if saved and snapshot_date == saved[-1][0]:
+            replaced, saved = saved[-1], saved[:-1]
+            if replaced[1] == "full":
+                os.remove(replaced[2])
+
+        current = df.drop(columns="snapshotDate").reset_index(drop=True)
+        previous = self._replay(saved)
+        full, deltas = _latest_cycle(saved)
+        # a replaced delta is still in the log file
+        log = replaced[2] if replaced is not None and replaced[1] == "delta" else (deltas[-1][2] if deltas else None)
+
+        folder = self.folder(orig, dest, fcst_id)
+        os.makedirs(folder, exist_ok=True)
+        if (
+            previous is None
+            or list(previous.columns) != list(current.columns)
+            or (log is not None and os.path.getsize(log) >= self.checkpoint_ratio * os.path.getsize(full[2]))
+        ):
+            if replaced is not None and replaced[1] == "delta":
+                _write_log(folder, log, [date for date, _, _ in deltas])
+            path = os.path.join(folder, f"{snapshot_date}.full.parquet")
+            current.to_parquet(path, index=False)
+            return path
+
+        delta = _delta(previous, current)
+        delta[SNAPSHOT_COLUMN] = snapshot_date
+        return _write_log(folder, log, [date for date, _, _ in deltas], delta, snapshot_date)
+
+    def as_of(self, orig, dest, fcst_id, date=None):
+        """Rebuilds the pull_data output of a market as it was on a given day.
+
+        Args:
+            orig (string): Origen Airport Code
+            dest (string): Destination Airport Code
+            fcst_id (int): Forecast id the market was pulled with (None for new_market pulls)
+            date (string, optional): 'YYYY-MM-DD', the latest snapshot taken on or before it is returned. Defaults to None (latest).
+
+        Returns:
+            pd.DataFrame: Same columns, dtypes and row order as pull_data returned that day (None if no snapshot)
+        """
+        saved = self.snapshots(orig, dest, fcst_id)
+        if date is not None:
+            date = pd.Timestamp(date).strftime("%Y-%m-%d")
+            saved = [snapshot for snapshot in saved if snapshot[0] <= date]
+        state = self._replay(saved)
+        if state is None:
+            return None
+        state.insert(0, "snapshotDate", pd.Timestamp(saved[-1][0]))
+        return state
+
+    def _replay(self, saved):
+        """State after the last full snapshot of `saved` and the deltas that follow it (None if there is none)."""
+        full, deltas = _latest_cycle(saved)
+        if full is None:
+            return None
+        state = pd.read_parquet(full[2])
+        dtypes = state.dtypes
+        if deltas:
+            log = pd.read_parquet(deltas[-1][2])
+            # the log is in snapshot order: the last row of a key is its state on the last replayed date
+            log = log[(log[SNAPSHOT_COLUMN] <= deltas[-1][0]).to_numpy()]
+            log = log[~log.duplicated(SNAPSHOT_KEY, keep="last").to_numpy()]
+            deleted = log.pop(DELETED_COLUMN)
+            state_codes, log_codes = _key_codes(state, log)
+            state = pd.concat([state[~np.isin(state_codes, log_codes)], log[~deleted.to_numpy()]], ignore_index=True)
+            state = state[list(dtypes.index)]
+        restore_dtypes(state, dtypes)
+        # pull_data returns its rows sorted on DATA_INDEX (multi_index_pivot)
+        return state.sort_values(SNAPSHOT_KEY, kind="stable").reset_index(drop=True)
+
+
+def _latest_cycle(saved):
+    """Last full snapshot of `saved` (None if there is none) and the deltas that follow it."""
+    fulls = [i for i, (_, kind, _) in enumerate(saved) if kind == "full"]
+    if not fulls:
+        return None, []
+    return saved[fulls[-1]], saved[fulls[-1] + 1 :]
+
+
+def _log_dates(path):
+    """Snapshot dates of a delta log."""
+    return json.loads(pq.read_schema(path).metadata[DATES_METADATA])
+
+
+def _write_log(folder, old_path, dates, delta=None, delta_date=None):
+    """Rewrites a delta log with its rows of `dates` plus `delta`, as <last date>.delta.parquet.
+
+    Args:
+        folder (string): Folder of the market
+        old_path (string): Current log (None if there is none), removed once replaced
+        dates (list): Snapshot dates of the current log to keep, oldest first
+        delta (pd.DataFrame, optional): Rows of a new snapshot (SNAPSHOT_COLUMN set). Defaults to None.
+        delta_date (string, optional): 'YYYY-MM-DD' of the new snapshot (with delta). Defaults to None.
+
+    Returns:
+        string: path of the log (None if no date is left)
+    """
+    frames = []
+    if old_path is not None:
+        log = pd.read_parquet(old_path)
+        frames.append(log[log[SNAPSHOT_COLUMN].isin(dates).to_numpy()])
+    if delta is not None:
+        frames.append(delta)
+        dates = dates + [delta_date]
+
+    path = None
+    if dates:
+        log = pd.concat(frames, ignore_index=True)
+        restore_dtypes(log, frames[-1].dtypes)
+        table = pa.Table.from_pandas(log, preserve_index=False)
+        metadata = {**table.schema.metadata, DATES_METADATA: json.dumps(dates).encode()}
+        path = os.path.join(folder, f"{dates[-1]}.delta.parquet")
+        pq.write_table(table.replace_schema_metadata(metadata), path)
+    if old_path is not None and old_path != path:
+        os.remove(old_path)
+    return path
+
+
+def _delta(previous, current):
+    """Rows of current that are new or changed since previous, plus a tombstone per removed row (its last values)."""
+    previous_codes, current_codes = _key_codes(previous, current)
+    # keys are unique within a snapshot: position in previous of every current row, -1 if it is new
+    before = pd.Index(previous_codes).get_indexer(current_codes)
+    common = np.flatnonzero(before >= 0)
+    unchanged = np.zeros(len(current), dtype=bool)
+    unchanged[common] = True
+    for column in current.columns.difference(SNAPSHOT_KEY, sort=False):
+        unchanged[common] &= _same(previous[column].iloc[before[common]], current[column].iloc[common])
+
+    changed = current[~unchanged]
+    tombstones = previous[~np.isin(previous_codes, current_codes)]
+
+    delta = pd.concat(
+        [changed.assign(**{DELETED_COLUMN: False}), tombstones.assign(**{DELETED_COLUMN: True})], ignore_index=True
+    )
+    restore_dtypes(delta, current.dtypes)
+    return delta
+
+
+def _key_codes(*frames):
+    """Integer code of the SNAPSHOT_KEY of every row of each frame, equal codes for equal keys across the frames."""
+    keys = pd.concat([frame[SNAPSHOT_KEY] for frame in frames], ignore_index=True)
+    codes = keys.groupby(SNAPSHOT_KEY, sort=False, observed=True, dropna=False).ngroup().to_numpy()
+    return np.split(codes, np.cumsum([len(frame) for frame in frames[:-1]]))
@@ -0,0 +1,12 @@
+import os
+import sys
+
+import pytest
+from helpers import history_frame
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def history():
+    return history_frame()
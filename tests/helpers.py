@@ -0,0 +1,119 @@
+from datetime import datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+
+# ---------- Synthetic frames shared by the tests:
+
+
+def history_frame(n_days=60, start=None, n_classes=8, drop=0.1, seed=0):
+    """Pivoted history of one market / fcst_id shaped like pull_data's output (before group_and_pad).
+
+    Every departure has its (lfi, period) rows with n_classes fare classes, a random share `drop` of the rows is
+    left out so group_and_pad has to pad them. The week / dow seasonality differs between the F and L rows, as
+    after merge_seas.
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start or (datetime.today() - timedelta(days=n_days // 2)).date())
+    dates = pd.date_range(start, periods=n_days)
+    rows = pd.MultiIndex.from_product([dates, ["F", "L"], range(1, 8)], names=["date", "lfi", "period"]).to_frame(
+        index=False
+    )
+    rows = rows[rng.random(len(rows)) >= drop].reset_index(drop=True)
+
+    df = pd.DataFrame(
+        {
+            "snapshotDate": pd.Timestamp("2026-01-01"),
+            "origin": "ORD",
+            "destination": "DFW",
+            "forecastId": 3,
+            "flightDepartureDate": rows["date"],
+            "forecastDepartureDate": rows["date"],
+            "forecastDayOfWeek": rows["date"].dt.dayofweek + 1,
+            "poolCode": "P1",
+            "cabinCode": "Y",
+            "localFlowIndicator": rows["lfi"],
+            "forecastPeriod": rows["period"],
+        }
+    )
+    for prefix in ("fracClosure_", "trafficActual_", "trafficActualAadv_"):
+        for fare_class in range(1, n_classes + 1):
+            df[f"{prefix}{fare_class}"] = rng.random(len(df))
+
+    # constant within a departure
+    daily = pd.DataFrame(
+        {"holiday": rng.integers(0, 2, n_days), "week_x": rng.random(n_days), "seats_AA_fcst": rng.random(n_days)},
+        index=dates,
+    )
+    df = df.join(daily, on="flightDepartureDate")
+    # per (departure, lfi), as merge_seas joins them
+    is_flow = (df["localFlowIndicator"] == "F").to_numpy()
+    for column in ("avgtraffic", "avgrasm", "dowavgtraffic"):
+        by_date = pd.Series(rng.random(n_days), index=dates).reindex(df["flightDepartureDate"]).to_numpy()
+        df[column] = np.where(is_flow, by_date, 2 * by_date + 1)
+    return df
+
+
+class StaticSource:
+    """datasource source answering every logical query from a fixed frame (a copy, chunked like the live read)."""
+
+    def __init__(self, **frames):
+        self.frames = frames
+
+    def read(self, name, params, con=None, chunksize=None):
+        rows = self.frames[name].copy()
+        if chunksize is None:
+            return rows
+        return (rows.iloc[i : i + chunksize] for i in range(0, max(len(rows), 1), chunksize))
+
+
+def oag_rows(n_flights=3000, start="2026-01-01", n_days=60, seed=0):
+    """Rows of the "oag" query of one market: AA, other and ULCC flights at any minute of the day."""
+    rng = np.random.default_rng(seed)
+    days = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, n_days, n_flights), unit="D")
+    return pd.DataFrame(
+        {
+            "orig": "ORD",
+            "dest": "DFW",
+            "dep_date": days.date,
+            "dep_mam": rng.integers(0, 1440, n_flights),
+            "snapshot_date": days.date,
+            "airline": rng.choice(["AA", "UA", "NK", "F9"], n_flights, p=[0.4, 0.3, 0.2, 0.1]),
+            "flt_id": rng.integers(1, 9999, n_flights),
+            "seats": rng.integers(50, 200, n_flights),
+            "asm": rng.random(n_flights) * 1e5,
+            "asm_y": rng.random(n_flights) * 1e5,
+        }
+    )
+
+
+def fcst_id_frame(bands=((1, 180, 479), (2, 480, 779), (3, 780, 1079), (4, 1080, 1619))):
+    """get_fcst_given_leg output of one market from (fcst_id, TIME_BAND_START, TIME_BAND_END) bands."""
+    return pd.DataFrame(
+        [("ORD", "DFW") + tuple(band) for band in bands],
+        columns=["ORIG", "DEST", "FCST_ID", "TIME_BAND_START", "TIME_BAND_END"],
+    )
+
+
+def cap_rows(n_flights=2000, start="2026-01-01", n_days=60, seed=0):
+    """Rows of the "cap" query of one market: AA flights with a datetime.time dep_time at any minute of the day."""
+    rng = np.random.default_rng(seed)
+    days = pd.Timestamp(start) + pd.to_timedelta(rng.integers(0, n_days, n_flights), unit="D")
+    minutes = rng.integers(0, 1440, n_flights)
+    return pd.DataFrame(
+        {
+            "orig": "ORD",
+            "dest": "DFW",
+            "dep_date": days.date,
+            "dep_time": [time(minute // 60, minute % 60) for minute in minutes],
+            "snapshot_date": (days - pd.Timedelta(days=1)).date,
+            "cabin": "Y",
+            "airline": "AA",
+            "flt_id": rng.integers(1, 9999, n_flights),
+            "seats": rng.integers(50, 200, n_flights),
+            "asm": rng.random(n_flights) * 1e5,
+            "rpm": rng.random(n_flights) * 1e5,
+            "rev": rng.random(n_flights) * 1e4,
+            "pax": rng.integers(0, 200, n_flights),
+        }
+    )
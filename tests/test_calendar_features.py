@@ -0,0 +1,49 @@
+import pandas as pd
+import pytest
+
+from calendar_features import WEEK_COLUMNS, add_cyclic_features, dow_map_x, dow_map_y, wk_map_x, wk_map_y
+from pullDate_FullPeriod import DOW_DAY_NAMES, add_day_columns, add_week_binary, dow_binary, week_of_year_binary
+
+
+@pytest.fixture
+def departures():
+    # 2020-12-28 .. 2021-01-03 is ISO week 53
+    dates = pd.date_range("2020-12-01", "2021-01-20").append(pd.date_range("2026-06-01", periods=10))
+    return pd.DataFrame(
+        {
+            "forecastDepartureDate": dates,
+            "forecastDayOfWeek": dates.dayofweek + 1,
+            "trafficActual": range(len(dates)),
+        }
+    )
+
+
+def test_add_cyclic_features_matches_the_dict_maps(departures):
+    expected = departures.copy()
+    expected["weekNumber"] = [date.isocalendar()[1] for date in expected["forecastDepartureDate"]]
+    expected["week_x"] = expected["weekNumber"].map(wk_map_x)
+    expected["week_y"] = expected["weekNumber"].map(wk_map_y)
+    expected["dow_x"] = expected["forecastDayOfWeek"].map(dow_map_x)
+    expected["dow_y"] = expected["forecastDayOfWeek"].map(dow_map_y)
+
+    assert 53 in set(expected["weekNumber"])
+    pd.testing.assert_frame_equal(add_cyclic_features(departures), expected)
+
+
+def test_one_hot_columns_match_the_row_wise_apply(departures):
+    add_cyclic_features(departures)
+
+    expected = departures.copy()
+    for day_number, day_name in DOW_DAY_NAMES:
+        expected[day_name] = expected.apply(dow_binary, axis=1, args=(day_number, "forecastDayOfWeek"))
+    for week in WEEK_COLUMNS:
+        expected[week] = 0
+    expected = expected.apply(week_of_year_binary, axis=1, args=("weekNumber",))
+
+    add_day_columns(departures, "forecastDayOfWeek")
+    departures = add_week_binary(departures, "weekNumber")
+
+    one_hots = [day_name for _, day_name in DOW_DAY_NAMES] + WEEK_COLUMNS
+    assert list(departures.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(departures[one_hots], expected[one_hots].astype("uint8"))
+    assert departures["week_53"].sum() == 7
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+from helpers import StaticSource, cap_rows, fcst_id_frame, oag_rows
+
+import datasource
+from utility import (
+    aa_cap_fcst,
+    aa_cap_fcst_bands,
+    assign_fcst_bands,
+    get_cap_data,
+    get_oag_data,
+    oag_per_fcst,
+    oag_per_fcst_bands,
+)
+
+DISJOINT = ((1, 180, 479), (2, 480, 779), (3, 780, 1079), (4, 1080, 1619))
+# 3 overlaps 1 and 2, 1 and 2 share minute 600, no flight departs in 4
+OVERLAPPING = ((1, 180, 600), (2, 600, 900), (3, 500, 1619), (4, 2000, 2100))
+
+
+@pytest.fixture(scope="module")
+def oag_df():
+    with datasource.using(StaticSource(oag=oag_rows(n_flights=2000))):
+        return get_oag_data("ORD", "DFW", "2026-01-01", "2026-03-01", ["NK", "F9"])
+
+
+@pytest.fixture(scope="module")
+def cap_df():
+    with datasource.using(StaticSource(cap=cap_rows(n_flights=1000))):
+        return get_cap_data("ORD", "DFW", "2026-01-01", "2026-03-01")
+
+
+def assert_same_per_fcst(got, expected):
+    assert list(got) == list(expected)
+    for fcst_id, frame in expected.items():
+        # same 0..n-1 labels, but pd.merge (oag_per_fcst) gives them as an Int64Index, not a RangeIndex
+        pd.testing.assert_frame_equal(got[fcst_id], frame, check_index_type=False)
+
+
+@pytest.mark.parametrize("bands", [DISJOINT, OVERLAPPING])
+def test_assign_fcst_bands_matches_every_flight_band_pair(bands):
+    dep_mins = np.arange(0, 1700)
+    band_start = [start for _, start, _ in bands]
+    band_end = [end for _, _, end in bands]
+    flights, band = assign_fcst_bands(dep_mins, band_start, band_end)
+
+    expected = {
+        (flight, position)
+        for flight, minute in enumerate(dep_mins)
+        for position, (start, end) in enumerate(zip(band_start, band_end))
+        if start <= minute <= end
+    }
+    assert len(flights) == len(expected)
+    assert set(zip(flights.tolist(), band.tolist())) == expected
+
+
+@pytest.mark.parametrize("bands", [DISJOINT, OVERLAPPING])
+def test_oag_per_fcst_bands_matches_oag_per_fcst(oag_df, bands):
+    fcst_id_df = fcst_id_frame(bands)
+    expected = {fcst_id: oag_per_fcst(oag_df, start, end) for fcst_id, start, end in bands}
+    assert_same_per_fcst(oag_per_fcst_bands(oag_df, fcst_id_df), expected)
+
+
+@pytest.mark.parametrize("bands", [DISJOINT, OVERLAPPING])
+def test_aa_cap_fcst_bands_matches_aa_cap_fcst(cap_df, bands):
+    fcst_id_df = fcst_id_frame(bands)
+    expected = {fcst_id: aa_cap_fcst(cap_df, start, end) for fcst_id, start, end in bands}
+    assert_same_per_fcst(aa_cap_fcst_bands(cap_df, fcst_id_df), expected)
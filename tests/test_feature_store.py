@@ -0,0 +1,48 @@
+import pandas as pd
+import pytest
+from helpers import StaticSource, fcst_id_frame, history_frame, oag_rows
+
+import datasource
+import utility
+from feature_store import FeatureStore, market_features
+
+
+@pytest.fixture
+def oag_df():
+    with datasource.using(StaticSource(oag=oag_rows())):
+        return utility.get_oag_data("ORD", "DFW", "2026-01-01", "2026-03-01", ["NK", "F9"])
+
+
+@pytest.fixture
+def history_df():
+    # a few departures before and after the OAG days: no features there
+    df = history_frame(n_days=70, start="2025-12-28", drop=0.3)
+    # the capacity columns are what the merges add
+    return df.drop(columns="seats_AA_fcst").assign(flightDepartureDate=pd.to_datetime(df["flightDepartureDate"]))
+
+
+def merge_chain(history_df, oag_df, fcst_start, fcst_end, normalize=False):
+    """The per fcst_id merges the notebook loop runs (oag_per_fcst + oag_per_day, then into the history)."""
+    oag_kl = utility.oag_per_fcst(oag_df, fcst_start, fcst_end)
+    total = pd.merge(oag_kl, utility.oag_per_day(oag_df), on="adj_dep_date", how="left", suffixes=("_fcst", "_day"))
+    if normalize:
+        total = utility.normalize_oag_kl_fcst_total(total)
+    return pd.merge(history_df, total, left_on=["flightDepartureDate"], right_on=["adj_dep_date"], how="left")
+
+
+@pytest.mark.parametrize("normalize", [False, True])
+def test_gather_matches_the_merge_chain(oag_df, history_df, normalize):
+    fcst_id_df = fcst_id_frame()
+    store = FeatureStore.build(oag_df, fcst_id_df)
+    if normalize:
+        store = store.normalize()
+    for fcst_id, fcst_start, fcst_end in fcst_id_df[["FCST_ID", "TIME_BAND_START", "TIME_BAND_END"]].values:
+        expected = merge_chain(history_df, oag_df, fcst_start, fcst_end, normalize)
+        pd.testing.assert_frame_equal(store.gather(history_df, fcst_id), expected, check_dtype=False)
+
+
+def test_market_features_is_the_normalized_store(oag_df, history_df):
+    fcst_id_df = fcst_id_frame()
+    store = market_features(oag_df, fcst_id_df)
+    expected = merge_chain(history_df, oag_df, 480, 779, normalize=True)
+    pd.testing.assert_frame_equal(store.gather(history_df, 2), expected, check_dtype=False)
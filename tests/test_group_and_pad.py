@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from helpers import history_frame
+
+import utility
+
+SEASONALITY = ["week_x", "holiday", "avgtraffic", "avgrasm", "dowavgtraffic", "seats_AA_fcst", "forecastDayOfWeek"]
+
+
+@pytest.mark.parametrize("one_dim", [True, False])
+def test_group_table_tensors_match_long_frame(history, one_dim):
+    full = utility.group_and_pad(history.copy())
+    padded, groups = utility.group_and_pad(history.copy(), group_table=True)
+    # some departures have their last (L, period 7) row padded
+    assert (full["real"].to_numpy()[13::14] == 0).any()
+
+    expected = utility.get_tensors2(full, SEASONALITY, None, False, False, True, one_dim, 0)
+    actual = utility.get_tensors2(padded, SEASONALITY, None, False, False, True, one_dim, 0, groups=groups)
+    for expected_tensor, actual_tensor in zip(expected[:3], actual[:3]):
+        np.testing.assert_array_equal(actual_tensor, expected_tensor)
+
+
+def test_group_table_keeps_lfi_seasonality_row_level(history):
+    padded, groups = utility.group_and_pad(history.copy(), group_table=True)
+    assert "avgtraffic" in padded.columns and "avgtraffic" not in groups.columns
+    assert "holiday" in groups.columns and "holiday" not in padded.columns
+
+
+def test_padding_adds_measures_of_missing_fare_classes():
+    df = history_frame(n_classes=8)
+    padded = utility.group_and_pad(df)
+    for prefix in ("fracClosure_", "trafficActual_", "trafficActualAadv_"):
+        assert {f"{prefix}9", f"{prefix}10"} <= set(padded.columns)
+    FC, _, Traffic, _ = utility.get_tensors2(padded, SEASONALITY, None, False, False, True, True, 0)
+    assert FC.shape == Traffic.shape == (len(padded) // 14, 2, 7, 10)
+
+
+def test_group_and_pad_has_no_group_key_column(history):
+    padded = utility.group_and_pad(history.copy())
+    assert "groupKey" not in padded.columns
+    assert "groupKey" not in utility.padding_groups(utility.create_group_id(history), utility.empty_group()).columns
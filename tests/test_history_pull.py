@@ -0,0 +1,138 @@
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import datasource
+import pullDate_FullPeriod
+from pullDate_FullPeriod import (
+    aggregate_history,
+    aggregate_history_chunks,
+    prepare_history,
+    read_history,
+    read_history_aggregated,
+)
+
+RAW_COLUMNS = datasource.LOGICAL_QUERIES["fcst_history"]["columns"]
+
+
+def raw_history(dests=("DFW", "LAX"), fcst_ids=(1, 2), n_days=6, seed=0):
+    """Rows of the "fcst_history" query of ORD: up to two flights and both points of sale per (departure, lfi,
+    period, class), a few null frac closures."""
+    rng = np.random.default_rng(seed)
+    snapshot_date = datetime.today().strftime("%Y-%m-%d")
+    rows = []
+    for dest in dests:
+        for fcst_id in fcst_ids:
+            for day in pd.date_range("2026-01-01", periods=n_days):
+                pool_code = rng.choice(["M", "H1", "HL"])
+                for lfi in ("F", "L"):
+                    for period in range(1, 4):
+                        for fare_class in range(1, 5):
+                            if rng.random() < 0.2:
+                                continue
+                            for flight_id in (100, 200)[: rng.integers(1, 3)]:
+                                for pos in ("D", "I"):
+                                    frac_closure = round(rng.random(), 3) if rng.random() > 0.05 else None
+                                    rows.append(
+                                        [
+                                            day.strftime("%Y-%m-%d"),
+                                            fare_class,
+                                            "Y",
+                                            lfi,
+                                            period,
+                                            frac_closure,
+                                            rng.random(),
+                                            float(rng.integers(0, 5)),
+                                            float(rng.integers(0, 3)),
+                                            pool_code,
+                                            day.dayofweek + 1,
+                                            fcst_id,
+                                            flight_id,
+                                            pos,
+                                            snapshot_date,
+                                            dest,
+                                        ]
+                                    )
+    return pd.DataFrame(rows, columns=RAW_COLUMNS).assign(LEG_ORIG="ORD")
+
+
+# SQLite version of the fcst_history_agg statement (queries.py): TO_CHAR / NVL become date() / IFNULL, and the
+# filters of the live statement are left out, every recorded row passes them
+PUSHDOWN_AGGREGATION = """CREATE TABLE fcst_history_agg AS
+SELECT FLT_DPTR_DATE, FCST_CLS, LCL_FLW_IND, FCST_PERIOD,
+    AVG(FRAC_CLOSURE) FRAC_CLOSURE, AVG(TRAFFIC_SUM) TRAFFIC_SUM, AVG(TRAFFIC_CT_AADV) TRAFFIC_CT_AADV,
+    POOL_CD, DOW, FCST_ID, LEG_DEST, LEG_ORIG
+FROM (
+    SELECT date(FLT_DPTR_DATE) FLT_DPTR_DATE, FCST_CLS, LCL_FLW_IND, FCST_PERIOD,
+        AVG(FRAC_CLOSURE) FRAC_CLOSURE,
+        IFNULL(SUM(TRAFFIC_CT + IFNULL(TRAFFIC_CT_AADV, 0)), 0) TRAFFIC_SUM,
+        IFNULL(SUM(IFNULL(TRAFFIC_CT_AADV, 0)), 0) TRAFFIC_CT_AADV,
+        POOL_CD, DOW, IFNULL(FCST_ID, 0) FCST_ID, FLT_ID, LEG_DEST, LEG_ORIG
+    FROM fcst_history_v
+    GROUP BY date(FLT_DPTR_DATE), FCST_CLS, LCL_FLW_IND, FCST_PERIOD, POOL_CD, DOW, IFNULL(FCST_ID, 0), FLT_ID,
+        LEG_DEST, LEG_ORIG
+)
+GROUP BY FLT_DPTR_DATE, FCST_CLS, LCL_FLW_IND, FCST_PERIOD, POOL_CD, DOW, FCST_ID, LEG_DEST, LEG_ORIG"""
+
+
+@pytest.fixture
+def replay(tmp_path):
+    """LocalSource over a SQLite file holding the recorded fcst_history_v rows of ORD (and their pushdown
+    aggregation)."""
+    path = str(tmp_path / "replay.db")
+    with sqlite3.connect(path) as con:
+        raw_history().to_sql("fcst_history_v", con, index=False)
+        con.execute(PUSHDOWN_AGGREGATION)
+    source = datasource.LocalSource(path)
+    with datasource.using(source):
+        yield source
+    source.close()
+
+
+def pulled(dest, fcst_id):
+    return aggregate_history(prepare_history(read_history("ORD", dest, fcst_id), "ORD"))
+
+
+@pytest.mark.parametrize("batch_rows,chunksize", [(50000, 1), (16, 1), (1, 7), (100, 33), (500, 1000)])
+def test_aggregate_history_chunks_matches_aggregate_history(replay, monkeypatch, batch_rows, chunksize):
+    monkeypatch.setattr(pullDate_FullPeriod, "BATCH_ROWS", batch_rows)
+    expected = pulled("DFW", 1)
+    assert len(expected)
+
+    chunked = aggregate_history_chunks(read_history("ORD", "DFW", 1, chunksize=chunksize), "ORD")
+    pd.testing.assert_frame_equal(chunked, expected)
+
+
+def test_aggregate_history_chunks_of_every_market(replay):
+    expected = pulled(None, None)
+    chunked = aggregate_history_chunks(read_history("ORD", chunksize=250), "ORD")
+    pd.testing.assert_frame_equal(chunked, expected)
+
+
+@pytest.mark.parametrize("chunksize", [1, 1000])
+def test_aggregate_history_chunks_of_an_empty_pull(replay, chunksize):
+    expected = pulled("MIA", 1)
+    assert expected.empty
+
+    chunked = aggregate_history_chunks(read_history("ORD", "MIA", 1, chunksize=chunksize), "ORD")
+    pd.testing.assert_frame_equal(chunked, expected)
+
+
+def test_pull_data_with_chunksize_matches_the_default_pull(replay):
+    expected = pullDate_FullPeriod.pull_data("ORD", "DFW", 2, False)
+    pd.testing.assert_frame_equal(pullDate_FullPeriod.pull_data("ORD", "DFW", 2, False, chunksize=50), expected)
+
+
+@pytest.mark.parametrize("dest,fcst_id", [("DFW", 1), ("LAX", 2), (None, None), ("MIA", 1)])
+def test_read_history_aggregated_matches_aggregate_history(replay, dest, fcst_id):
+    pd.testing.assert_frame_equal(read_history_aggregated("ORD", dest, fcst_id), pulled(dest, fcst_id))
+
+
+@pytest.mark.parametrize("fcst_id,new_market", [(1, False), (-1, False), (2, True)])
+def test_pull_data_with_pushdown_matches_the_default_pull(replay, fcst_id, new_market):
+    expected = pullDate_FullPeriod.pull_data("ORD", "DFW", fcst_id, new_market)
+    pushed_down = pullDate_FullPeriod.pull_data("ORD", "DFW", fcst_id, new_market, pushdown=True)
+    pd.testing.assert_frame_equal(pushed_down, expected)
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from pullDate_FullPeriod import HOLIDAY_POOL_CODES, add_holiday_features, dow_binary
+
+POOL_CODES = ["M", "H1", "M", "HL", None, "H3", "M", np.nan, "X9", "H2", "M", "H1"]
+
+
+def row_wise_holiday_features(df):
+    # the apply based version add_holiday_features replaced
+    df["holiday"] = df.apply(lambda x: 1 if x.poolCode != "M" else 0, axis=1)
+    for code in HOLIDAY_POOL_CODES:
+        df[code] = df.apply(dow_binary, axis=1, args=(code, "poolCode"))
+    return df
+
+
+@pytest.mark.parametrize("dtype", [object, "category"])
+def test_add_holiday_features_matches_row_wise_apply(dtype):
+    # includes missing poolCodes (None / NaN) and a code that is neither M nor a holiday code
+    df = pd.DataFrame({"poolCode": pd.Series(POOL_CODES, dtype=dtype), "trafficActual": np.arange(len(POOL_CODES))})
+    expected = row_wise_holiday_features(df.copy())
+
+    add_holiday_features(df)
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_add_holiday_features_of_regular_departures_only():
+    df = pd.DataFrame({"poolCode": ["M"] * 4})
+    expected = row_wise_holiday_features(df.copy())
+
+    add_holiday_features(df)
+    pd.testing.assert_frame_equal(df, expected)
+    assert not df[["holiday"] + HOLIDAY_POOL_CODES].to_numpy().any()
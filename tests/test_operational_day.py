@@ -0,0 +1,89 @@
+import datetime as dt
+
+import pandas as pd
+import pytest
+from helpers import StaticSource, cap_rows, oag_rows
+
+import datasource
+from utility import get_cap_data, get_oag_data
+
+ULCC_LIST = ["NK", "F9"]
+# around midnight and the 3am cutoff
+EDGE_MINUTES = [0, 1, 59, 179, 180, 181, 1439]
+
+
+@pytest.fixture
+def oag():
+    rows = oag_rows(n_flights=500)
+    rows.loc[: len(EDGE_MINUTES) - 1, "dep_mam"] = EDGE_MINUTES
+    # a departure before 3am on new year's day and on the first of a month belongs to the previous year / month
+    rows.loc[:1, "dep_date"] = [dt.date(2026, 1, 1), dt.date(2026, 2, 1)]
+    return rows
+
+
+@pytest.fixture
+def cap():
+    rows = cap_rows(n_flights=500)
+    rows.loc[: len(EDGE_MINUTES) - 1, "dep_time"] = [dt.time(minute // 60, minute % 60) for minute in EDGE_MINUTES]
+    rows.loc[:1, "dep_date"] = [dt.date(2026, 1, 1), dt.date(2026, 2, 1)]
+    return rows
+
+
+def row_wise_oag(oag_df, ulcc_list):
+    # the list comprehension based transforms of get_oag_data before add_operational_day
+    oag_df["dep_date"] = pd.to_datetime(oag_df["dep_date"], format="%Y/%m/%d")
+    oag_df["dep_mins"] = [val + 24 * 60 if val < 180 else val for val in oag_df["dep_mam"]]
+    oag_df["adj_dep_date"] = [
+        date - dt.timedelta(days=1) if mam < 180 else date for mam, date in zip(oag_df["dep_mam"], oag_df["dep_date"])
+    ]
+    oag_df["yr"] = oag_df["adj_dep_date"].dt.year
+    oag_df["mo"] = oag_df["adj_dep_date"].dt.month
+    oag_df["wk"] = oag_df["adj_dep_date"].dt.isocalendar().week
+    oag_df["ulcc_ind"] = [1 if val in ulcc_list else 0 for val in oag_df["airline"]]
+    oag_df["seats_ulcc"] = [seats if val in ulcc_list else 0 for val, seats in zip(oag_df["airline"], oag_df["seats"])]
+    return oag_df
+
+
+def row_wise_cap(cap_df):
+    # the string parsing / list comprehension based transforms of get_cap_data before add_operational_day
+    cap_df["dep_date"] = pd.to_datetime(cap_df["dep_date"], format="%Y/%m/%d")
+    cap_df["dep_time"] = pd.to_datetime(
+        cap_df["dep_date"].astype(str) + " " + cap_df["dep_time"].astype(str), format="%Y/%m/%d %H:%M:%S"
+    )
+    cap_df["dep_mins"] = pd.DatetimeIndex(cap_df["dep_time"]).hour * 60 + pd.DatetimeIndex(cap_df["dep_time"]).minute
+    cap_df["adj_dep_date"] = [
+        date - dt.timedelta(days=1) if mam < 180 else date for mam, date in zip(cap_df["dep_mins"], cap_df["dep_date"])
+    ]
+    cap_df["dep_mins"] = [val + 24 * 60 if val < 180 else val for val in cap_df["dep_mins"]]
+    cap_df["yr"] = cap_df["adj_dep_date"].dt.year
+    cap_df["mo"] = cap_df["adj_dep_date"].dt.month
+    cap_df["wk"] = cap_df["adj_dep_date"].dt.isocalendar().week
+    return cap_df
+
+
+def test_get_oag_data_matches_the_row_wise_transforms(oag):
+    expected = row_wise_oag(oag.copy(), ULCC_LIST)
+    with datasource.using(StaticSource(oag=oag)):
+        oag_df = get_oag_data("ORD", "DFW", "2026-01-01", "2026-03-01", ULCC_LIST)
+
+    pd.testing.assert_frame_equal(oag_df, expected)
+    assert (oag_df["adj_dep_date"].iloc[:2] == pd.to_datetime(["2025-12-31", "2026-01-31"])).all()
+    assert list(oag_df["dep_mins"].iloc[: len(EDGE_MINUTES)]) == [1440, 1441, 1499, 1619, 180, 181, 1439]
+
+
+def test_get_cap_data_matches_the_row_wise_transforms(cap):
+    expected = row_wise_cap(cap.copy())
+    with datasource.using(StaticSource(cap=cap)):
+        cap_df = get_cap_data("ORD", "DFW", "2026-01-01", "2026-03-01")
+
+    pd.testing.assert_frame_equal(cap_df, expected)
+    assert list(cap_df["dep_mins"].iloc[: len(EDGE_MINUTES)]) == [1440, 1441, 1499, 1619, 180, 181, 1439]
+
+
+def test_get_cap_data_parses_string_dep_times(cap):
+    cap["dep_time"] = cap["dep_time"].astype(str)
+    expected = row_wise_cap(cap.copy())
+    with datasource.using(StaticSource(cap=cap)):
+        cap_df = get_cap_data("ORD", "DFW", "2026-01-01", "2026-03-01")
+
+    pd.testing.assert_frame_equal(cap_df, expected)
@@ -0,0 +1,49 @@
+import threading
+
+import queries
+
+
+class FakeCursor:
+    def __init__(self):
+        self.arraysize = None
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def cursor(self):
+        return FakeCursor()
+
+
+def test_cursor_cache_is_per_thread():
+    con = FakeConnection()
+    statement = queries.STATEMENTS["oag"]
+    sql, _ = statement.render({})
+    main = queries._cursor(con, statement, sql)
+    assert queries._cursor(con, statement, sql) is main
+
+    others = []
+    thread = threading.Thread(target=lambda: others.append(queries._cursor(con, statement, sql)))
+    thread.start()
+    thread.join()
+    assert others[0] is not main
+
+    queries.forget(con)
+    assert main.closed and others[0].closed
+    assert queries._cursor(con, statement, sql) is not main
+    queries.forget(con)
+
+
+def test_record_batch_types_the_fetched_columns():
+    from decimal import Decimal
+
+    import pyarrow as pa
+
+    schema = pa.schema([("FCST_CLS", pa.int64()), ("TRAFFIC_CT", pa.float64()), ("POOL_CD", pa.string())])
+    rows = [(1, Decimal("2.5"), "M"), (None, Decimal("3"), None)]
+    batch = queries._record_batch(rows, schema)
+    assert batch.schema == schema
+    assert batch.to_pydict() == {"FCST_CLS": [1, None], "TRAFFIC_CT": [2.5, 3.0], "POOL_CD": ["M", None]}
+    assert queries._record_batch([], schema).num_rows == 0
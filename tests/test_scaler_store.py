@@ -0,0 +1,27 @@
+import pandas as pd
+
+from scaler_store import ScalerStore
+
+
+def _frame(days, values):
+    return pd.DataFrame({"adj_dep_date": pd.to_datetime(days), "seats": values})
+
+
+def test_update_rescans_departures_not_flown_yet():
+    scalers = ScalerStore()
+    # Observed on 2023-03-01: one flown departure and two scheduled ones
+    first = _frame(["2023-02-28", "2023-03-10", "2023-09-01"], [100.0, 120.0, 150.0])
+    scalers.update("oag", "ORD-DFW", 1, first, ["seats"], date_column="adj_dep_date", as_of="2023-03-01")
+    assert scalers.state["oag|ORD-DFW|1"]["flown_until"] == "2023-02-28"
+
+    # A week later the schedule of the future departures is revised
+    second = _frame(["2023-02-28", "2023-03-10", "2023-09-01"], [100.0, 90.0, 180.0])
+    scalers.update("oag", "ORD-DFW", 1, second, ["seats"], date_column="adj_dep_date", as_of="2023-03-08")
+    assert scalers.state["oag|ORD-DFW|1"]["columns"]["seats"] == [90.0, 180.0]
+    assert scalers.state["oag|ORD-DFW|1"]["flown_until"] == "2023-03-07"
+
+    # Once flown, a departure is not scanned again
+    third = _frame(["2023-02-28", "2023-03-10", "2023-09-01"], [10.0, 90.0, 180.0])
+    scalers.update("oag", "ORD-DFW", 1, third, ["seats"], date_column="adj_dep_date", as_of="2023-03-20")
+    assert scalers.state["oag|ORD-DFW|1"]["flown_until"] == "2023-03-19"
+    assert scalers.state["oag|ORD-DFW|1"]["columns"]["seats"] == [90.0, 180.0]
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+from helpers import cap_rows
+
+import datasource
+from schedule_store import ScheduleStore
+
+
+class FrameSource:
+    """Source serving fixed "oag" (and "cap") rows, filtered on the dep_date window and chunked like the live query."""
+
+    def __init__(self, oag, cap=None):
+        self.oag = oag
+        self.cap = cap
+
+    def read(self, name, params, con=None, chunksize=None):
+        frame = getattr(self, name)
+        dates = pd.to_datetime(frame["dep_date"])
+        rows = frame[(dates >= params["start"]) & (dates <= params["end"])].reset_index(drop=True)
+        return (rows.iloc[i : i + chunksize] for i in range(0, max(len(rows), 1), chunksize))
+
+
+@pytest.fixture
+def source():
+    rng = np.random.default_rng(0)
+    days = pd.date_range("2022-01-01", "2022-02-28")
+    oag = pd.DataFrame(
+        {
+            "orig": np.repeat(["DFW", "ORD"], len(days)),
+            "dest": "MIA",
+            "dep_date": np.tile(days.date, 2),
+            "dep_mam": rng.integers(0, 1440, 2 * len(days)),
+            "snapshot_date": np.tile((days - pd.Timedelta(days=1)).date, 2),
+            "airline": "AA",
+            "flt_id": rng.integers(1, 9999, 2 * len(days)),
+            "seats": rng.integers(50, 200, 2 * len(days)),
+            "asm": rng.random(2 * len(days)) * 1e5,
+            "asm_y": rng.random(2 * len(days)) * 1e5,
+        }
+    )
+    # no asm_y in the first partitions read (DFW): the chunks of those files carry an all-null column
+    oag["asm_y"] = oag["asm_y"].astype(object).where(oag["orig"] != "DFW", None)
+    # capacity rows as a replay returns them: dates and times as text
+    cap = cap_rows(n_flights=200, start="2022-01-01", n_days=59).astype({"dep_date": str, "dep_time": str})
+    cap["snapshot_date"] = cap["snapshot_date"].astype(str)
+    with datasource.using(FrameSource(oag, cap)) as source:
+        yield source
+
+
+def test_all_null_column_in_a_chunk_keeps_the_store_readable(source, tmp_path):
+    store = ScheduleStore(str(tmp_path))
+    assert store.extract("oag", "2022-01-01", "2022-02-28", chunksize=20) == len(source.oag)
+    # a second extract rewrites the kept rows of the overlapping partitions
+    store.extract("oag", "2022-02-01", "2022-02-28", chunksize=20)
+
+    rows = store.read("oag")
+    assert len(rows) == len(source.oag)
+    assert rows["asm_y"].dtype == np.float64
+    assert rows.loc[rows["orig"] == "DFW", "asm_y"].isna().all()
+    assert rows.loc[rows["orig"] == "ORD", "asm_y"].notna().all()
+
+
+def test_capacity_dates_and_times_are_parsed(source, tmp_path):
+    store = ScheduleStore(str(tmp_path))
+    assert store.extract("cap", "2022-01-01", "2022-02-28", chunksize=50) == len(source.cap)
+
+    rows = store.cap("ORD", "DFW", "2022-01-01", "2022-02-28")
+    expected = source.cap.sort_values(["dep_date", "dep_time", "snapshot_date"], kind="stable")
+    assert len(rows) == len(expected)
+    assert rows["snapshot_date"].dtype == "datetime64[ns]"
+    assert (rows["dep_date"].to_numpy() == pd.to_datetime(expected["dep_date"]).to_numpy()).all()
+    assert (rows["snapshot_date"].to_numpy() == pd.to_datetime(expected["snapshot_date"]).to_numpy()).all()
+    assert [t.isoformat() for t in rows["dep_time"]] == list(expected["dep_time"])
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from market_index import MarketIndex
+from scheduler import QueryScheduler, indexed_fcst_ids
+
+
+@pytest.fixture
+def index():
+    return MarketIndex(
+        pd.DataFrame(
+            {
+                "orig": "ORD",
+                "dest": "DFW",
+                "fcst_id": [1, 2, 3],
+                "rows": [900, 2000, 400],
+                "points": [60, 150, 50],
+                "first_departure": pd.Timestamp("2025-01-01"),
+                "last_departure": pd.Timestamp("2026-01-01"),
+            }
+        )
+    )
+
+
+def test_thin_fcst_ids_are_skipped_and_the_largest_pulled_first(index):
+    assert indexed_fcst_ids(index, "ORD", "DFW", [1, 2, 3]) == [2]
+
+
+def test_new_market_is_kept_on_the_market_total(index):
+    # 60 + 150 + 50 points for the whole market: every fcst_id pulls it
+    assert indexed_fcst_ids(index, "ORD", "DFW", [1, 3], new_market=True) == [1, 3]
+    assert indexed_fcst_ids(index, "ORD", "DFW", [-1]) == [-1]
+    assert indexed_fcst_ids(index, "ORD", "DFW", [-1], min_points=300) == []
+
+
+def test_fcst_ids_missing_from_the_index_are_pulled_last(index, caplog):
+    assert indexed_fcst_ids(index, "ORD", "DFW", [7, 2, 1]) == [2, 7]
+    assert indexed_fcst_ids(index, "ORD", "MIA", [-1], new_market=True) == [-1]
+    assert "not in the market index" in caplog.text
+
+
+def test_then_after_shutdown_fails_the_chained_future():
+    scheduler = QueryScheduler(limits={})
+    upstream = scheduler.local(lambda: 1)
+    upstream.result()
+    scheduler.shutdown()
+
+    chained = scheduler.then(upstream, lambda value: value + 1)
+    with pytest.raises(RuntimeError, match="shutdown"):
+        chained.result(timeout=5)
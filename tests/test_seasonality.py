@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from seasonality import SeasonalityEngine
+
+
+def aggregated_history(fcst_ids=(1, 2), n_days=40, seed=0):
+    """aggregate_history-like rows: every fcst_id departs every day, with F and L rows of 3 periods."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2026-01-01", periods=n_days)
+    rows = pd.MultiIndex.from_product(
+        [fcst_ids, dates, ["F", "L"], [1, 2, 3]], names=["forecastId", "flightDepartureDate", "lfi", "period"]
+    ).to_frame(index=False)
+    return pd.DataFrame(
+        {
+            "origin": "ORD",
+            "destination": "DFW",
+            "cabinCode": "Y",
+            "localFlowIndicator": rows["lfi"],
+            "forecastId": rows["forecastId"],
+            "flightDepartureDate": rows["flightDepartureDate"],
+            "forecastDayOfWeek": rows["flightDepartureDate"].dt.dayofweek + 1,
+            "forecastPeriod": rows["period"],
+            "trafficSum": rng.integers(0, 20, len(rows)).astype(float),
+            "fracClosure": rng.random(len(rows)),
+        }
+    )
+
+
+def test_folding_fcst_ids_one_at_a_time_matches_folding_them_together():
+    history = aggregated_history()
+    together = SeasonalityEngine()
+    assert together.update(history, as_of="2027-01-01") == 2 * 40 * 2
+
+    one_at_a_time = SeasonalityEngine()
+    for fcst_id in (1, 2):
+        assert one_at_a_time.update(history[history["forecastId"] == fcst_id], as_of="2027-01-01") == 40 * 2
+
+    for table in ("week_seasonality", "dow_seasonality"):
+        pd.testing.assert_frame_equal(
+            getattr(one_at_a_time, table)("ORD", "DFW"), getattr(together, table)("ORD", "DFW")
+        )
+
+
+def test_update_skips_departures_already_folded():
+    history = aggregated_history(fcst_ids=(1,))
+    engine = SeasonalityEngine()
+    engine.update(history[history["flightDepartureDate"] < "2026-01-21"], as_of="2027-01-01")
+    assert engine.update(history, as_of="2027-01-01") == 20 * 2
+
+    reference = SeasonalityEngine()
+    reference.update(history, as_of="2027-01-01")
+    pd.testing.assert_frame_equal(engine.week_seasonality("ORD", "DFW"), reference.week_seasonality("ORD", "DFW"))
@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pandas as pd
+from helpers import history_frame
+
+from snapshots import SNAPSHOT_KEY, SnapshotStore
+
+
+def daily_pulls(n_days=7, n_departures=30, changes=None, seed=0):
+    """pull_data-like outputs of consecutive days: some traffic changes and the oldest departure drops out.
+
+    With `changes`, the window does not move and only that many random rows get a new traffic value each day.
+    """
+    rng = np.random.default_rng(seed)
+    # sorted like pull_data's output
+    df = history_frame(n_days=n_departures, n_classes=2, drop=0).sort_values(SNAPSHOT_KEY).reset_index(drop=True)
+    for day, snapshot_date in enumerate(pd.date_range("2026-03-01", periods=n_days)):
+        if changes is None:
+            df = df[df["flightDepartureDate"] > df["flightDepartureDate"].min()].reset_index(drop=True)
+            df.loc[day :: 7 + day, "trafficActual_1"] += 1
+        else:
+            df.loc[rng.choice(len(df), changes, replace=False), "trafficActual_1"] += 1
+        yield df.assign(snapshotDate=snapshot_date)
+
+
+def test_as_of_replays_every_day_across_checkpoints(tmp_path):
+    store = SnapshotStore(str(tmp_path), checkpoint_ratio=0.05)
+    pulls = list(daily_pulls())
+    for pull in pulls:
+        store.save("ORD", "DFW", 3, pull)
+
+    saved = store.snapshots("ORD", "DFW", 3)
+    assert [date for date, _, _ in saved] == [pull["snapshotDate"].iloc[0].strftime("%Y-%m-%d") for pull in pulls]
+    assert sum(kind == "full" for _, kind, _ in saved) > 1
+    # one delta log per full snapshot at most
+    assert len(os.listdir(store.folder("ORD", "DFW", 3))) <= 2 * sum(kind == "full" for _, kind, _ in saved)
+    for pull in pulls:
+        date = pull["snapshotDate"].iloc[0].strftime("%Y-%m-%d")
+        pd.testing.assert_frame_equal(store.as_of("ORD", "DFW", 3, date), pull)
+
+
+def test_saving_a_day_again_replaces_its_delta(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    pulls = list(daily_pulls(n_days=3))
+    for pull in pulls:
+        store.save("ORD", "DFW", 3, pull)
+    again = pulls[1].assign(snapshotDate=pulls[2]["snapshotDate"].iloc[0])
+    store.save("ORD", "DFW", 3, again)
+
+    assert [kind for _, kind, _ in store.snapshots("ORD", "DFW", 3)] == ["full", "delta", "delta"]
+    pd.testing.assert_frame_equal(store.as_of("ORD", "DFW", 3), again)
+    pd.testing.assert_frame_equal(store.as_of("ORD", "DFW", 3, "2026-03-02"), pulls[1])
+
+
+def test_year_of_low_churn_days_costs_about_one_full_copy(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    for pull in daily_pulls(n_days=365, n_departures=200, changes=2):
+        store.save("ORD", "DFW", 3, pull)
+
+    saved = store.snapshots("ORD", "DFW", 3)
+    assert [kind for _, kind, _ in saved].count("full") == 1
+    files = {path for _, _, path in saved}
+    full_size = os.path.getsize(saved[0][2])
+    assert sum(os.path.getsize(path) for path in files) < 1.5 * full_size
+    pd.testing.assert_frame_equal(store.as_of("ORD", "DFW", 3), pull)
@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from benchmark_pivot import synthetic_history
+from pullDate_FullPeriod import DATA_INDEX, multi_index_pivot, wide_pivot
+
+VALUES = ["fracClosure", "trafficActual", "trafficActualAadv"]
+
+
+@pytest.fixture
+def history():
+    # a few (departure, lfi, period, class) rows are missing: their cells are NaN in the wide frame
+    return synthetic_history(n_days=30, n_classes=6).set_index(DATA_INDEX)
+
+
+@pytest.mark.parametrize("flatten", [True, False])
+def test_wide_pivot_matches_multi_index_pivot(history, flatten):
+    expected = multi_index_pivot(history, columns="forecastClass", values=VALUES, flatten=flatten)
+    pd.testing.assert_frame_equal(
+        wide_pivot(history, columns="forecastClass", values=VALUES, flatten=flatten), expected
+    )
+
+
+def test_wide_pivot_of_a_single_value_column(history):
+    expected = multi_index_pivot(history, columns="forecastClass", values="trafficActual")
+    pd.testing.assert_frame_equal(wide_pivot(history, columns="forecastClass", values="trafficActual"), expected)
+
+
+def test_wide_pivot_of_shuffled_rows(history):
+    shuffled = history.sample(frac=1, random_state=0)
+    expected = multi_index_pivot(shuffled, columns="forecastClass", values=VALUES, flatten=True)
+    pd.testing.assert_frame_equal(wide_pivot(shuffled, columns="forecastClass", values=VALUES, flatten=True), expected)
+
+
+def test_wide_pivot_rejects_duplicate_cells(history):
+    duplicated = pd.concat([history, history.iloc[:1]])
+    with pytest.raises(ValueError, match="duplicate"):
+        wide_pivot(duplicated, columns="forecastClass", values=VALUES)
@@ -1,4 +1,3 @@
-import datetime as dt
 from collections import defaultdict
 from datetime import datetime, timedelta
 
@@ -6,57 +5,52 @@ import numpy as np
 import pandas as pd
 from sklearn.preprocessing import minmax_scale
 
+import datasource
+from pullDate_FullPeriod import sorted_key_codes
+from reference_data import DOW_SEASONALITY_COLUMNS, WEEK_SEASONALITY_COLUMNS
+from schema import MEASURE_PREFIXES, apply_schema, restore_dtypes
+
 # ---------- Data Pulling (OAG, AA):
 
 
-def find_all_dest_given_leg(orig, hcrt):
+def find_all_dest_given_leg(orig, hcrt=None, reference=None):
     """Finds all destination cities given a orig code:
 
     Args:
         orig (string): Origen Airport Code
-        hcrt (cx_Oracle.Connection): herccrt().con()
+        hcrt (cx_Oracle.Connection, optional): herccrt().con(). Defaults to the shared connection of connections.manager.
+        reference (reference_data.ReferenceSnapshot, optional): Answer from the in-memory snapshot instead of the database. Defaults to None.
 
     Returns:
         list: list of all Destination flying from the given orig
     """
-
-    fcst_id_qry = f"""
-    select Distinct LEG_DEST_S as dest
-    from fcst.fcst_id_ref
-    where LEG_ORIG_S = '{orig}'
-    """
-    fcst_id_df = pd.read_sql_query(fcst_id_qry, con=hcrt)
+    if reference is not None:
+        return reference.destinations(orig)
+    fcst_id_df = datasource.read("fcst_destinations", {"orig": orig}, con=hcrt)
 
     return list(value[0] for value in fcst_id_df.values)
 
 
-def get_fcst_given_leg(orig, dest, hcrt):
+def get_fcst_given_leg(orig, dest, hcrt=None, reference=None):
     """Finds fcst_id and start and end of the fcst time_bounds for a given orig and dest
 
     Args:
         orig (string): Origen Airport Code
         dest (string): Destination Airport Code
-        hcrt (cx_Oracle.Connection): herccrt().con()
+        hcrt (cx_Oracle.Connection, optional): herccrt().con(). Defaults to the shared connection of connections.manager.
+        reference (reference_data.ReferenceSnapshot, optional): Answer from the in-memory snapshot instead of the database. Defaults to None.
 
     Returns:
         _type_: _description_
     """
-
-    fcst_id_qry = f"""
-    select Distinct LEG_ORIG_S as orig, LEG_DEST_S as dest, FCST_ID as fcst_id,
-            TIME_BAND_START as time_band_start, TIME_BAND_END as time_band_end
-    from fcst.fcst_id_ref
-    where 1=1
-    and LEG_ORIG_S = '{orig}'
-    and LEG_DEST_S = '{dest}'
-    order by 1,2,3,4
-    """
-    fcst_id_df = pd.read_sql_query(fcst_id_qry, con=hcrt)
+    if reference is not None:
+        return reference.fcst_ids(orig, dest)
+    fcst_id_df = datasource.read("fcst_ids", {"orig": orig, "dest": dest}, con=hcrt)
 
     return fcst_id_df
 
 
-def get_oag_data(orig, dest, pull_start, pull_end, ulcc_list, mos):
+def get_oag_data(orig, dest, pull_start, pull_end, ulcc_list, mos=None, cache=None, store=None):
     """Data from other airlines (it also includes AA data), showing the their rout and capacity, given dates and destinations.
     Contains the latest publication of scheduled flights.
 
@@ -66,59 +60,46 @@ def get_oag_data(orig, dest, pull_start, pull_end, ulcc_list, mos):
         pull_start (string): Starting bound for the pull date
         pull_end (string): Ending bound for the pull date
         ulcc_list (list): list of ULCC airline codes
-        mos (pyodbc.Connection): mosaic().con()
+        mos (pyodbc.Connection, optional): mosaic().con(). Defaults to the shared connection of connections.manager.
+        cache (history_cache.HistoryCache, optional): Only pulls the departures after the cached high-water mark. Defaults to None.
+        store (schedule_store.ScheduleStore, optional): Read from the daily network-wide extract instead of Mosaic. Defaults to None.
 
     Returns:
         pd.DataFrame: OA flight infos with Unique keys: [orig, dest, dep_data, dep_mam, airline, flt_id]
     """
 
-    oag_qry = f"""
-    select DEP_AIRPRT_IATA_CD as orig,
-            ARVL_AIRPRT_IATA_CD as dest,
-            LOCAL_DEP_DT as dep_date,
-            DEP_MINUTE_PAST_MDNGHT_QTY as dep_mam,
-            FLIGHT_SCHD_PUBLSH_DT as snapshot_date,
-            OPERAT_AIRLN_IATA_CD as airline,
-            OPERAT_FLIGHT_NBR as flt_id, -- Flight Number
-            EQUIP_COACH_CABIN_SEAT_QTY as seats,
-            ASMS_QTY as asm,
-            EQUIP_COACH_CABIN_SEAT_QTY * MILE_GREAT_CIRCLE_DISTANC_QTY as asm_y -- ASM for Coach Cabin
-    from PROD_INDSTR_FLIGHT_SCHD_VW.OAG_CURR
-    where 1=1
-    and DEP_AIRPRT_IATA_CD = '{orig}'
-    and ARVL_AIRPRT_IATA_CD = '{dest}'
-    and LOCAL_DEP_DT between '{pull_start}' and '{pull_end}'
-    -- and LOCAL_DEP_DT = '2022-09-12'
-    -- and OPERAT_AIRLN_IATA_CD = 'AA'
-    and OPERAT_PAX_FLIGHT_IND = 'Y' -- new field that determines if record is a scheduled operating flight record
-    and FLIGHT_OAG_PUBLSH_CD <> 'X' -- record is active and not cancelled
-    order by 1,2,3,4,5
-    """
+    def fetch(start, end):
+        params = {"orig": orig, "dest": dest, "start": start, "end": end}
+        return datasource.read("oag", params, con=mos)
 
-    oag_df = pd.read_sql(oag_qry, con=mos)
+    if store is not None:
+        oag_df = store.oag(orig, dest, pull_start, pull_end)
+    elif cache is None:
+        oag_df = fetch(pull_start, pull_end)
+    else:
+        oag_df = cache.refresh(
+            "oag",
+            (orig, dest, None, None),
+            fetch,
+            "dep_date",
+            pull_start,
+            pull_end,
+        )
 
     # convert to datetime format
     oag_df["dep_date"] = pd.to_datetime(oag_df["dep_date"], format="%Y/%m/%d")
 
-    # convert the dep_time before 3am to the previous dep_date
-    # + Also you have ti change the dep_date for that one as well.
-    oag_df["dep_mins"] = [val + 24 * 60 if val < 180 else val for val in oag_df["dep_mam"]]
-    oag_df["adj_dep_date"] = [
-        date - dt.timedelta(days=1) if mam < 180 else date for mam, date in zip(oag_df["dep_mam"], oag_df["dep_date"])
-    ]
-
-    # add yr, mo, wk cols
-    oag_df["yr"] = oag_df["adj_dep_date"].dt.year
-    oag_df["mo"] = oag_df["adj_dep_date"].dt.month
-    oag_df["wk"] = oag_df["adj_dep_date"].dt.isocalendar().week
+    # convert the dep_time before 3am to the previous dep_date (+ yr, mo, wk cols)
+    add_operational_day(oag_df, oag_df["dep_mam"])
     # add ulcc indicator
-    oag_df["ulcc_ind"] = [1 if val in ulcc_list else 0 for val in oag_df["airline"]]
-    oag_df["seats_ulcc"] = [seats if val in ulcc_list else 0 for val, seats in zip(oag_df["airline"], oag_df["seats"])]
+    is_ulcc = carrier_member(oag_df["airline"], ulcc_list)
+    oag_df["ulcc_ind"] = is_ulcc.astype("int64")
+    oag_df["seats_ulcc"] = np.where(is_ulcc, oag_df["seats"], 0)
 
     return oag_df
 
 
-def get_cap_data(orig, dest, pull_start, pull_end, mos, cabin="Y"):
+def get_cap_data(orig, dest, pull_start, pull_end, mos=None, cabin="Y", cache=None, store=None):
     """AA Capacity per flight in the given dates and destinations.
 
     Args:
@@ -126,61 +107,105 @@ def get_cap_data(orig, dest, pull_start, pull_end, mos, cabin="Y"):
         dest (string): Destination Airport Code
         pull_start (string): Starting bound for the pull date
         pull_end (string): Ending bound for the pull date
-        mos (pyodbc.Connection): mosaic().con()
+        mos (pyodbc.Connection, optional): mosaic().con(). Defaults to the shared connection of connections.manager.
         cabin (str, optional): Flight cabin class. Defaults to 'Y'.
+        cache (history_cache.HistoryCache, optional): Only pulls the departures after the cached high-water mark. Defaults to None.
+        store (schedule_store.ScheduleStore, optional): Read from the daily network-wide extract instead of Mosaic. Defaults to None.
 
     Returns:
         pd.DataFrame: AA Capacity with unique keys: [orig, dest, dep_data, dep_time, snapshot_date, cabin, flt_id]
     """
-    cap_query = f"""
-    select LEG_DEP_AIRPRT_IATA_CD as orig,
-            LEG_ARVL_AIRPRT_IATA_CD as dest,
-            SCHD_LEG_DEP_DT as dep_date,
-            SCHD_LEG_DEP_TM as dep_time,
-            FILE_SNPSHT_DT as snapshot_date,
-            LEG_CABIN_CD as cabin,
-            OPERAT_AIRLN_IATA_CD as airline,
-            MKT_FLIGHT_NBR as flt_id,  --Flight Number
-            CABIN_CAPCTY_SEAT_QTY as seats,
-            CAB_ASM_QTY as asm,
-            CAB_TOT_RPM_QTY as rpm,
-            CAB_TOT_REVNUE_AMT as rev,
-            CAB_TOT_PAX_QTY as pax
-    from PROD_RM_BUSINES_VW.LIFE_OF_FLIGHT_LEG_CABIN
-    where 1=1
-    and FILE_SNPSHT_DT = SCHD_LEG_DEP_DT-1 -- only extract the data one day before departure
-    and LEG_DEP_AIRPRT_IATA_CD = '{orig}'
-    and LEG_ARVL_AIRPRT_IATA_CD = '{dest}'
-    and SCHD_LEG_DEP_DT between '{pull_start}' and '{pull_end}'
-    -- and SCHD_LEG_DEP_DT = '2022-09-12'
-    and LEG_CABIN_CD = '{cabin}'
-    order by 1,2,3,4,5
-    """
 
-    cap_df = pd.read_sql(cap_query, con=mos)
+    def fetch(start, end):
+        params = {"orig": orig, "dest": dest, "cabin": cabin, "start": start, "end": end}
+        return datasource.read("cap", params, con=mos)
+
+    if store is not None:
+        cap_df = store.cap(orig, dest, pull_start, pull_end, cabin)
+    elif cache is None:
+        cap_df = fetch(pull_start, pull_end)
+    else:
+        cap_df = cache.refresh(
+            "cap",
+            (orig, dest, None, cabin),
+            fetch,
+            "dep_date",
+            pull_start,
+            pull_end,
+        )
 
     # convert to datetime format
     cap_df["dep_date"] = pd.to_datetime(cap_df["dep_date"], format="%Y/%m/%d")
-    # cap_df['dep_time'] = pd.to_datetime(cap_df['dep_date']+cap_df['dep_time'], format='%H:%M:%S')
-    cap_df["dep_time"] = pd.to_datetime(
-        cap_df["dep_date"].astype(str) + " " + cap_df["dep_time"].astype(str), format="%Y/%m/%d %H:%M:%S"
+    # dep_time comes back as a time of day ("HH:MM:SS" or datetime.time), at most 1440 distinct ones to parse
+    codes, times = pd.factorize(cap_df["dep_time"])
+    time_of_day = pd.to_timedelta(pd.Index(times).astype(str)).take(codes, fill_value=pd.NaT)
+    cap_df["dep_time"] = cap_df["dep_date"] + time_of_day.to_numpy()
+
+    # count the minutes from mid-night, convert the dep_time before 3am to the previous dep_date (+ yr, mo, wk)
+    add_operational_day(cap_df, cap_df["dep_time"].dt.hour * 60 + cap_df["dep_time"].dt.minute)
+
+    return cap_df
+
+
+# Minutes after midnight before which a departure belongs to the previous operational day (3am)
+OPERATIONAL_DAY_CUTOFF = 180
+
+
+def operational_day(dep_date, dep_mins, cutoff=OPERATIONAL_DAY_CUTOFF):
+    """Operational day of each departure: the departures before `cutoff` minutes after midnight are counted on the
+    previous day, with their minutes continued past midnight (e.g. 01:00 -> 25 * 60).
+
+    Args:
+        dep_date (pd.Series): datetime64 departure dates
+        dep_mins (pd.Series): Departure minutes after midnight
+        cutoff (int, optional): Rollover minute. Defaults to OPERATIONAL_DAY_CUTOFF (3am).
+
+    Returns:
+        pd.DataFrame: dep_mins, adj_dep_date, yr, mo and wk (ISO week) of the operational day, indexed like dep_date
+    """
+    dep_mins = pd.Series(np.asarray(dep_mins), index=dep_date.index)
+    early = (dep_mins < cutoff).to_numpy()
+    adj_dep_date = dep_date - pd.to_timedelta(early.astype("int64"), unit="D")
+    return pd.DataFrame(
+        {
+            "dep_mins": dep_mins.where(~early, dep_mins + 24 * 60),
+            "adj_dep_date": adj_dep_date,
+            "yr": adj_dep_date.dt.year,
+            "mo": adj_dep_date.dt.month,
+            "wk": adj_dep_date.dt.isocalendar().week,
+        }
     )
 
-    # count the minutes from mid-night
-    cap_df["dep_mins"] = pd.DatetimeIndex(cap_df["dep_time"]).hour * 60 + pd.DatetimeIndex(cap_df["dep_time"]).minute
-    # convert the dep_time before 3am to the previous dep_date
-    # + Also you have to adjust the dep_date for that one as well.
-    cap_df["adj_dep_date"] = [
-        date - dt.timedelta(days=1) if mam < 180 else date for mam, date in zip(cap_df["dep_mins"], cap_df["dep_date"])
-    ]
-    cap_df["dep_mins"] = [val + 24 * 60 if val < 180 else val for val in cap_df["dep_mins"]]
 
-    # add yr, mo, wk
-    cap_df["yr"] = cap_df["adj_dep_date"].dt.year
-    cap_df["mo"] = cap_df["adj_dep_date"].dt.month
-    cap_df["wk"] = cap_df["adj_dep_date"].dt.isocalendar().week
+def add_operational_day(df, dep_mins, cutoff=OPERATIONAL_DAY_CUTOFF, date_column="dep_date"):
+    """Adds (in place) the dep_mins, adj_dep_date, yr, mo, wk columns of operational_day to a schedule frame.
 
-    return cap_df
+    Args:
+        df (pd.DataFrame): OAG or capacity rows
+        dep_mins (pd.Series): Departure minutes after midnight of the rows
+        cutoff (int, optional): Rollover minute. Defaults to OPERATIONAL_DAY_CUTOFF (3am).
+        date_column (str, optional): Departure date column. Defaults to "dep_date".
+
+    Returns:
+        pd.DataFrame: df
+    """
+    days = operational_day(df[date_column], dep_mins, cutoff)
+    for column in days.columns:
+        df[column] = days[column]
+    return df
+
+
+def carrier_member(airline, carriers):
+    """Boolean ndarray, True where the airline code is one of `carriers` (isin on the categorical codes).
+
+    Args:
+        airline (pd.Series): Airline codes
+        carriers (list): Carrier set, e.g. ulcc_list
+
+    Returns:
+        np.ndarray: membership of every row
+    """
+    return pd.Series(pd.Categorical(airline)).isin(list(carriers)).to_numpy()
 
 
 # -------------- Data Processing:
@@ -338,11 +363,151 @@ def oag_per_fcst(oag_df, fcst_start, fcst_end):
     return oag_kl
 
 
-def normalize_oag_kl_fcst_total(oag_kl_fcst_total):
+def assign_fcst_bands(dep_mins, band_start, band_end):
+    """Pairs every flight with the fcst_id band(s) whose [start, end] (inclusive) contains its dep_mins.
+
+    The bands are split into layers of non overlapping bands (a single layer for the usual disjoint fcst_ids),
+    each layer is matched with one searchsorted pass, so the cost grows with flights x layers, not flights x bands.
+
+    Args:
+        dep_mins (array-like): Departure minutes of the flights
+        band_start (array-like): TIME_BAND_START of each band
+        band_end (array-like): TIME_BAND_END of each band
+
+    Returns:
+        tuple: (flight positions, band positions) int64 ndarrays, one entry per (flight, band) match
+    """
+    dep_mins = np.asarray(dep_mins, dtype=float)
+    band_start = np.asarray(band_start, dtype=float)
+    band_end = np.asarray(band_end, dtype=float)
+
+    # greedy interval partitioning: a band goes to the first layer whose last band ends before it starts
+    layers, layer_ends = [], []
+    for band in np.argsort(band_start, kind="stable"):
+        for layer, layer_end in enumerate(layer_ends):
+            if band_start[band] > layer_end:
+                layers[layer].append(band)
+                layer_ends[layer] = band_end[band]
+                break
+        else:
+            layers.append([band])
+            layer_ends.append(band_end[band])
+
+    flights, bands = [], []
+    for layer in layers:
+        layer = np.array(layer, dtype=np.int64)
+        candidate = np.searchsorted(band_start[layer], dep_mins, side="right") - 1
+        matched = candidate >= 0
+        matched[matched] = dep_mins[matched] <= band_end[layer[candidate[matched]]]
+        flights.append(np.flatnonzero(matched))
+        bands.append(layer[candidate[matched]])
+    if not flights:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(flights), np.concatenate(bands)
+
+
+def _fcst_bands(fcst_id_df):
+    """(fcst_id, TIME_BAND_START, TIME_BAND_END) rows of get_fcst_given_leg, in order."""
+    return list(fcst_id_df[["FCST_ID", "TIME_BAND_START", "TIME_BAND_END"]].itertuples(index=False, name=None))
+
+
+def oag_per_fcst_bands(oag_df, fcst_id_df):
+    """oag_per_fcst for every fcst_id of a market at once: the flights are assigned to their band in one vectorized
+    step and the AA / all-airline seats, flight counts and ASMs of every (band, adj_dep_date) come from one groupby.
+
+    Args:
+        oag_df (pd.DataFrame): OA/AA flight infos (get_oag_data)
+        fcst_id_df (pd.DataFrame): fcst_ids and time bands of the market (get_fcst_given_leg)
+
+    Returns:
+        dict: fcst_id -> same DataFrame as oag_per_fcst(oag_df, fcst_start, fcst_end)
+    """
+    bands = _fcst_bands(fcst_id_df)
+    flights, band = assign_fcst_bands(oag_df["dep_mins"], [b[1] for b in bands], [b[2] for b in bands])
+
+    def column(name):
+        return oag_df[name].to_numpy()[flights]
+
+    # the AA share of each column is the column masked to the AA flights (summing the masked column skips the rest)
+    is_aa = column("airline") == "AA"
+    has_flt_id = pd.notna(column("flt_id"))
+    flights_in_band = pd.DataFrame(
+        {
+            "band": band,
+            "adj_dep_date": column("adj_dep_date"),
+            "seats": column("seats"),
+            "asm": column("asm_y"),
+            "flt_ct": has_flt_id.astype("int64"),
+            "ulcc_count": column("ulcc_ind"),
+            "seats_ulcc": column("seats_ulcc"),
+            "aa_rows": is_aa.astype("int64"),
+            "seats_AA": column("seats") * is_aa,
+            "asm_AA": column("asm_y") * is_aa,
+            "flt_ct_AA": (has_flt_id & is_aa).astype("int64"),
+        }
+    )
+    totals = flights_in_band.groupby(["band", "adj_dep_date"], sort=True).sum().reset_index()
+    # oag_per_fcst keeps the days with at least one AA flight in the band
+    totals = totals[totals["aa_rows"] > 0]
+
+    result = {}
+    for position, (fcst_id, fcst_start, fcst_end) in enumerate(bands):
+        rows = totals[totals["band"] == position]
+        oag_kl = pd.DataFrame({"adj_dep_date": rows["adj_dep_date"].to_numpy()})
+        oag_kl["fcst_start"] = fcst_start
+        oag_kl["fcst_end"] = fcst_end
+        oag_kl["seats_AA_fcst"] = rows["seats_AA"].to_numpy()
+        oag_kl["seats_OA_fcst"] = (rows["seats"] - rows["seats_AA"] - rows["seats_ulcc"]).to_numpy()
+        oag_kl["seats_ulcc_fcst"] = rows["seats_ulcc"].to_numpy()
+        oag_kl["seats_All_fcst"] = rows["seats"].to_numpy()
+        oag_kl["flt_ct_AA_fcst"] = rows["flt_ct_AA"].to_numpy()
+        oag_kl["flt_ct_OA_fcst"] = (rows["flt_ct"] - rows["flt_ct_AA"] - rows["ulcc_count"]).to_numpy()
+        oag_kl["flt_ct_ulcc_fcst"] = rows["ulcc_count"].to_numpy()
+        oag_kl["flt_ct_All_fcst"] = rows["flt_ct"].to_numpy()
+        oag_kl["asm_AA_fcst"] = rows["asm_AA"].to_numpy()
+        oag_kl["asm_All_fcst"] = rows["asm"].to_numpy()
+        result[fcst_id] = oag_kl
+    return result
+
+
+# Capacity features of a fcst_id band (oag_per_fcst) and of the whole market (oag_per_day)
+OAG_FCST_COLUMNS = [
+    "seats_AA_fcst",
+    "seats_OA_fcst",
+    "seats_ulcc_fcst",
+    "seats_All_fcst",
+    "flt_ct_AA_fcst",
+    "flt_ct_OA_fcst",
+    "flt_ct_ulcc_fcst",
+    "flt_ct_All_fcst",
+    "asm_AA_fcst",
+    "asm_All_fcst",
+]
+OAG_DAY_COLUMNS = [
+    "seats_AA",
+    "seats_OA",
+    "seats_ulcc",
+    "seats_All",
+    "flt_ct_AA",
+    "flt_ct_OA",
+    "flt_ct_ulcc",
+    "flt_ct_All",
+    "asm_AA",
+    "asm_All",
+]
+# AA capacity features kept by merge_oag_aacap (aa_cap_fcst)
+CAP_FEATURE_COLUMNS = ["rpm", "rev", "pax", "rasm", "yield", "load_fac"]
+
+
+def normalize_oag_kl_fcst_total(oag_kl_fcst_total, scalers=None, market=None, fcst_id=None, fit=True):
     """Normalizes the data using min-max scale
 
     Args:
         oag_kl_fcst_total (DataFrame): OAG Data
+        scalers (ScalerStore, optional): Persisted min/max state (scaler_store). Defaults to None (minmax_scale on this frame).
+        market (string, optional): Market of the data, e.g. "ORD-DFW" (with scalers)
+        fcst_id (int, optional): fcst_id of the data (with scalers)
+        fit (bool, optional): Widen the stored min/max with the days not seen yet before scaling; False for scoring. Defaults to True.
 
     Returns:
         DataFrame: Normalized OAG Data
@@ -355,30 +520,14 @@ def normalize_oag_kl_fcst_total(oag_kl_fcst_total):
     # oag_kl_fcst_total.drop(columns=['seats','asm','flt_ct' , 'fcst_start' , 'fcst_end'],inplace=True)
 
     # Normalize Cap features
-    norm_cols = [
-        "seats_AA_fcst",
-        "seats_OA_fcst",
-        "seats_ulcc_fcst",
-        "seats_All_fcst",
-        "flt_ct_AA_fcst",
-        "flt_ct_OA_fcst",
-        "flt_ct_ulcc_fcst",
-        "flt_ct_All_fcst",
-        "asm_AA_fcst",
-        "asm_All_fcst",
-        "seats_AA",
-        "seats_OA",
-        "seats_ulcc",
-        "seats_All",
-        "flt_ct_AA",
-        "flt_ct_OA",
-        "flt_ct_ulcc",
-        "flt_ct_All",
-        "asm_AA",
-        "asm_All",
-    ]
+    norm_cols = OAG_FCST_COLUMNS + OAG_DAY_COLUMNS
 
-    oag_kl_fcst_total[norm_cols] = minmax_scale(oag_kl_fcst_total[norm_cols])
+    if scalers is None:
+        oag_kl_fcst_total[norm_cols] = minmax_scale(oag_kl_fcst_total[norm_cols])
+    else:
+        if fit:
+            scalers.update("oag", market, fcst_id, oag_kl_fcst_total, norm_cols, date_column="adj_dep_date")
+        oag_kl_fcst_total[norm_cols] = scalers.transform("oag", market, fcst_id, oag_kl_fcst_total, norm_cols)
 
     return oag_kl_fcst_total
 
@@ -417,17 +566,52 @@ def aa_cap_fcst(cap_df, fcst_start, fcst_end):
     return cap_kl
 
 
-def merge_oag_aacap(oag_kl, cap_kl):
+def aa_cap_fcst_bands(cap_df, fcst_id_df):
+    """aa_cap_fcst for every fcst_id of a market at once (one band assignment + one groupby, see oag_per_fcst_bands).
+
+    Args:
+        cap_df (DataFrame): AA Cap Data (get_cap_data)
+        fcst_id_df (pd.DataFrame): fcst_ids and time bands of the market (get_fcst_given_leg)
+
+    Returns:
+        dict: fcst_id -> same DataFrame as aa_cap_fcst(cap_df, fcst_start, fcst_end)
+    """
+    bands = _fcst_bands(fcst_id_df)
+    flights, band = assign_fcst_bands(cap_df["dep_mins"], [b[1] for b in bands], [b[2] for b in bands])
+    cap_df2 = cap_df.iloc[flights].assign(band=band)
+
+    agg_cols = {"seats": "sum", "asm": "sum", "flt_id": "count", "rpm": "sum", "rev": "sum", "pax": "sum"}
+    totals = cap_df2.groupby(["band", "dep_date"], sort=True).agg(agg_cols).reset_index()
+    totals.rename(columns={"flt_id": "flt_ct"}, inplace=True)
+
+    # add other Cap features
+    totals["rasm"] = totals["rev"] / totals["asm"]
+    totals["yield"] = totals["rev"] / totals["rpm"]
+    totals["load_fac"] = totals["rpm"] / totals["asm"]
+    totals = totals.replace(np.nan, 0)
+
+    result = {}
+    for position, (fcst_id, _, _) in enumerate(bands):
+        cap_kl = totals[totals["band"] == position].drop(columns="band")
+        result[fcst_id] = cap_kl.reset_index(drop=True)
+    return result
+
+
+def merge_oag_aacap(oag_kl, cap_kl, scalers=None, market=None, fcst_id=None, fit=True):
     """merge both OAG and AA cap on dep_date
     And:
     1. Merge on cap_K1 (so data from OAG when CAP data is None would not be included.)
         Either data is not included because all the flights on that data are canceled (I think)
     2. 'seats','asm','airline','ulcc_ind' from the CAP are dropped (so we use the data gathered from the OAG dataset, which might be less accurate.)
-    3. Data are normalized using minmax_scale
+    3. Data are normalized using minmax_scale (or the persisted min/max of scalers)
 
     Args:
         oag_kl (DtaFrame): OAG DF
         cap_kl (DtaFrame): AA Cap DF
+        scalers (ScalerStore, optional): Persisted min/max state (scaler_store). Defaults to None (minmax_scale on this frame).
+        market (string, optional): Market of the data, e.g. "ORD-DFW" (with scalers)
+        fcst_id (int, optional): fcst_id of the data (with scalers)
+        fit (bool, optional): Widen the stored min/max with the days not seen yet before scaling; False for scoring. Defaults to True.
 
     Returns:
         DtaFrame: _description_
@@ -445,26 +629,14 @@ def merge_oag_aacap(oag_kl, cap_kl):
     oag_cap_kl.drop(columns=["seats", "asm", "flt_ct", "fcst_start", "fcst_end"], inplace=True)
 
     # Normalize Cap features
-    norm_cols = [
-        "rpm",
-        "rev",
-        "pax",
-        "rasm",
-        "yield",
-        "load_fac",
-        "seats_AA_fcst",
-        "seats_OA_fcst",
-        "seats_ulcc_fcst",
-        "seats_All_fcst",
-        "flt_ct_AA_fcst",
-        "flt_ct_OA_fcst",
-        "flt_ct_ulcc_fcst",
-        "flt_ct_All_fcst",
-        "asm_AA_fcst",
-        "asm_All_fcst",
-    ]
+    norm_cols = CAP_FEATURE_COLUMNS + OAG_FCST_COLUMNS
 
-    oag_cap_kl[norm_cols] = minmax_scale(oag_cap_kl[norm_cols])
+    if scalers is None:
+        oag_cap_kl[norm_cols] = minmax_scale(oag_cap_kl[norm_cols])
+    else:
+        if fit:
+            scalers.update("oag_cap", market, fcst_id, oag_cap_kl, norm_cols, date_column="dep_date")
+        oag_cap_kl[norm_cols] = scalers.transform("oag_cap", market, fcst_id, oag_cap_kl, norm_cols)
 
     return oag_cap_kl
 
@@ -472,50 +644,99 @@ def merge_oag_aacap(oag_kl, cap_kl):
 # ----------------  Group and Paddings:
 
 
+# Columns identifying a departure group (14 rows once padded: local/flow x 7 fcst_perd) and a row within it
+GROUP_COLUMNS = [
+    "snapshotDate",
+    "origin",
+    "destination",
+    "forecastId",
+    "flightDepartureDate",
+    "forecastDayOfWeek",
+    "poolCode",
+    "cabinCode",
+]
+PERIOD_COLUMNS = ["localFlowIndicator", "forecastPeriod"]
+# Order of the padded frame: departure groups (forecastDepartureDate first), then lfi and period
+PADDED_ORDER = ["forecastDepartureDate"] + GROUP_COLUMNS[1:]
+
+
+def group_key(df, columns=GROUP_COLUMNS):
+    """Dense int64 key of each row's (columns) tuple, numbered in the order sort_values(columns) puts them.
+
+    Grouping or sorting on the key gives the same groups / order as on the columns (NaN keys aside), without
+    hashing or comparing the string / categorical columns again.
+
+    Args:
+        df (pd.DataFrame): Frame with the key columns
+        columns (list, optional): Key columns. Defaults to GROUP_COLUMNS (PERIOD_COLUMNS for the lfi/period sub-key).
+
+    Returns:
+        np.ndarray: int64 key, 0 .. n_keys - 1, -1 where a key column is missing (groupby drops those rows)
+    """
+    return sorted_key_codes(df, columns, dropna=True)
+
+
+# Bookkeeping columns of the padded frame (one value per row, or recomputed by padding_groups)
+PADDING_COLUMNS = ["real", "groupID", "fullHistory", "groupKey"]
+
+# Seasonality averages merge_seas joins per localFlowIndicator: the F and L rows of a group differ
+LFI_SEASONALITY_COLUMNS = WEEK_SEASONALITY_COLUMNS[5:] + DOW_SEASONALITY_COLUMNS[5:]
+
+
+def is_row_level(column):
+    """True for the columns that change within a departure group: the fare class measures and the per-lfi seasonality."""
+    return (
+        column in PERIOD_COLUMNS
+        or column in PADDING_COLUMNS
+        or column in LFI_SEASONALITY_COLUMNS
+        or column.startswith(MEASURE_PREFIXES)
+    )
+
+
+def split_group_features(df):
+    """Splits df in the row-level frame to pad and a table with one row per departure group.
+
+    Capacity, calendar and holiday columns are the same on every row of a group, so instead of padding and
+    carrying them on all 14 rows they are kept once per group; the tensor builders look them up by groupKey
+    (get_tensors2(..., groups=...)). The week / dow seasonality averages depend on the lfi and stay row-level.
+
+    Args:
+        df (pd.DataFrame): Frame with a groupKey column (see group_key)
+
+    Returns:
+        tuple: (df with the GROUP_COLUMNS, forecastDepartureDate and the row-level columns,
+            group-level table indexed by groupKey, taken from the first row of each group)
+    """
+    keys = df["groupKey"].to_numpy()
+    first_rows = np.flatnonzero(keys >= 0)[np.unique(keys[keys >= 0], return_index=True)[1]]
+    group_columns = [column for column in df.columns if not is_row_level(column)]
+    groups = df.iloc[first_rows][group_columns].set_index(keys[first_rows])
+    groups.index.name = "groupKey"
+
+    keep = GROUP_COLUMNS + ["forecastDepartureDate"]
+    return df[[column for column in df.columns if column in keep or is_row_level(column)]], groups
+
+
 def create_group_id(df):
     """Groups Data in the 14 rows (local/flow, 7 fcst_perd) x 10 cols (frac_closure), adds a REAL token to the DataFrame that already exists.
     Args:
-        df (DataFrame): Given DataFrame Format
+        df (DataFrame): Given DataFrame Format (uses its groupKey column when group_and_pad added one)
 
     Returns:
         DataFrame: Grouped data + real tokens
     """
+    keys = df["groupKey"].to_numpy() if "groupKey" in df.columns else group_key(df)
 
-    df = df.sort_values(
-        [
-            "snapshotDate",
-            "origin",
-            "destination",
-            "forecastId",
-            "flightDepartureDate",
-            "forecastDayOfWeek",
-            "poolCode",
-            "cabinCode",
-            "localFlowIndicator",
-        ]
-    )
+    # stable sort on (group, lfi), rows with a missing key last
+    order = np.lexsort((group_key(df, ["localFlowIndicator"]), np.where(keys < 0, np.iinfo(np.int64).max, keys)))
+    df = df.iloc[order].copy()
+    keys = keys[order]
 
-    # 'GroupBy.cumcount': Number each item in each group from 0 to (the length of that group - 1).
-    # '== 0' returns True or False
-    # '.astype(int)' ,convert True/False to 1/0
-    df["groupID"] = (
-        df.groupby(
-            [
-                "snapshotDate",
-                "origin",
-                "destination",
-                "forecastId",
-                "flightDepartureDate",
-                "forecastDayOfWeek",
-                "poolCode",
-                "cabinCode",
-            ]
-        ).cumcount()
-        == 0
-    ).astype(int)
-    # assign each unique group a new group id
-    # groupID==1 will be a new id (+1), groupID==0 will indicate the same id for the same group
-    df["groupID"] = df["groupID"].cumsum()
+    # assign each group an id 1, 2, .. in group order (0: rows with a missing key, dropped by padding_groups)
+    valid = keys >= 0
+    group_id = np.zeros(len(df), dtype=np.int64)
+    group_id[valid] = np.unique(keys[valid], return_inverse=True)[1] + 1
+    df["groupID"] = group_id
 
     # Full History Pre Fixing
     # count the num of 'forecastPeriod' in each group
@@ -633,134 +854,95 @@ def empty_group_future():
     return fullKeys
 
 
-def padding_groups(df, fullKeys):
-    """This function loops through the data, and replaces any missing values with the "Fake Data". (Fake Data is data that has 0 (-1) as traffic)
+def padding_groups(df, fullKeys, group_table=False):
+    """This function replaces any missing values with the "Fake Data". (Fake Data is data that has 0 (-1) as traffic)
     It finds the time-periods (the 14 periods for each day) that are missing and populates the "fake Data" for them.
 
+    The missing (group, lfi, period) keys of all the groups are found at once on a groups x 14 presence matrix, the
+    padding rows are taken from fullKeys in one go and forward filled within their group, so every padding row
+    carries the fullKeys values and the group-constant columns of the group's last row.
+
     Args:
         df (DataFrame): _description_
         fullKeys (DataFrame): The empty Group (output of either empty_group or empty_group_future)
+        group_table (bool, optional): df is a split_group_features frame, only pad its row-level columns. Defaults to False.
 
     Returns:
         DataFrame: DataFrame after populating it with "Fake Data" and group them based on departure day (where each day has 14 rows (7 Time periods * 2 Local/Flow))
     """
 
-    groupbyColumns = [
-        "snapshotDate",
-        "origin",
-        "destination",
-        "forecastId",
-        "flightDepartureDate",
-        "forecastDayOfWeek",
-        "poolCode",
-        "cabinCode",
-    ]
-    grouped = df.groupby(groupbyColumns)
-
-    merged_list = []
-    count_rows_misskey = 0
-    for g in grouped:
-
-        # g[0] is the directory key and g[1] is the value (actual data)
-        # identify the cells of g[1] that not in fullKeys
-        # g[1][~g[1].isin(fullKeys)]
-
-        # identify the missing keys in g[1]
-        key = g[1][["localFlowIndicator", "forecastPeriod"]]
-        missingKeys = fullKeys[
-            ~fullKeys[["localFlowIndicator", "forecastPeriod"]].apply(tuple, 1).isin(key.apply(tuple, 1))
-        ]
-        count_rows_misskey += missingKeys.shape[0]
-
-        # append the missing keys under the data
-        fullHistory = pd.concat([g[1], missingKeys])
-
-        # use 0 to indicate padding data
-        fullHistory["real"].fillna(0, inplace=True)
-
-        # fill the data with missing keys
-        fullHistory = fullHistory.fillna(method="ffill")
-        merged_list.append(fullHistory)
-
-    # merge all data across 'flightDepartureDate'
-    out = pd.concat(merged_list)
-    out = out.sort_values(
-        [
-            "snapshotDate",
-            "origin",
-            "destination",
-            "forecastId",
-            "flightDepartureDate",
-            "forecastDayOfWeek",
-            "poolCode",
-            "cabinCode",
-            "localFlowIndicator",
-        ]
-    )
-
-    # Get full history and then concat fake history (padding) from above
-    post = out.copy()
-    post = post.sort_values(
-        [
-            "snapshotDate",
-            "origin",
-            "destination",
-            "forecastId",
-            "flightDepartureDate",
-            "forecastDayOfWeek",
-            "poolCode",
-            "cabinCode",
-            "localFlowIndicator",
-        ]
+    own_key = "groupKey" not in df.columns
+    if own_key:
+        df = df.assign(groupKey=group_key(df))
+    # rows with a missing key column are dropped, as by a groupby on the key columns
+    real = df[df["groupKey"].to_numpy() >= 0]
+    # every fullKeys column is padded (measures of fare classes df has no data for come out as padding values),
+    # a split_group_features frame leaves the group-level ones to its table
+    template = fullKeys[[column for column in fullKeys.columns if is_row_level(column)]] if group_table else fullKeys
+
+    # fullKeys slot (0..13) of the (lfi, period) of every row, -1 if it is not one of them
+    slots = pd.MultiIndex.from_arrays(
+        [template["localFlowIndicator"].astype(object), template["forecastPeriod"].astype(float)]
     )
-
-    post["groupID"] = (
-        post.groupby(
-            [
-                "snapshotDate",
-                "origin",
-                "destination",
-                "forecastId",
-                "flightDepartureDate",
-                "forecastDayOfWeek",
-                "poolCode",
-                "cabinCode",
-            ]
-        ).cumcount()
-        == 0
-    ).astype(int)
-    post["groupID"] = post["groupID"].cumsum()
-    # Full Hisotyr Pre Fixing
-    post["fullHistory"] = post.groupby(["groupID"])["forecastPeriod"].transform("count")
-
-    post["flightDepartureDate"] = pd.to_datetime(post["flightDepartureDate"], format="%Y/%m/%d")
-
-    post = post.sort_values(
-        [
-            "forecastDepartureDate",
-            "origin",
-            "destination",
-            "forecastId",
-            "flightDepartureDate",
-            "forecastDayOfWeek",
-            "poolCode",
-            "cabinCode",
-            "localFlowIndicator",
-            "forecastPeriod",
-        ]
+    row_slots = slots.get_indexer(
+        pd.MultiIndex.from_arrays([real["localFlowIndicator"].astype(object), real["forecastPeriod"].astype(float)])
     )
-    return post
 
-
-def group_and_pad(df):
+    # groups x slots presence matrix: its empty cells are the missing keys, in group then fullKeys order
+    _, row_groups = np.unique(real["groupKey"].to_numpy(), return_inverse=True)
+    present = np.zeros((row_groups.max() + 1 if len(row_groups) else 0, len(template)), dtype=bool)
+    known = row_slots >= 0
+    present[row_groups[known], row_slots[known]] = True
+    pad_groups, pad_slots = np.nonzero(~present)
+
+    # every group: its rows (df order), then its missing keys
+    out = pd.concat([real, template.iloc[pad_slots]])
+    out_groups = np.concatenate([row_groups, pad_groups])
+    order = np.argsort(out_groups, kind="stable")
+    out, out_groups = out.iloc[order], out_groups[order]
+
+    # use 0 to indicate padding data
+    out["real"] = out["real"].fillna(0)
+
+    # fill the data with missing keys (forward, within the group)
+    out = out.groupby(out_groups).ffill()
+
+    # one stable sort on (group, lfi)
+    order = np.lexsort((group_key(out, ["localFlowIndicator"]), out_groups))
+    post = out.iloc[order].copy()
+
+    group_ids = out_groups[order]
+    post["groupID"] = group_ids + 1
+    # Full Hisotyr Pre Fixing: count the forecastPeriod of each group
+    counts = np.bincount(group_ids, weights=post["forecastPeriod"].notna().to_numpy(), minlength=len(present))
+    post["fullHistory"] = counts.astype(np.int64)[group_ids]
+
+    # concat with the (untyped) padding rows upcasts the typed columns, cast them back
+    restore_dtypes(post, df.dtypes)
+    apply_schema(post)
+
+    # forecastDepartureDate is constant within a group: rank the groups on PADDED_ORDER once (one row each),
+    # then sort the rows on (group rank, lfi, period), ties kept in (group, lfi) order like a stable sort_values
+    group_ids = post["groupID"].to_numpy() - 1
+    first_rows = np.unique(group_ids, return_index=True)[1]
+    group_rank = group_key(post.iloc[first_rows], PADDED_ORDER)
+    post = post.iloc[np.lexsort((group_key(post, PERIOD_COLUMNS), group_rank[group_ids]))]
+    return post.drop(columns="groupKey") if own_key else post
+
+
+def group_and_pad(df, group_table=False):
     """This function calls all the above functions.
     Also use the Date-time today, to use the empty_group_future for any future data.
 
     Args:
         df (DataFrame): DataFrame with all the data.
+        group_table (bool, optional): Only pad the row-level columns and return the group-level ones as a separate
+            table (split_group_features). Defaults to False.
 
     Returns:
         DataFrame: Grouped and padded DataGFrame with "True" and "Fake" Date
+            (group_table=True: tuple of that frame, with a groupKey column, and the group-level table indexed by
+            groupKey)
     """
 
     yesterday = (datetime.today() - timedelta(days=2)).strftime("%Y-%m-%d")
@@ -768,20 +950,27 @@ def group_and_pad(df):
     fullKeys = empty_group()
     fullKeysfuture = empty_group_future()
 
-    # Divide DF in past and Future:
-    df["flightDepartureDate"] = pd.to_datetime(df["flightDepartureDate"], format="%Y/%m/%d")
+    # Divide DF in past and Future (flightDepartureDate is only parsed if it is not datetime64 yet):
+    apply_schema(df)
+    # one int64 key per departure group, shared by every groupby / sort of create_group_id and padding_groups
+    df = df.assign(groupKey=group_key(df))
+    if group_table:
+        df, groups = split_group_features(df)
 
     df_past = df[df["flightDepartureDate"] <= yesterday]
     df_future = df[df["flightDepartureDate"] >= yesterday]
 
     if len(df_future) > 10:
-        df_future = padding_groups(create_group_id(df_future), fullKeysfuture)
-        df_past = padding_groups(create_group_id(df_past), fullKeys)
-        df = pd.concat([df_past, df_future])
+        df_future = padding_groups(create_group_id(df_future), fullKeysfuture, group_table)
+        df_past = padding_groups(create_group_id(df_past), fullKeys, group_table)
+        dtypes = df.dtypes
+        df = restore_dtypes(pd.concat([df_past, df_future]), dtypes)
     else:
-        df = padding_groups(create_group_id(df), fullKeys)
+        df = padding_groups(create_group_id(df), fullKeys, group_table)
 
-    return df
+    if group_table:
+        return df, groups
+    return df.drop(columns="groupKey")
 
 
 # ----------------   Tensor Masking - Processing: TILL HERE
@@ -863,6 +1052,36 @@ def tf_timeseries_masking(tf_tensors, data_index, prdMaps, window):
     return test_tensors[data_index + 1 - window : data_index + 1]
 
 
+def group_seasonality(DataFarame, groups, sea_col_Cap):
+    """Seasonality columns of every row of a padded group_and_pad(..., group_table=True) frame.
+
+    Row-level columns (the per-lfi seasonality) are read from DataFarame, the group-level ones from the table by
+    groupKey. Padding rows carry the empty_group value (0) of the group-level columns empty_group has, as they do
+    in the padded long frame, so the result equals DataFarame[sea_col_Cap] of group_and_pad(df).
+
+    Args:
+        DataFarame (pd.DataFrame): Padded row-level frame (14 rows per departure, with groupKey)
+        groups (pd.DataFrame): Group-level table indexed by groupKey
+        sea_col_Cap (list): Seasonality columns
+
+    Returns:
+        np.ndarray: float32 (rows x sea_col_Cap) seasonality
+    """
+    rows = groups.index.get_indexer(DataFarame["groupKey"].to_numpy())
+    padded = DataFarame["real"].to_numpy() == 0
+    padding_columns = set(empty_group().columns)
+
+    Seasenality = np.empty((len(DataFarame), len(sea_col_Cap)), dtype="float32")
+    for position, column in enumerate(sea_col_Cap):
+        if column in DataFarame.columns:
+            Seasenality[:, position] = np.asarray(DataFarame[column]).astype("float32")
+            continue
+        Seasenality[:, position] = np.asarray(groups[column]).astype("float32")[rows]
+        if column in padding_columns:
+            Seasenality[padded, position] = 0
+    return Seasenality
+
+
 def get_tensors2(
     DataFarame,
     sea_col_Cap,
@@ -873,6 +1092,7 @@ def get_tensors2(
     seasenality_one_dimension=True,
     window=10,
     DOW=False,
+    groups=None,
 ):
     """Given a DataFrame, this function will transfer the dataframe into tensors of processed data.
 
@@ -886,6 +1106,7 @@ def get_tensors2(
         seasenality_one_dimension (bool, optional): Reshape the data into one dimension. Defaults to True.
         window (int, optional): window size for our time-series. Defaults to 10.
         DOW (bool, optional): Whether we are processing DOW timeseries or daily. Defaults to False.
+        groups (pd.DataFrame, optional): Group-level table (group_and_pad(..., group_table=True)) to read sea_col_Cap from. Defaults to None (from DataFarame).
 
     Returns:
         FC (np.tensor): FairClousre Data Tensor. with shape of (data_size, channel, Time_classes, Fair_classes) if FC_time_series = True, shape will be: (data_size, window , channel, Time_classes, Fair_classes)
@@ -898,16 +1119,20 @@ def get_tensors2(
 
     # fractional closure
     PRE_FC_L = DataFarame[["fracClosure_" + str(i + 1) for i in range(10)]].values.astype("float32")
-    # seasonality
-    PRE_Sea_L = DataFarame[sea_col_Cap].values.astype("float32")
     # actual traffic
     PRE_Traf_L = DataFarame[["trafficActual_" + str(i + 1) for i in range(10)]].values.astype("float32")
 
     # reshape the data for CNNLSTM model
     FC = PRE_FC_L.reshape(int(PRE_FC_L.shape[0] / 14), 1, 14, 10)
-    Seasenality = PRE_Sea_L.reshape(int(PRE_Sea_L.shape[0] / 14), 1, 14, len_sea_cap)
     Traffic = PRE_Traf_L.reshape(int(PRE_Traf_L.shape[0] / 14), 1, 14, 10)
 
+    # seasonality
+    if groups is not None:
+        PRE_Sea_L = group_seasonality(DataFarame, groups, sea_col_Cap)
+    else:
+        PRE_Sea_L = DataFarame[sea_col_Cap].values.astype("float32")
+    Seasenality = PRE_Sea_L.reshape(int(PRE_Sea_L.shape[0] / 14), 1, 14, len_sea_cap)
+
     # Remove Duplicates (from 2d to 1d vector)
     if seasenality_one_dimension:
         Seasenality = np.delete(Seasenality, slice(13), 2).reshape(Seasenality.shape[0], len_sea_cap)
@@ -1041,34 +1266,22 @@ def tf_timeseries_masking_DOW(tf_tensors, data_index, prdMaps, window):
     return test_tensors[data_index + 1 - window : data_index + 1]
 
 
-def get_prdMaps(orig, dest, hcrt):
+def get_prdMaps(orig, dest, hcrt=None, reference=None):
     """It will find the time-period bounds for a given flight.
     TODO: add the lcl_flw_ind and change the data to mask the difference between the local and Flow Traffic
 
     Args:
         orig (string): Origen Airport Code
         dest (string): Destination Airport Code
-        hcrt (cx_Oracle.Connection): herccrt().con()
+        hcrt (cx_Oracle.Connection, optional): herccrt().con(). Defaults to the shared connection of connections.manager.
+        reference (reference_data.ReferenceSnapshot, optional): Answer from the in-memory snapshot instead of the database. Defaults to None.
 
     Returns:
         DataFrame: DF of time periods with timeperiod ID and given daily bounds when each closes.
     """
-
-    prdMaps = pd.read_sql(
-        f"""select DISTINCT leg_orig as origin, leg_dest as destination, fcst_period as forecastPeriod, rrd_band_start_i as rrd_start, rrd_band_end_i as rrd_end
-                            -- , lcl_flw_ind
-                            from market_xref a
-                            join FCST.FCST_PERIOD_REF b
-                            on a.infl_period_id = b.FCST_PERIOD_ID
-                            where 1=1
-                            and cabin_code = 'Y'
-                            and leg_orig = '{orig}'
-                            and leg_dest = '{dest}'
-                            and lcl_flw_ind = 'L'
-                            ORDER BY forecastPeriod
-                            """,
-        con=hcrt,
-    )
+    if reference is not None:
+        return reference.prd_maps(orig, dest)
+    prdMaps = datasource.read("prd_maps", {"orig": orig, "dest": dest, "cabin": "Y", "lfi": "L"}, con=hcrt)
     return prdMaps
 
 
@@ -1119,6 +1332,7 @@ def dow_get_tensors2(
     window=10,
     random_masking=True,
     test_today=None,
+    groups=None,
 ):
     """Given a DataFrame, this function will transfer the dataframe into tensors of processed data.
 
@@ -1133,6 +1347,7 @@ def dow_get_tensors2(
         window (int, optional): window size for our time-series. Defaults to 10.
         random_masking (bool, optional): If random masking is true, for each datapoint we assign a "day to departure" randomly, and mask the data based on that. If False we use test_today as our "fake today" and assign the maskings accordingly. Defaults to True.
         test_today (string, optional): If the random_masking is False we should define "fake today", and based on this fake today we'll mask our data. Defaults to None.
+        groups (pd.DataFrame, optional): Group-level table (group_and_pad(..., group_table=True)) to read sea_col_Cap from. Defaults to None (from DataFarame).
 
     Returns:
         FC (np.tensor): FairClousre Data Tensor. with shape of (data_size, channel, Time_classes, Fair_classes) if FC_time_series = True, shape will be: (data_size, window , channel, Time_classes, Fair_classes)
@@ -1165,11 +1380,12 @@ def dow_get_tensors2(
                 seasenality_one_dimension,
                 window,
                 DOW,
+                groups,
             )
         else:
             Data_dow_masked = masked_df[filter_dow]
             FC, Seasenality, Traffic, TF_time = get_tensors2_faketoday(
-                Data_dow, Data_dow_masked, sea_col_Cap, use_channels, seasenality_one_dimension, window
+                Data_dow, Data_dow_masked, sea_col_Cap, use_channels, seasenality_one_dimension, window, groups
             )
 
         # FC, Seasenality, Traffic, TF_time= get_tensors2_faketoday(Data_dow, Data_dow_masked ,  sea_col_Cap , use_channels , seasenality_one_dimension ,  window)
@@ -1229,7 +1445,13 @@ def create_masking_based_on_given_day(DataFrame, test_today, prdMaps):
 
 
 def get_tensors2_faketoday(
-    DataFarame, DataFarame_Masked, sea_col_Cap, use_channels=True, seasenality_one_dimension=True, window=10
+    DataFarame,
+    DataFarame_Masked,
+    sea_col_Cap,
+    use_channels=True,
+    seasenality_one_dimension=True,
+    window=10,
+    groups=None,
 ):
     """This function uses a masked dataframe. (it is used when we want to set a fake_today for our test set)
 
@@ -1240,6 +1462,7 @@ def get_tensors2_faketoday(
         use_channels (bool, optional): If it is true, it makes our data into 3d tensors by adding traffic flow/local into another dimension. Defaults to True.
         seasenality_one_dimension (bool, optional): Reshape the data into one dimension. Defaults to True.
         window (int, optional): window size for our time-series. Defaults to 10.
+        groups (pd.DataFrame, optional): Group-level table (group_and_pad(..., group_table=True)) to read sea_col_Cap from. Defaults to None (from DataFarame).
 
     Returns:
         FC (np. tensor): FairClousre Data Tensor. with shape of (data_size, channel, Time_classes, Fair_classes) if FC_time_series = True, shape will be: (data_size, window , channel, Time_classes, Fair_classes)
@@ -1251,8 +1474,6 @@ def get_tensors2_faketoday(
 
     # fractional closure
     PRE_FC_L = DataFarame[["fracClosure_" + str(i + 1) for i in range(10)]].values.astype("float32")
-    # seasonality
-    PRE_Sea_L = DataFarame[sea_col_Cap].values.astype("float32")
     # actual traffic
     PRE_Traf_L = DataFarame[["trafficActual_" + str(i + 1) for i in range(10)]].values.astype("float32")
     # Masked Traffic
@@ -1260,10 +1481,16 @@ def get_tensors2_faketoday(
 
     # reshape the data for CNNLSTM model
     FC = PRE_FC_L.reshape(int(PRE_FC_L.shape[0] / 14), 1, 14, 10)
-    Seasenality = PRE_Sea_L.reshape(int(PRE_Sea_L.shape[0] / 14), 1, 14, len_sea_cap)
     Traffic = PRE_Traf_L.reshape(int(PRE_Traf_L.shape[0] / 14), 1, 14, 10)
     Traffic_Masked = PRE_Traf_L_Masked.reshape(int(PRE_Traf_L_Masked.shape[0] / 14), 1, 14, 10)
 
+    # seasonality
+    if groups is not None:
+        PRE_Sea_L = group_seasonality(DataFarame, groups, sea_col_Cap)
+    else:
+        PRE_Sea_L = DataFarame[sea_col_Cap].values.astype("float32")
+    Seasenality = PRE_Sea_L.reshape(int(PRE_Sea_L.shape[0] / 14), 1, 14, len_sea_cap)
+
     # Remove Duplicates (from 2d to 1d vector)
     if seasenality_one_dimension:
         Seasenality = np.delete(Seasenality, slice(13), 2).reshape(Seasenality.shape[0], len_sea_cap)
@@ -1305,6 +1532,7 @@ def get_train_test_samples2(
     window=10,
     test_random_masking=True,
     test_today=None,
+    groups=None,
 ):
     """Given the POST, PRE and FUTURE dataframes this function process them using all the above functions to get the corresponding tensors.
     It returns data as train, val, test, with each having Traffic, Fair-closure, Seasonality, and Traffic time-series data.
@@ -1341,6 +1569,7 @@ def get_train_test_samples2(
             use_channels=use_channels,
             seasenality_one_dimension=seasenality_one_dimension,
             window=window,
+            groups=groups,
             random_masking=True,
             test_today=None,
         )
@@ -1353,6 +1582,7 @@ def get_train_test_samples2(
             use_channels=use_channels,
             seasenality_one_dimension=seasenality_one_dimension,
             window=window,
+            groups=groups,
             random_masking=test_random_masking,
             test_today=test_today,
         )
@@ -1368,6 +1598,7 @@ def get_train_test_samples2(
             use_channels=use_channels,
             seasenality_one_dimension=seasenality_one_dimension,
             window=window,
+            groups=groups,
         )
 
         if test_random_masking:
@@ -1380,11 +1611,12 @@ def get_train_test_samples2(
                 use_channels=use_channels,
                 seasenality_one_dimension=seasenality_one_dimension,
                 window=window,
+                groups=groups,
             )
         else:
             masked_df = create_masking_based_on_given_day(Data_POST, test_today, prdMaps)
             POST_FC, POST_Seas, POST_Traf, POST_TF_timeseries = get_tensors2_faketoday(
-                Data_POST, masked_df, sea_col_Cap, use_channels, seasenality_one_dimension, window
+                Data_POST, masked_df, sea_col_Cap, use_channels, seasenality_one_dimension, window, groups
             )
 
         # FUTURE_FC , FUTURE_Seas , FUTURE_Traf , FUTURE_TF_timeseries = get_tensors2(Data_FUTURE, sea_col_Cap, prdMaps , FC_time_series = False , traffic_time_series = True ,  use_channels = True , seasenality_one_dimension = True ,   window = window)